@@ -0,0 +1,62 @@
+'''
+Title: Business Days
+Created: 10/17/2026
+
+Description: Works out the business days the routes are planned for. Weekends
+and any holidays given are skipped, so a run on a Friday plans Monday and a
+run before a holiday plans the day after it. Dates are datetime.date
+objects.
+'''
+from datetime import date, datetime, timedelta
+
+
+class BusinessCalendar:
+    """Calendar of working days. weekend holds the isoweekday numbers of the
+    days off (6 and 7 for Saturday and Sunday) and holidays the dates of any
+    other days off."""
+    def __init__(self, holidays=None, weekend=(6, 7)):
+        """Sets up the calendar with an optional list of holiday dates"""
+        self.holidays = set(holidays or [])
+        self.weekend = set(weekend)
+
+    def isBusinessDay(self, day):
+        """Returns True if the day is not a weekend day or a holiday"""
+        return day.isoweekday() not in self.weekend and day not in self.holidays
+
+    def nextBusinessDay(self, day=None):
+        """Returns the first business day after the day, which defaults to
+        today."""
+        day = (day or date.today()) + timedelta(days=1)
+        while not self.isBusinessDay(day):
+            day += timedelta(days=1)
+        return day
+
+    def businessDays(self, count, day=None):
+        """Returns the next count business days after the day, which defaults
+        to today."""
+        days = []
+        for index in range(count):
+            day = self.nextBusinessDay(day)
+            days.append(day)
+        return days
+
+
+def parseDates(text):
+    """Returns the dates in a semicolon separated list of dates written as
+    YYYY-MM-DD or MM/DD/YYYY."""
+    dates = []
+    for value in text.split(";"):
+        value = value.strip()
+        if value:
+            dates.append(parseDate(value))
+    return dates
+
+
+def parseDate(value):
+    """Returns the date of a YYYY-MM-DD or MM/DD/YYYY string"""
+    for date_format in ("%Y-%m-%d", "%m/%d/%Y"):
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError("Unable to read the date {0}. Use YYYY-MM-DD.".format(value))
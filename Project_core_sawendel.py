@@ -29,244 +29,563 @@ produce a user friendly information for the employee to follow.
 # Import modules, requests module is non-standard and must be installed,
 # see readme.txt
 import arcpy
-import os, sys, zipfile, traceback, time
+import os, sys, zipfile, traceback, time, tempfile, shutil, csv, itertools
 import requests, socket, json
-import VRPS
-from datetime import date
-
-def calculateNextDay():
-    """Calculates the next date to use for the next day's orders"""
-    today = date.today()
-    dayofweek = today.isoweekday()
-    added_days = {5:3, 6:2}
-    if dayofweek in added_days:
-        day_gap = added_days[dayofweek]
-        while day_gap > 0:
-            try:
-                today = today.replace(day=today.day + 1)
-                day_gap -= 1
-            except ValueError:
-                today = today.replace(month=today.month + 1, day=1)
-                day_gap -= 1
-    else:
-        try:
-            today = today.replace(day=today.day + 1)
-        except ValueError:
-            today = today.replace(month=today.month + 1, day=1)
+import VRPS, RouteStops, RouteSummary, BusinessDays, Shards
 
-
-    tom_format = today.strftime("%m_%d_%Y")
+def calculateNextDay(calendar=None):
+    """Calculates the next date to use for the next day's orders, skipping
+    weekends and the holidays of the calendar."""
+    calendar = calendar or BusinessDays.BusinessCalendar()
+    tom_format = calendar.nextBusinessDay().strftime("%m_%d_%Y")
     return tom_format
 
-# Environmental Variables
-arcpy.env.overwriteOutput = True
-
-# User Parameters and variable setup
-ND = arcpy.GetParameterAsText(0)
-time_impedance = arcpy.GetParameterAsText(1)
-timeUnits = arcpy.GetParameterAsText(2)
-inspection_orders = arcpy.GetParameterAsText(3)
-depots = arcpy.GetParameterAsText(4)
-routestable = arcpy.GetParameterAsText(5)
-outputfolder = arcpy.GetParameterAsText(6)
-templatemap = arcpy.GetParameterAsText(7)
-username = arcpy.GetParameterAsText(8)
-password = arcpy.GetParameterAsText(9)
-
-# Generated inital variables
-output_lyr = os.path.join(outputfolder, "vpr_layer.lyr")
-mxd = arcpy.mapping.MapDocument(templatemap)
-df = arcpy.mapping.ListDataFrames(mxd)[0]
-directions = os.path.join(outputfolder, "directions.txt")
-date = calculateNextDay()
-
-# Setup AGOL access
-hostname = "http://" + socket.getfqdn()
-
-try:
-    token_params ={'username': username,
-                   'password': password,
-                   'referer': hostname,
-                   'f':'json'}
-    token_response= requests.post("https://www.arcgis.com/sharing/generateToken",\
-                            params=token_params)
-    token_status = json.loads(token_response.text)
-    token = token_status['token']
-    arcpy.AddMessage("\nToken generated for AGOL.")
-except:
-    tb = sys.exc_info()[2]
-    tbinfo = traceback.format_tb(tb)[0]
-    msg = "Traceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
+def getOptionalParameter(index, default):
+    """Returns the text of an optional tool parameter or the default value when
+    the parameter is not set."""
     try:
-        token_status
-        if 'error' in token_status:
-            code = token_status['error']['code']
-            msg = token_status['error']['message']
-            details = token_status['error']['details'][0]
-            arcpy.AddError("Failed to generate token.")
-            arcpy.AddError("Error {0}: {1} {2}".format(code, msg, details))
-            print "Error {0}: {1} {2}".format(code, msg, details)
-            sys.exit()
+        value = arcpy.GetParameterAsText(index)
     except:
-        arcpy.AddError("Failed to generate token.")
-        arcpy.AddError(msg)
-        print msg
-    sys.exit()
+        value = ""
+    if value == "":
+        return default
+    return value
+
+def hasField(table, field_name):
+    """Returns True if the table has a field of that name."""
+    return field_name.upper() in [field.name.upper() for field in arcpy.ListFields(table)]
+
+def readScenarios(scenario_table, calendar, orders, depots, routestable, outputfolder):
+    """Reads the scenarios of a batch run from a CSV table with name, date,
+    orders, routes and depots columns. Empty cells use the tool's orders,
+    routes and depots, and an empty date is the business day after the
+    scenario before it. Relative paths are read from the table's folder.
+    Each scenario writes to its own folder in the output folder. Returns a
+    list of scenario dictionaries."""
+    table_folder = os.path.dirname(os.path.abspath(scenario_table))
+    read = open(scenario_table, "rb")
+    rows = [row for row in csv.DictReader(read)]
+    read.close()
+    scenarios = []
+    day = None
+    for index, row in enumerate(rows):
+        row = dict([(key.strip().lower(), (value or "").strip()) for key, value in row.items() if key])
+        if row.get('date'):
+            day = BusinessDays.parseDate(row['date'])
+        else:
+            day = calendar.nextBusinessDay(day)
+        date = day.strftime("%m_%d_%Y")
+        name = row.get('name') or "scenario_{0}_{1}".format(index + 1, date)
+        paths = {}
+        for key, default in (('orders', orders), ('routes', routestable), ('depots', depots)):
+            paths[key] = default
+            if row.get(key):
+                paths[key] = os.path.join(table_folder, row[key])
+        scenarios.append({'name': name, 'date': date, 'orders': paths['orders'],
+                          'routes': paths['routes'], 'depots': paths['depots'],
+                          'folder': os.path.join(outputfolder, name)})
+    return scenarios
+
+def solveScenario(vprLayer, subLayerNames, mxd, df, scenario):
+    """Loads a scenario's orders, depots and routes into the VRP layer made
+    during setup, replacing those of the scenario before, solves it, saves
+    its layer file and directions and adds the solution to the map. Returns
+    the layers added to the map and a dictionary of the solution's
+    sublayers by name, or None if the solve failed."""
+    output_lyr = os.path.join(scenario['folder'], "vpr_layer.lyr")
+    try:
+        # Add Orders
+        arcpy.AddMessage("\tAdding Orders...")
+        arcpy.na.AddLocations(vprLayer, subLayerNames["Orders"], scenario['orders'], \
+                              append="CLEAR")
+
+        # Add Depots
+        arcpy.AddMessage("\tAdding Depots...")
+        arcpy.na.AddLocations(vprLayer, subLayerNames["Depots"], scenario['depots'], \
+                              append="CLEAR")
+
+        # Add Route Table information
+        arcpy.AddMessage("\tAdding Route Requirements...")
+        arcpy.na.AddLocations(vprLayer, subLayerNames["Routes"], scenario['routes'], \
+                              append="CLEAR")
+
+        # Solve for setup
+        arcpy.AddMessage("\tSolving VRP...")
+        arcpy.na.Solve(vprLayer)
+        arcpy.AddMessage("VRP solved.")
+
+        # Saving layer file and directions
+        arcpy.SaveToLayerFile_management(vprLayer, output_lyr,"Relative")
+        layer_reference = arcpy.mapping.Layer(output_lyr)
+        arcpy.mapping.AddLayer(df, layer_reference, "TOP")
+        arcpy.AddMessage("Template Map updated with new routes.")
+        arcpy.Directions_na(vprLayer, "TEXT", scenario['directions'], "MILES", "REPORT_TIME")
+        arcpy.AddMessage("Directions saved.")
+        scenario_layer = arcpy.mapping.ListLayers(mxd, "vprLayer", df)[0]
+        # list the solution's sublayers once
+        sublayers = dict([(layer.name, layer) for layer in \
+                          arcpy.mapping.ListLayers(scenario_layer)])
+        return [scenario_layer], sublayers
+
+    except arcpy.ExecuteError:
+        msgs = arcpy.GetMessages(2)
+        arcpy.AddError("An error occurred during processing:\n")
+        arcpy.AddError(msgs)
+        arcpy.AddError("\nPYou may need to check that your orders, depots, and \
+                        routes are formated correctly.")
+
+def solveShardedScenario(settings, mxd, df, scenario):
+    """Splits a scenario's orders by depot or into geographic clusters,
+    solves each shard in its own VRP layer on the mapbook worker processes
+    and merges the solved Orders, Routes and directions into the single set
+    of layers and directions file the mapbook and upload stages use. Each
+    route is solved with the orders of its shard only, and each shard writes
+    to its own file geodatabase so the workers never share one. Returns the
+    layers added to the map and a dictionary of the merged layers by name,
+    or None if a shard failed."""
+    shard_folder = os.path.join(scenario['folder'], "shards")
+    if not os.path.exists(shard_folder):
+        os.makedirs(shard_folder)
+    gdb = os.path.join(shard_folder, "merged.gdb")
+    try:
+        if not arcpy.Exists(gdb):
+            arcpy.CreateFileGDB_management(shard_folder, "merged.gdb")
+
+        # read the points and routes to split
+        cursor = arcpy.da.SearchCursor(scenario['orders'], ["OID@", "SHAPE@XY"])
+        orders = [(row[0], row[1][0], row[1][1]) for row in cursor]
+        del cursor
+        cursor = arcpy.da.SearchCursor(scenario['depots'], ["Name", "SHAPE@XY"])
+        depots = [(row[0], row[1][0], row[1][1]) for row in cursor]
+        del cursor
+        if settings['shard_by'] == "DEPOT":
+            # a route's end depot goes in the shard of its start depot
+            fields = ["Name", "StartDepotName"]
+            if hasField(scenario['routes'], "EndDepotName"):
+                fields.append("EndDepotName")
+            cursor = arcpy.da.SearchCursor(scenario['routes'], fields)
+            routes = [tuple(row) for row in cursor]
+            del cursor
+            shards = Shards.partitionByDepot(orders, depots, routes)
+        else:
+            cursor = arcpy.da.SearchCursor(scenario['routes'], ["Name"])
+            routes = [row[0] for row in cursor]
+            del cursor
+            shards = Shards.partitionByCluster(orders, depots, routes, settings['shard_count'])
+
+        # write the inputs of each shard
+        arcpy.AddMessage("\tSplitting {0} orders into {1} shards...".format(len(orders), len(shards)))
+        oid_field = arcpy.AddFieldDelimiters(scenario['orders'], \
+                    arcpy.Describe(scenario['orders']).OIDFieldName)
+        jobs = []
+        for shard in shards:
+            name = shard['name']
+            if not shard['orders']:
+                arcpy.AddWarning("\t{0} has no orders, its routes are not solved: {1}".format(\
+                                 name, ", ".join(shard['routes'])))
+                continue
+            shard_gdb = os.path.join(shard_folder, name + ".gdb")
+            if not arcpy.Exists(shard_gdb):
+                arcpy.CreateFileGDB_management(shard_folder, name + ".gdb")
+            job = {'name': name, 'network': settings['network'],
+                   'impedance': settings['impedance'], 'time_units': settings['time_units'],
+                   'folder': shard_folder, 'gdb': shard_gdb,
+                   'orders': os.path.join(shard_gdb, name + "_input_orders"),
+                   'depots': os.path.join(shard_gdb, name + "_input_depots"),
+                   'routes': os.path.join(shard_gdb, name + "_input_routes")}
+            arcpy.Select_analysis(scenario['orders'], job['orders'], \
+                                  Shards.whereIn(oid_field, shard['orders'], quote=False))
+            arcpy.Select_analysis(scenario['depots'], job['depots'], Shards.whereIn(\
+                                  arcpy.AddFieldDelimiters(scenario['depots'], "Name"), shard['depots']))
+            arcpy.TableSelect_analysis(scenario['routes'], job['routes'], Shards.whereIn(\
+                                  arcpy.AddFieldDelimiters(scenario['routes'], "Name"), shard['routes']))
+            jobs.append(job)
+
+        arcpy.AddMessage("\tSolving {0} shards with {1} worker(s)...".format(\
+                         len(jobs), settings['pool_size']))
+        results = VRPS.solveShards(jobs, settings['pool_size'])
+        failed = [result for result in results if result['error'] != None]
+        for result in failed:
+            arcpy.AddError("\tUnable to solve {0}.".format(result['name']))
+            arcpy.AddError(result['error'])
+        if failed or not results:
+            return None
+        arcpy.AddMessage("VRP solved.")
+
+        # merge the shards back into one set of layers and directions
+        Shards.mergeDirections([result['directions'] for result in results], \
+                               scenario['directions'])
+        arcpy.AddMessage("Directions saved.")
+        map_layers = []
+        sublayers = {}
+        solved_layer = arcpy.mapping.Layer(results[0]['layer'])
+        for sublayer in ("Depots", "Orders", "Routes"):
+            if sublayer == "Depots":
+                merged = scenario['depots']
+            else:
+                merged = os.path.join(gdb, sublayer)
+                arcpy.Merge_management([result[sublayer.lower()] for result in results], merged)
+            layer_reference = arcpy.mapping.Layer(merged)
+            layer_reference.name = sublayer
+            arcpy.mapping.AddLayer(df, layer_reference, "TOP")
+            layer = arcpy.mapping.ListLayers(mxd, sublayer, df)[0]
+            # keep the symbology of the VRP layer's sublayer
+            symbology = arcpy.mapping.ListLayers(solved_layer, sublayer)[0]
+            arcpy.mapping.UpdateLayer(df, layer, symbology, True)
+            map_layers.append(layer)
+            sublayers[sublayer] = layer
+        arcpy.AddMessage("Template Map updated with new routes.")
+        return map_layers, sublayers
+
+    except ValueError:
+        arcpy.AddError("Unable to split the orders into shards: {}".format(sys.exc_info()[1]))
+
+    except arcpy.ExecuteError:
+        msgs = arcpy.GetMessages(2)
+        arcpy.AddError("An error occurred during processing:\n")
+        arcpy.AddError(msgs)
+        arcpy.AddError("\nPYou may need to check that your orders, depots, and \
+                        routes are formated correctly.")
+
+def publishScenario(settings, mxd, scenario, sublayers):
+    """Builds the mapbooks of a solved scenario and hands each route to the
+    upload threads as soon as its book is saved. The uploads carry on in the
+    background, so the next scenario can be solved while they finish.
+    sublayers holds the solution's Orders, Depots and Routes layers. Returns
+    the scenario's UploadPipeline, mapbook results, manifest and route
+    hashes for finishScenario, which records the shared routes once the
+    uploads are joined and the share queue flushed."""
+    stats = VRPS.stats
+    outputfolder = scenario['folder']
+    date = scenario['date']
+    directions = scenario['directions']
+
+    # update sublayers name reference
+    ordersLayer = sublayers["Orders"]
+    depotsLayer = sublayers["Depots"]
+    routesLayer = sublayers["Routes"]
+
+
+    # Start mapbook and upload processing for each inspector
+    arcpy.AddMessage("Starting Mapbook processing...")
+    mapbook_template = os.path.join(outputfolder, "mapbook_template.mxd")
+    mxd.saveACopy(mapbook_template)
+    # Skip routes whose stops, directions and template have not changed since
+    # they were last built and uploaded. Dry runs keep their own manifest so
+    # routes they built are still uploaded by the next real run.
+    manifest = VRPS.RouteManifest(outputfolder, settings['manifest_name'])
+    template_hash = settings['template_hash']
+    # the directions are parsed once into a cache that the mapbook workers
+    # read a route at a time, a rerun with the same directions skips parsing
+    directions_cache = VRPS.cacheDirections(directions)
+    d = VRPS.DirectionsCache(directions_cache)
+    # Read every route's stops once for page extents and change detection
+    stop_table = RouteStops.readRouteStops(ordersLayer, depotsLayer, "Assessors Office")
+    route_hashes = {}
+    routesCursor = arcpy.da.SearchCursor(scenario['routes'], ["Name"])
+    mapbook_jobs = []
+    resumed = []
+    for inspector_row in routesCursor:
+        Name = inspector_row[0]
+        if Name in d.names:
+            directions_text = d.getText(Name)
+        else:
+            directions_text = ""
+        route_hashes[Name] = VRPS.hashRoute(stop_table.stops(Name), \
+                             directions_text, template_hash, date)
+        if settings['incremental'] and not manifest.changed(Name, route_hashes[Name]):
+            arcpy.AddMessage("\t{} is unchanged since the last run, skipping.".format(Name))
+            continue
+        pdf_path = os.path.join(outputfolder, "{0}_RouteBook_{1}.pdf".format(Name, date))
+        # a book whose upload stopped partway is uploaded again as it is, so
+        # the upload resumes instead of starting over with a new book
+        if VRPS.uploadInProgress(pdf_path, route_hashes[Name]):
+            arcpy.AddMessage("\t{}'s mapbook upload stopped partway, resuming it.".format(Name))
+            resumed.append({'name': Name, 'pdf': pdf_path, 'pages': 0, 'error': None, \
+                            'seconds': 0.0})
+            continue
+        mapbook_jobs.append((Name, pdf_path))
+    d.close()
+    del d, routesCursor
+    # drive time, miles, stops and longest leg of each route for dispatch
+    summary = RouteSummary.summarizeDirections(directions)
+    for summary_path in summary.write(outputfolder):
+        arcpy.AddMessage("Route summary saved to {}.".format(summary_path))
+    stats.lap("directions")
+    # write the shapefiles of every route to build with one read of each
+    # layer, so a route's uploads can start as soon as its mapbook is saved
+    built_routes = [job[0] for job in mapbook_jobs] + [mapbook['name'] for mapbook in resumed]
+    arcpy.AddMessage("\tExporting Route and Orders shapefiles...")
+    route_shapefiles = VRPS.exportRouteFeatures(routesLayer, "Name", \
+                        built_routes, outputfolder, date)
+    order_shapefiles = VRPS.exportRouteFeatures(ordersLayer, "RouteName", \
+                        built_routes, outputfolder, date)
+    stats.lap("export")
+
+    arcpy.AddMessage("\tBuilding {0} mapbooks with {1} worker(s)...".format(\
+                     len(mapbook_jobs), settings['pool_size']))
+    renderer_factory = VRPS.MapbookRendererFactory(mapbook_template, directions_cache, \
+                     stop_table, settings['pdf_book'])
+    # shapefiles are zipped in memory on the upload threads
+    uploads = VRPS.UploadPipeline(settings['username'], settings['token'], \
+                     settings['session'], settings['upload_workers'], \
+                     settings['shares'], settings['tracker'], \
+                     package_folder=outputfolder, compression=settings['zip_compression'], \
+                     publisher=settings['publisher'])
+    # pages are built on the local disk, only finished books are written to
+    # the output folder. Each book is handed to the upload threads as soon as
+    # it is saved, and rendering waits while too many routes are uploading.
+    mapbook_temp = tempfile.mkdtemp(prefix="mapbook_")
+    mapbooks = []
+    for mapbook in itertools.chain(resumed, VRPS.iterMapbooks(mapbook_jobs, \
+                     renderer_factory, mapbook_temp, settings['pool_size'])):
+        mapbooks.append(mapbook)
+        Name = mapbook['name']
+        if mapbook['error'] != None:
+            arcpy.AddError("\tUnable to create {}'s mapbook.".format(Name))
+            arcpy.AddError(mapbook['error'])
+            continue
+        arcpy.AddMessage("\t{}'s Mapbook created.".format(Name))
+
+        # hand the route's shapefiles and mapbook to the upload threads
+        arcpy.AddMessage("\tStarting upload of Route and Orders shapefiles and mapbook...")
+        route_package = [route_shapefiles[Name], None, routesLayer.name]
+        order_package = [order_shapefiles[Name], None, ordersLayer.name]
+        uploads.submit(Name, date, route_package, order_package, mapbook['pdf'], \
+                       route_hashes[Name])
+        VRPS.flushMessages()
+    shutil.rmtree(mapbook_temp, ignore_errors=True)
+    stats.lap("mapbooks")
+    del ordersLayer, depotsLayer, routesLayer
+    return uploads, mapbooks, manifest, route_hashes
+
+def finishScenario(uploads, mapbooks, manifest, route_hashes, shared):
+    """Records the routes of a scenario whose mapbook, services and webmap
+    were all uploaded and shared in its manifest. shared is the {item id:
+    True or False} result of sharing the items. Call it once the scenario's
+    uploads are joined and the share queue is flushed, so a route whose
+    items were not shared is built and uploaded again by the next run."""
+    for mapbook in mapbooks:
+        Name = mapbook['name']
+        services = uploads.results.get(Name, [None, None])
+        if Name not in uploads.pdfs or None in services or Name not in uploads.webmaps:
+            continue
+        items = [uploads.pdfs[Name][0], services[0][2], services[1][2], uploads.webmaps[Name]]
+        if False in [shared.get(item) == True for item in items]:
+            arcpy.AddWarning("\t{}'s items were not all shared, it will be uploaded again next run.".format(Name))
+            continue
+        manifest.update(Name, route_hashes[Name], {'pdf': items[0], 'routes': items[1],
+                        'orders': items[2], 'webmap': items[3]})
+    manifest.save()
+
+def main():
+    """Solves the VRP, builds each inspector's mapbook and uploads the results
+    to ArcGIS Online. With a scenario table every scenario is solved and
+    published in turn after one shared setup."""
+    # Environmental Variables
+    arcpy.env.overwriteOutput = True
+
+    # User Parameters and variable setup
+    ND = arcpy.GetParameterAsText(0)
+    time_impedance = arcpy.GetParameterAsText(1)
+    timeUnits = arcpy.GetParameterAsText(2)
+    inspection_orders = arcpy.GetParameterAsText(3)
+    depots = arcpy.GetParameterAsText(4)
+    routestable = arcpy.GetParameterAsText(5)
+    outputfolder = arcpy.GetParameterAsText(6)
+    templatemap = arcpy.GetParameterAsText(7)
+    username = arcpy.GetParameterAsText(8)
+    password = arcpy.GetParameterAsText(9)
+    pool_size = int(getOptionalParameter(10, 1))
+    upload_workers = int(getOptionalParameter(11, 1))
+    incremental = getOptionalParameter(12, "true").lower() == "true"
+    if getOptionalParameter(13, "true").lower() == "true":
+        zip_compression = zipfile.ZIP_DEFLATED
+    else:
+        zip_compression = zipfile.ZIP_STORED
+    run_report = getOptionalParameter(14, "false").lower() == "true"
+    profile_route = getOptionalParameter(15, None)
+    cache_token = getOptionalParameter(16, "false").lower() == "true"
+    max_rate = getOptionalParameter(17, None)
+    if max_rate != None:
+        max_rate = float(max_rate)
+    scenario_table = getOptionalParameter(18, None)
+    calendar = BusinessDays.BusinessCalendar(BusinessDays.parseDates(\
+               getOptionalParameter(19, "")))
+    shard_by = getOptionalParameter(20, "NONE").upper()
+    shard_count = int(getOptionalParameter(21, 4))
+    # a dry run publishes to a local folder instead of ArcGIS Online
+    publish_folder = getOptionalParameter(22, None)
+    # mapbooks can be built in memory when PyPDF2 is installed
+    pdf_book = VRPS.ArcpyPDFBook
+    if getOptionalParameter(23, "false").lower() == "true":
+        if VRPS.PyPDF2 == None:
+            arcpy.AddWarning("PyPDF2 is not installed, the mapbooks are built on disk.")
+        else:
+            pdf_book = VRPS.MemoryPDFBook
+    # time each stage of the run, and each route's mapbook and uploads
+    VRPS.stats = VRPS.RunStats(run_report or profile_route != None, \
+                               profile_route, outputfolder)
+    stats = VRPS.stats
+
+    # Generated inital variables
+    mxd = arcpy.mapping.MapDocument(templatemap)
+    df = arcpy.mapping.ListDataFrames(mxd)[0]
+    if scenario_table != None:
+        scenarios = readScenarios(scenario_table, calendar, inspection_orders, \
+                    depots, routestable, outputfolder)
+    else:
+        scenarios = [{'name': None, 'date': calculateNextDay(calendar), \
+                      'orders': inspection_orders, 'routes': routestable, \
+                      'depots': depots, 'folder': outputfolder}]
+    for scenario in scenarios:
+        scenario['directions'] = os.path.join(scenario['folder'], "directions.txt")
+        if not os.path.exists(scenario['folder']):
+            os.makedirs(scenario['folder'])
+
+    # Setup AGOL access
+    hostname = "http://" + socket.getfqdn()
+
+    if publish_folder != None:
+        # nothing is sent to AGOL, so no token is needed
+        token = None
+        tokens = None
+        publisher = VRPS.LocalPublisher(publish_folder)
+        arcpy.AddMessage("\nDry run, items are stored in {}.".format(publish_folder))
+    else:
+        # the token is refreshed before it expires and when a request is
+        # rejected for it, so long runs do not fail partway through
+        # the token is cached in the user's own folder, never in the shared
+        # output folder. A cache left there by earlier runs is removed.
+        old_cache = os.path.join(outputfolder, "token_cache.json")
+        if os.path.exists(old_cache):
+            os.remove(old_cache)
+        if cache_token:
+            token_cache = VRPS.tokenCachePath()
+        else:
+            token_cache = None
+        tokens = VRPS.TokenManager(username, password, hostname, cache_path=token_cache)
+
+        try:
+            token_status = tokens.load()
+            token = token_status['token']
+            arcpy.AddMessage("\nToken generated for AGOL.")
+            stats.lap("token")
+        except:
+            tb = sys.exc_info()[2]
+            tbinfo = traceback.format_tb(tb)[0]
+            msg = "Traceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
+            try:
+                token_status
+                if 'error' in token_status:
+                    code = token_status['error']['code']
+                    msg = token_status['error']['message']
+                    details = token_status['error']['details'][0]
+                    arcpy.AddError("Failed to generate token.")
+                    arcpy.AddError("Error {0}: {1} {2}".format(code, msg, details))
+                    print "Error {0}: {1} {2}".format(code, msg, details)
+                    sys.exit()
+            except:
+                arcpy.AddError("Failed to generate token.")
+                arcpy.AddError(msg)
+                print msg
+            sys.exit()
 
 
-# Check out Network Analyst extension
-try:
-    arcpy.CheckOutExtension("Network")
-    arcpy.AddMessage("Network Analyst license checked out.")
+    # Check out Network Analyst extension
+    try:
+        arcpy.CheckOutExtension("Network")
+        arcpy.AddMessage("Network Analyst license checked out.")
+        stats.lap("license")
 
-except:
-    tb = sys.exc_info()[2]
-    tbinfo = traceback.format_tb(tb)[0]
-    msg = "Traceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
-    arcpy.AddError("Unable to checkout Network Analyst License.")
-    arcpy.AddError(msg)
-    sys.exit()
+    except:
+        tb = sys.exc_info()[2]
+        tbinfo = traceback.format_tb(tb)[0]
+        msg = "Traceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
+        arcpy.AddError("Unable to checkout Network Analyst License.")
+        arcpy.AddError(msg)
+        sys.exit()
 
 
-# Begin Script processing
-# VPR processing
-try:
-    # VRP layer creation and variable assignments
+    # Begin Script processing
+    # The VRP layer is shared by every scenario solved without shards and
+    # made by the first of them. Sharded solves make a layer for each shard.
     arcpy.AddMessage("Starting Vehicle Routing Problem Analysis...")
-    vprLayer = arcpy.na.MakeVehicleRoutingProblemLayer(ND, "vprLayer", \
-                                time_impedance, time_units=timeUnits, \
-                                output_path_shape="TRUE_LINES_WITHOUT_MEASURES")
-    vprLayer = vprLayer.getOutput(0)
-
-    subLayerNames = arcpy.na.GetNAClassNames(vprLayer)
-    ordersLayerName = subLayerNames["Orders"]
-    depotsLayerName = subLayerNames["Depots"]
-    routesLayerName = subLayerNames["Routes"]
-
-    # Add Orders
-    arcpy.AddMessage("\tAdding Orders...")
-    arcpy.na.AddLocations(vprLayer, ordersLayerName, inspection_orders)
-
-    # Add Depots
-    arcpy.AddMessage("\tAdding Depots...")
-    arcpy.na.AddLocations(vprLayer, depotsLayerName, depots)
-
-    # Add Route Table information
-    arcpy.AddMessage("\tAdding Route Requirements...")
-    arcpy.na.AddLocations(vprLayer, routesLayerName, routestable)
-
-    # Solve for setup
-    arcpy.AddMessage("\tSolving VRP...")
-    arcpy.na.Solve(vprLayer)
-    arcpy.AddMessage("VRP solved.")
-
-    # Saving layer file and directions
-    arcpy.SaveToLayerFile_management(vprLayer, output_lyr,"Relative")
-    layer_reference = arcpy.mapping.Layer(output_lyr)
-    arcpy.mapping.AddLayer(df, layer_reference, "TOP")
-    arcpy.AddMessage("Template Map updated with new routes.")
-    arcpy.Directions_na(vprLayer, "TEXT", directions, "MILES", "REPORT_TIME")
-    arcpy.AddMessage("Directions saved.")
-
-except arcpy.ExecuteError:
-    msgs = arcpy.GetMessages(2)
-    arcpy.AddError("An error occurred during processing:\n")
-    arcpy.AddError(msgs)
-    arcpy.AddError("\nPYou may need to check that your orders, depots, and \
-                    routes are formated correctly.")
-
-# Make RouteDirections object to pull direction information off of it
-d = VRPS.RouteDirection(directions)
-
-# update sublayers name reference
-ordersLayer = arcpy.mapping.ListLayers(mxd, "Orders")[0]
-depotsLayer = arcpy.mapping.ListLayers(mxd, "Depots")[0]
-routesLayer = arcpy.mapping.ListLayers(mxd, "Routes")[0]
-
-
-# Start mapbook and upload processing for each inspector
-arcpy.AddMessage("Starting Mapbook processing...")
-routesCursor = arcpy.da.SearchCursor(routestable, ["Name"])
-routebookcollection = []
-for inspector_row in routesCursor:
-    Name = inspector_row[0]
-    # Create empty Route book PDF
-    arcpy.AddMessage("\tStarting {}'s mapbook...".format(Name))
-    pdf_path = os.path.join(outputfolder, "{0}_RouteBook_{1}.pdf".format(Name, date))
-    pdf = arcpy.mapping.PDFDocumentCreate(pdf_path)
-    routebookcollection.append(pdf_path)
-    # select individual inspector orders
-    arcpy.SelectLayerByAttribute_management(depotsLayer, "NEW_SELECTION",\
-            "Name = 'Assessors Office'")
-    arcpy.SelectLayerByAttribute_management(ordersLayer, "NEW_SELECTION",\
-            "RouteName = '{}'".format(Name))
-    count = int(arcpy.GetCount_management(ordersLayer).getOutput(0))
-    sequence_num = 2
-    # Create a temporary folder in the output to build order pages
-    outputfolder_temp = os.path.join(outputfolder, Name + "_temp")
-    if arcpy.Exists(outputfolder_temp):
-        arcpy.Delete_management(outputfolder_temp)
-    os.makedirs(outputfolder_temp)
-    # start page build
-    while sequence_num <= (count + 1):
-        if sequence_num == 2:
-            arcpy.SelectLayerByAttribute_management(ordersLayer, \
-                    "NEW_SELECTION", \
-                    "Sequence = 2 AND RouteName = '{0}'".format(Name))
+    vprLayer = None
+
+    # services, webmaps and PDFs are shared together at the end
+    shares = VRPS.ShareQueue()
+    session = VRPS.AGOLSession(max_requests=upload_workers, tokens=tokens, \
+                     max_rate=max_rate)
+    # webmaps are made once both of a route's publish jobs have finished
+    tracker = VRPS.PublishJobTracker(username, token, session)
+    manifest_name = "route_manifest.json"
+    if publish_folder == None:
+        publisher = VRPS.AGOLPublisher(username, token, session)
+    else:
+        manifest_name = "dry_run_manifest.json"
+    settings = {'username': username, 'token': token, 'session': session,
+                'tracker': tracker, 'shares': shares, 'pool_size': pool_size,
+                'upload_workers': upload_workers, 'incremental': incremental,
+                'zip_compression': zip_compression,
+                'template_hash': VRPS.hashFile(templatemap),
+                'network': ND, 'impedance': time_impedance, 'time_units': timeUnits,
+                'shard_by': shard_by, 'shard_count': shard_count, 'pdf_book': pdf_book,
+                'publisher': publisher, 'manifest_name': manifest_name}
+
+    # solve and publish each scenario. A scenario's uploads finish in the
+    # background while the next one is solved and rendered.
+    published = []
+    for scenario in scenarios:
+        if scenario['name'] != None:
+            arcpy.AddMessage("Scenario {0} for {1}...".format(scenario['name'], scenario['date']))
+        sharded = shard_by != "NONE"
+        if shard_by == "DEPOT" and not hasField(scenario['routes'], "StartDepotName"):
+            arcpy.AddWarning("\tThe routes have no StartDepotName field to shard by, " + \
+                             "solving them without shards.")
+            sharded = False
+        if sharded:
+            solution = solveShardedScenario(settings, mxd, df, scenario)
         else:
-            arcpy.SelectLayerByAttribute_management(depotsLayer, \
-                        "CLEAR_SELECTION")
-            arcpy.SelectLayerByAttribute_management(ordersLayer, \
-                "NEW_SELECTION", \
-                "(Sequence = {0} OR Sequence = {1}) AND RouteName = '{2}'".format(\
-                sequence_num, (sequence_num - 1), Name))
-        df.zoomToSelectedFeatures()
-        df.scale = df.scale + 2000
-        # Find directions for inspector for select order and update map
-        d.findStringPositions(Name)
-        dic = d.seekLines()
-        DirecttextElement = arcpy.mapping.ListLayoutElements(mxd, \
-                         "TEXT_ELEMENT", "directions")[0]
-        DirecttextElement.text = dic[(sequence_num - 1)]
-        DirecttextElement.elementWidth = 3.25
-        InspectTexttElement = arcpy.mapping.ListLayoutElements(mxd, \
-                         "TEXT_ELEMENT", "inspection")[0]
-        ordersCursor = arcpy.da.SearchCursor(ordersLayer, ["Name"])
-        for row in ordersCursor:
-            InspectTexttElement.text = row[0]
-        page_name = os.path.join(outputfolder_temp, "{0}_{1}.pdf".format(Name,\
-                                 sequence_num))
-        # Export map and apped it to main route book pdf
-        arcpy.mapping.ExportToPDF(mxd, page_name, "PAGE_LAYOUT")
-        pdf.appendPages(page_name)
-        sequence_num += 1
-    pdf.saveAndClose()
-    arcpy.Delete_management(outputfolder_temp)
-    arcpy.AddMessage("\t{}'s Mapbook created.".format(Name))
-
-    # upload routes to Agol and publish
-    arcpy.AddMessage("\tStarting upload of Route and Orders shapefiles...")
-    upload_routes = VRPS.uploadPublish(Name, date, outputfolder, \
-                    routesLayer, "Name = '{}'".format(Name), username, token)
-    upload_orders = VRPS.uploadPublish(Name, date, outputfolder, \
-                    ordersLayer, "RouteName = '{}'".format(Name), username, token)
-    if upload_orders != None and upload_routes != []:
-        VRPS.makeWebmap(Name, date, upload_routes, upload_orders, username, token)
-    arcpy.AddMessage("\tFinsihed processing {}'s pdf and webmap.\n".format(Name))
-
-
-# Upload PDF to ArcGIS Online and share them with the organization
-arcpy.AddMessage("Starting PDF upload process...")
-output_pdf_dict = {}
-for routebook in routebookcollection:
-    upload_pdf_dict = VRPS.uploadPDF(routebook, username, token)
-    output_pdf_dict.update(upload_pdf_dict)
-VRPS.sharePDFs(output_pdf_dict, username, token)
-
-# final cleanup
-del d, inspector_row, routesCursor, mxd, df, vprLayer, ordersLayer
-del routesLayer, depotsLayer
-
-arcpy.CheckInExtension('Network')
-
-arcpy.AddMessage("Processing Complete!")
\ No newline at end of file
+            if vprLayer == None:
+                vprLayer = arcpy.na.MakeVehicleRoutingProblemLayer(ND, "vprLayer", \
+                                            time_impedance, time_units=timeUnits, \
+                                            output_path_shape="TRUE_LINES_WITHOUT_MEASURES")
+                vprLayer = vprLayer.getOutput(0)
+                subLayerNames = arcpy.na.GetNAClassNames(vprLayer)
+            solution = solveScenario(vprLayer, subLayerNames, mxd, df, scenario)
+        stats.lap("solve")
+        if solution == None:
+            continue
+        map_layers, sublayers = solution
+        published.append(publishScenario(settings, mxd, scenario, sublayers))
+        for layer in map_layers:
+            arcpy.mapping.RemoveLayer(df, layer)
+        del map_layers, sublayers, solution
+    for scenario_uploads in published:
+        scenario_uploads[0].join()
+    tracker.stop()
+    stats.lap("upload")
+
+    # routes are only recorded as done once everything they uploaded is shared
+    arcpy.AddMessage("Sharing uploaded items with the organization...")
+    shared = shares.flush(username, token, session, publisher)
+    for scenario_uploads in published:
+        finishScenario(*scenario_uploads, shared=shared)
+    stats.lap("share")
+    publisher.close()
+
+    # final cleanup
+    del mxd, df, vprLayer
+
+    arcpy.CheckInExtension('Network')
+
+    # Write the time of each stage and route
+    for report_path in stats.write(outputfolder):
+        arcpy.AddMessage("Run report saved to {}.".format(report_path))
+
+    arcpy.AddMessage("Processing Complete!")
+
+
+if __name__ == '__main__':
+    main()
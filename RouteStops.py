@@ -0,0 +1,84 @@
+'''
+Title: Route Stops
+Created: 10/17/2026
+
+Description: Holds the ordered stops of every route, read once from the Orders
+layer of the VRP solution, and works out the map extent of each mapbook page
+from the coordinates of the stops. This replaces the selections, zooms and
+cursors the page loop used to run for every page.
+'''
+
+
+class RouteStopTable:
+    """Table of the stops of each route in sequence order, with the depot each
+    route starts from."""
+    def __init__(self, rows, depots=None):
+        """Builds the table from (route name, sequence, order name, x, y) rows
+        in any order. depots is a dictionary of {route name: (x, y)} for the
+        depot each route leaves from."""
+        self.routes = {}
+        self.depots = depots or {}
+        for route, sequence, name, x, y in rows:
+            if route is None:
+                continue
+            self.routes.setdefault(route, []).append((sequence, name, x, y))
+        for route in self.routes:
+            self.routes[route].sort()
+
+    def stops(self, route):
+        """Returns the (sequence, order name, x, y) stops of a route in order"""
+        return self.routes.get(route, [])
+
+    def count(self, route):
+        """Returns the number of stops on a route"""
+        return len(self.stops(route))
+
+    def stop(self, route, index):
+        """Returns a route's stop by its position, starting at 0"""
+        return self.stops(route)[index]
+
+    def pagePoints(self, route, index):
+        """Returns the points framed by the page of a stop: the stop and the
+        stop before it, or the depot for the first stop."""
+        stops = self.stops(route)
+        points = [(stops[index][2], stops[index][3])]
+        if index > 0:
+            points.append((stops[index - 1][2], stops[index - 1][3]))
+        elif route in self.depots:
+            points.append(self.depots[route])
+        return points
+
+    def pageExtent(self, route, index, margin=0.1, min_size=500.0):
+        """Returns the (xmin, ymin, xmax, ymax) extent of the page of a stop.
+        The box around the page points is widened by margin times its size on
+        every side and is never smaller than min_size map units across."""
+        points = self.pagePoints(route, index)
+        xs = [point[0] for point in points]
+        ys = [point[1] for point in points]
+        width = max(max(xs) - min(xs), min_size)
+        height = max(max(ys) - min(ys), min_size)
+        x_center = (max(xs) + min(xs)) / 2.0
+        y_center = (max(ys) + min(ys)) / 2.0
+        half_width = width * (0.5 + margin)
+        half_height = height * (0.5 + margin)
+        return (x_center - half_width, y_center - half_height,
+                x_center + half_width, y_center + half_height)
+
+
+def readRouteStops(orders_layer, depots_layer=None, depot_name=None):
+    """Builds a RouteStopTable with one read of the Orders layer. If a depots
+    layer and depot name are given that depot is used as the start of every
+    route, as the mapbook has always done."""
+    import arcpy
+    cursor = arcpy.da.SearchCursor(orders_layer, ["RouteName", "Sequence", "Name", "SHAPE@XY"])
+    rows = [(row[0], row[1], row[2], row[3][0], row[3][1]) for row in cursor]
+    del cursor
+    depots = {}
+    if depots_layer is not None:
+        cursor = arcpy.da.SearchCursor(depots_layer, ["Name", "SHAPE@XY"])
+        for row in cursor:
+            if row[0] == depot_name:
+                for route in set([stop[0] for stop in rows]):
+                    depots[route] = row[1]
+        del cursor
+    return RouteStopTable(rows, depots)
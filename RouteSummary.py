@@ -0,0 +1,230 @@
+'''
+Title: Route Summary
+Created: 10/17/2026
+
+Description: Works out the drive time, miles, stop count and longest leg of
+every route, and the totals for the whole fleet, from the directions file
+of the VRP solution. The file is read a block of whole routes at a time, the
+maneuvers of each block are read in one pass into NumPy arrays and the
+totals are worked out on the arrays, so thousands of routes take a fraction
+of a second and only one block is held in memory. The totals are written to a summary CSV
+for dispatch and a JSON file with the text of each route's summary page.
+'''
+import re, csv, json, os
+import numpy
+
+# Matches the lines of a directions file that the totals are built from. The
+# first group is the "Begin route" line or the numbered "Arrive at" line that
+# ends a leg, the others the distance, unit and time of a numbered maneuver.
+# Every match starts at a new line, so the text is searched from line to line.
+_DIRECTIONS_LINE = re.compile(r"\n(?:(Begin route [^\n]*|[ \t]*\d+:[ \t]+Arrive at)|"
+                              r"[ \t]*\d+:[^\n]*\s([\d.,]+) (mi|ft)\b"
+                              r"(?:[ \t]+((?:<[ \t]*)?[\d.]+) min)?)")
+
+CSV_FIELDS = ["route", "stops", "drive_minutes", "miles", "longest_leg_miles",
+              "longest_leg_minutes"]
+
+
+def _minutesText(minutes):
+    """Private function that writes minutes as hours and minutes."""
+    hours, minutes = divmod(int(round(minutes)), 60)
+    if hours:
+        return "{0} h {1} min".format(hours, minutes)
+    return "{0} min".format(minutes)
+
+
+def _bytes(strings):
+    """Private function that returns the characters of an array of strings
+    as a 2D array of byte values, padded with zeros."""
+    strings = numpy.ascontiguousarray(strings)
+    return strings.view(numpy.uint8).reshape(len(strings), strings.dtype.itemsize)
+
+
+class RouteSummary:
+    """Totals of each route of a directions file. The route names are in the
+    names property in file order and the totals are NumPy arrays in the same
+    order: stops, drive_minutes, miles, longest_leg_miles and
+    longest_leg_minutes. A leg is the drive from the depot or a stop to the
+    next stop, or back to the depot. A maneuver shown as "< 1 min" counts as
+    half a minute."""
+    def __init__(self, names, stops, drive_minutes, miles, longest_leg_miles, \
+                 longest_leg_minutes):
+        """Stores the names and totals of the routes"""
+        self.names = names
+        self.stops = stops
+        self.drive_minutes = drive_minutes
+        self.miles = miles
+        self.longest_leg_miles = longest_leg_miles
+        self.longest_leg_minutes = longest_leg_minutes
+        self._index = dict([(name, index) for index, name in enumerate(names)])
+
+    def route(self, name):
+        """Returns a dictionary of the totals of a route"""
+        index = self._index[name]
+        return {'route': name, 'stops': int(self.stops[index]),
+                'drive_minutes': round(float(self.drive_minutes[index]), 1),
+                'miles': round(float(self.miles[index]), 2),
+                'longest_leg_miles': round(float(self.longest_leg_miles[index]), 2),
+                'longest_leg_minutes': round(float(self.longest_leg_minutes[index]), 1)}
+
+    def fleet(self):
+        """Returns a dictionary of the totals of all the routes together with
+        the route with the most drive time and the longest leg of any route"""
+        fleet = {'routes': len(self.names), 'stops': int(self.stops.sum()),
+                 'drive_minutes': round(float(self.drive_minutes.sum()), 1),
+                 'miles': round(float(self.miles.sum()), 2),
+                 'longest_route': None, 'longest_leg_miles': 0.0,
+                 'longest_leg_route': None}
+        if self.names:
+            fleet['mean_drive_minutes'] = round(float(self.drive_minutes.mean()), 1)
+            fleet['mean_miles'] = round(float(self.miles.mean()), 2)
+            fleet['longest_route'] = self.names[int(self.drive_minutes.argmax())]
+            longest = int(self.longest_leg_miles.argmax())
+            fleet['longest_leg_miles'] = round(float(self.longest_leg_miles[longest]), 2)
+            fleet['longest_leg_route'] = self.names[longest]
+        return fleet
+
+    def summaryText(self, name):
+        """Returns the text of a route's summary page"""
+        route = self.route(name)
+        return "\n".join(["Route {0}".format(name),
+                          "Stops: {0}".format(route['stops']),
+                          "Drive time: {0}".format(_minutesText(route['drive_minutes'])),
+                          "Distance: {0:.1f} mi".format(route['miles']),
+                          "Longest leg: {0:.1f} mi, {1}".format(route['longest_leg_miles'], \
+                          _minutesText(route['longest_leg_minutes']))])
+
+    def writeCSV(self, path):
+        """Writes a row of totals for every route followed by a row for the
+        fleet."""
+        out = open(path, "wb")
+        writer = csv.writer(out)
+        writer.writerow(CSV_FIELDS)
+        for name in self.names:
+            route = self.route(name)
+            writer.writerow([route[field] for field in CSV_FIELDS])
+        fleet = self.fleet()
+        writer.writerow(["FLEET", fleet['stops'], fleet['drive_minutes'], fleet['miles'], \
+                         fleet['longest_leg_miles'], ""])
+        out.close()
+
+    def writePages(self, path):
+        """Writes the fleet totals and the summary page text of every route
+        to a JSON file."""
+        out = open(path, "w")
+        json.dump({'fleet': self.fleet(),
+                   'routes': [dict(self.route(name), text=self.summaryText(name)) \
+                              for name in self.names]}, out, indent=2, sort_keys=True)
+        out.close()
+
+    def write(self, folder, name="route_summary"):
+        """Writes <name>.csv and <name>.json to the folder and returns their
+        paths."""
+        csv_path = os.path.join(folder, name + ".csv")
+        json_path = os.path.join(folder, name + ".json")
+        self.writeCSV(csv_path)
+        self.writePages(json_path)
+        return [csv_path, json_path]
+
+
+def parseDirections(text):
+    """Returns a RouteSummary of the text of a directions file. The lines are
+    matched in one pass and the totals of each route and leg are added up on
+    NumPy arrays."""
+    matches = _DIRECTIONS_LINE.findall("\n" + text)
+    columns = numpy.array(matches, dtype=str).reshape(len(matches), 4)
+    # the first letter of the first column tells the begin and arrive rows apart
+    first = _bytes(columns[:, 0])[:, 0]
+    begins = first == ord("B")
+    if not begins.any():
+        empty = numpy.zeros(0)
+        return RouteSummary([], numpy.zeros(0, dtype=int), empty, empty, empty, empty)
+    # lines before the first route are not part of any route
+    skip = int(begins.argmax())
+    columns = columns[skip:]
+    begins = begins[skip:]
+    arrivals = (first[skip:] != 0) & ~begins
+    maneuvers = first[skip:] == 0
+    names = [str(name)[len("Begin route "):].strip() for name in columns[begins, 0]]
+    # every row belongs to the route and the leg that started before it
+    route_ids = numpy.cumsum(begins) - 1
+    leg_starts = begins | arrivals
+    leg_ids = numpy.cumsum(leg_starts) - 1
+
+    distance_text = columns[maneuvers, 1]
+    commas = (_bytes(distance_text) == ord(",")).any(axis=1)
+    if commas.any():
+        distance_text[commas] = numpy.char.replace(distance_text[commas], ",", "")
+    distance = distance_text.astype(float)
+    distance[columns[maneuvers, 2] == "ft"] /= 5280.0
+    minute_text = columns[maneuvers, 3]
+    minute_first = _bytes(minute_text)[:, 0]
+    minutes = numpy.zeros(len(minute_text))
+    timed = (minute_first != 0) & (minute_first != ord("<"))
+    minutes[timed] = minute_text[timed].astype(float)
+    minutes[minute_first == ord("<")] = 0.5
+
+    route_count = len(names)
+    maneuver_routes = route_ids[maneuvers]
+    drive_minutes = numpy.bincount(maneuver_routes, minutes, route_count)
+    miles = numpy.bincount(maneuver_routes, distance, route_count)
+    stops = numpy.bincount(route_ids[arrivals], minlength=route_count)
+
+    # legs of a route are numbered one after another, so the longest leg of
+    # each route is the maximum of its run of legs
+    leg_count = int(leg_ids[-1]) + 1
+    leg_miles = numpy.bincount(leg_ids[maneuvers], distance, leg_count)
+    leg_minutes = numpy.bincount(leg_ids[maneuvers], minutes, leg_count)
+    longest_leg_miles = numpy.maximum.reduceat(leg_miles, leg_ids[begins])
+    # the time of the longest leg, the first one if two legs tie
+    leg_routes = route_ids[leg_starts]
+    is_longest = leg_miles == longest_leg_miles[leg_routes]
+    candidates = numpy.nonzero(is_longest)[0]
+    candidate_routes = leg_routes[candidates]
+    # sorted by route and then leg, the first candidate of each route is kept
+    order = numpy.lexsort((candidates, candidate_routes))
+    candidates = candidates[order]
+    candidate_routes = candidate_routes[order]
+    first = numpy.ones(len(candidates), dtype=bool)
+    first[1:] = candidate_routes[1:] != candidate_routes[:-1]
+    longest_legs = numpy.empty(route_count, dtype=int)
+    longest_legs.fill(leg_count)
+    longest_legs[candidate_routes[first]] = candidates[first]
+    longest_leg_minutes = leg_minutes[longest_legs]
+    return RouteSummary(names, stops, drive_minutes, miles, longest_leg_miles, \
+                        longest_leg_minutes)
+
+
+def _joinSummaries(summaries):
+    """Private function that returns one RouteSummary of the routes of a
+    list of summaries, in the order they are given."""
+    names = []
+    for summary in summaries:
+        names.extend(summary.names)
+    return RouteSummary(names, *[numpy.concatenate([getattr(summary, total) \
+                        for summary in summaries]) for total in CSV_FIELDS[1:]])
+
+
+def summarizeDirections(directions_file, block_size=262144):
+    """Reads a directions file and returns its RouteSummary. The file is read
+    block_size bytes at a time and each block is cut before its last "Begin
+    route" line, so every route is summarized from one block and only the
+    totals of the routes are kept."""
+    marker = "\nBegin route "
+    summaries = []
+    pending = ""
+    read = open(directions_file, "r")
+    block = read.read(block_size)
+    while block:
+        text = pending + block
+        # only the new text can hold a route that begins after pending's
+        cut = text.rfind(marker, max(len(pending) - len(marker), 0))
+        if cut < 0:
+            pending = text
+        else:
+            summaries.append(parseDirections(text[:cut + 1]))
+            pending = text[cut + 1:]
+        block = read.read(block_size)
+    read.close()
+    summaries.append(parseDirections(pending))
+    return _joinSummaries(summaries)
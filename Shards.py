@@ -0,0 +1,224 @@
+'''
+Title: Shards
+Created: 10/17/2026
+
+Description: Splits a large VRP into smaller ones that can be solved on
+their own, and merges the directions of the solved shards back into one
+file. Orders are split by the depot they are nearest to, or into
+geographic clusters when there is a single depot, and every route goes to
+exactly one shard so route names stay unique when the shards are merged.
+'''
+import random
+
+
+def _distance2(x1, y1, x2, y2):
+    """Private function that returns the squared distance between points."""
+    return (x1 - x2) ** 2 + (y1 - y2) ** 2
+
+
+def _nearest(x, y, centers):
+    """Private function that returns the index of the center nearest to a
+    point."""
+    best = 0
+    best_distance = None
+    for index, center in enumerate(centers):
+        distance = (x - center[0]) ** 2 + (y - center[1]) ** 2
+        if best_distance is None or distance < best_distance:
+            best = index
+            best_distance = distance
+    return best
+
+
+def _shard(number, orders, routes, depots):
+    """Private function that returns the dictionary of a shard."""
+    return {'name': "shard_{0}".format(number), 'orders': orders,
+            'routes': routes, 'depots': depots}
+
+
+def _isBlank(depot):
+    """Private function that tells whether a depot name is empty."""
+    return depot is None or not str(depot).strip()
+
+
+def partitionByDepot(orders, depots, routes):
+    """Splits the orders by the depot they are nearest to. orders are
+    (order id, x, y) rows, depots (depot name, x, y) rows and routes
+    (route name, start depot name) or (route name, start depot name, end
+    depot name) rows. Only depots that start at least one route get orders.
+    A route without a start depot starts at its first order, so it can serve
+    any shard; each one goes to the shard with the most orders for each of
+    its routes at the time. A route that ends at another depot takes that
+    depot into its shard too. Raises ValueError if a route starts or ends at
+    a depot that is not in the depots, or if no route starts at a depot.
+    Returns a list of shard dictionaries with the name, order ids, route
+    names and depot names of each shard."""
+    depot_names = set([depot[0] for depot in depots])
+    routes_by_depot = {}
+    end_depots = {}
+    unknown = []
+    free = []
+    for route in routes:
+        name, depot = route[0], route[1]
+        end = None
+        if len(route) > 2 and not _isBlank(route[2]):
+            end = route[2]
+            if end not in depot_names:
+                unknown.append("{0} ends at {1}".format(name, end))
+        if _isBlank(depot):
+            free.append((name, end))
+        elif depot not in depot_names:
+            unknown.append("{0} starts at {1}".format(name, depot))
+        else:
+            routes_by_depot.setdefault(depot, []).append(name)
+            if end is not None:
+                end_depots.setdefault(depot, []).append(end)
+    if unknown:
+        raise ValueError("These routes use depots that are not in the depots: {0}".format(\
+                         ", ".join(unknown)))
+    used = [depot for depot in depots if depot[0] in routes_by_depot]
+    if not used:
+        raise ValueError("No route starts at any of the depots. Shard by CLUSTER instead.")
+    centers = [(depot[1], depot[2]) for depot in used]
+    orders_by_depot = [[] for depot in used]
+    for order_id, x, y in orders:
+        orders_by_depot[_nearest(x, y, centers)].append(order_id)
+    shards = []
+    for index, depot in enumerate(used):
+        shard_depots = [depot[0]]
+        for end in end_depots.get(depot[0], []):
+            if end not in shard_depots:
+                shard_depots.append(end)
+        shards.append(_shard(index + 1, orders_by_depot[index], \
+                             list(routes_by_depot[depot[0]]), shard_depots))
+    for name, end in free:
+        busiest = max(shards, key=lambda shard: float(len(shard['orders'])) / len(shard['routes']))
+        busiest['routes'].append(name)
+        if end is not None and end not in busiest['depots']:
+            busiest['depots'].append(end)
+    return shards
+
+
+def clusterPoints(points, count, iterations=20, seed=0):
+    """Groups (x, y) points into count clusters with k-means. The first
+    center is a random point and each center after it is the point farthest
+    from the centers so far. Returns the cluster index of every point and the
+    centers."""
+    count = min(count, len(points))
+    if count <= 0:
+        return [], []
+    rand = random.Random(seed)
+    centers = [points[rand.randrange(len(points))]]
+    nearest = [_distance2(x, y, centers[0][0], centers[0][1]) for x, y in points]
+    while len(centers) < count:
+        farthest = max(range(len(points)), key=nearest.__getitem__)
+        centers.append(points[farthest])
+        cx, cy = points[farthest]
+        for index, point in enumerate(points):
+            distance = _distance2(point[0], point[1], cx, cy)
+            if distance < nearest[index]:
+                nearest[index] = distance
+    labels = [None] * len(points)
+    for iteration in range(iterations):
+        changed = False
+        sums = [[0.0, 0.0, 0] for center in centers]
+        for index, point in enumerate(points):
+            label = _nearest(point[0], point[1], centers)
+            if label != labels[index]:
+                labels[index] = label
+                changed = True
+            total = sums[label]
+            total[0] += point[0]
+            total[1] += point[1]
+            total[2] += 1
+        if not changed:
+            break
+        centers = [(total[0] / total[2], total[1] / total[2]) if total[2] else centers[index] \
+                   for index, total in enumerate(sums)]
+    return labels, centers
+
+
+def allocate(total, sizes):
+    """Splits total items between groups in proportion to their sizes, with
+    at least one for every group that has a size, by largest remainder.
+    Returns the number for each group."""
+    groups = [index for index, size in enumerate(sizes) if size > 0]
+    counts = [0] * len(sizes)
+    if not groups or total <= 0:
+        return counts
+    if total < len(groups):
+        raise ValueError("{0} routes cannot serve {1} clusters.".format(total, len(groups)))
+    for index in groups:
+        counts[index] = 1
+    spare = total - len(groups)
+    weight = float(sum(sizes))
+    shares = [(sizes[index] / weight * spare, index) for index in groups]
+    for share, index in shares:
+        counts[index] += int(share)
+    left = total - sum(counts)
+    for share, index in sorted(shares, key=lambda item: (item[0] - int(item[0]), -item[1]), \
+                               reverse=True)[:left]:
+        counts[index] += 1
+    return counts
+
+
+def partitionByCluster(orders, depots, routes, count, iterations=20, seed=0):
+    """Splits the orders into count geographic clusters and gives each
+    cluster a share of the routes in proportion to its orders. orders are
+    (order id, x, y) rows, depots (depot name, x, y) rows and routes route
+    names. Every shard keeps all the depots, so a route can start and end
+    at any of them. There are never more shards than routes. Returns a list
+    of shard dictionaries like partitionByDepot."""
+    count = min(count, len(routes))
+    labels, centers = clusterPoints([(x, y) for order_id, x, y in orders], count, \
+                                    iterations, seed)
+    clusters = [[] for center in centers]
+    for label, order in zip(labels, orders):
+        clusters[label].append(order[0])
+    clusters = [cluster for cluster in clusters if cluster]
+    route_counts = allocate(len(routes), [len(cluster) for cluster in clusters])
+    depot_names = [depot[0] for depot in depots]
+    shards = []
+    start = 0
+    for index, cluster in enumerate(clusters):
+        shard_routes = list(routes[start:start + route_counts[index]])
+        start += route_counts[index]
+        shards.append(_shard(index + 1, cluster, shard_routes, list(depot_names)))
+    return shards
+
+
+def whereIn(field, values, quote=True):
+    """Returns a where clause selecting the rows whose field is one of the
+    values. Text values are quoted and their quotes doubled."""
+    if quote:
+        values = ["'{0}'".format(str(value).replace("'", "''")) for value in values]
+    else:
+        values = [str(value) for value in values]
+    if not values:
+        return "1 = 0"
+    return "{0} IN ({1})".format(field, ", ".join(values))
+
+
+def mergeDirections(paths, out_path):
+    """Writes the directions files of the solved shards one after another to
+    a single directions file and returns the route names in the order they
+    were written. The route blocks do not depend on each other, so the
+    merged file reads the same as if the routes were solved together.
+    Raises ValueError if a route is in more than one shard."""
+    names = []
+    seen = set()
+    out = open(out_path, "w")
+    for path in paths:
+        read = open(path, "r")
+        for line in read:
+            if line.startswith("Begin route "):
+                name = line.split("Begin route ", 1)[1].strip()
+                if name in seen:
+                    read.close()
+                    out.close()
+                    raise ValueError("Route {0} is in more than one shard.".format(name))
+                seen.add(name)
+                names.append(name)
+            out.write(line)
+        read.close()
+    out.close()
+    return names
@@ -10,30 +10,328 @@ Description: This contains the class and functions necessary for the VRP
 solution. It must be imported into the script in order to run the solution.
 '''
 import json, zipfile, requests, arcpy, traceback, os, sys, time
+import multiprocessing, threading, Queue, io, shutil, hashlib, csv, cProfile, random
+import mmap, struct, re, sqlite3, uuid, zlib
+from multiprocessing.pool import ThreadPool
+
+# PyPDF2 is optional and only needed by MemoryPDFBook
+try:
+    import PyPDF2
+except ImportError:
+    PyPDF2 = None
+
+
+# run instrumentation
+class _NoTimer:
+    """Private context manager that does nothing, used while stats are
+    disabled."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_no_timer = _NoTimer()
+
+
+class _StageTimer:
+    """Private context manager that records the wall time of a stage."""
+    def __init__(self, stats, name, route):
+        self.stats = stats
+        self.name = name
+        self.route = route
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.record(self.name, time.time() - self.start, self.route)
+        return False
+
+
+class RunStats:
+    """Records the wall time and calls of each stage of a run, counts such as
+    pages, bytes uploaded and requests, and the same broken down by route.
+    While disabled every method returns straight away. The report is written
+    as JSON and CSV by write."""
+    def __init__(self, enabled=True, profile_route=None, profile_folder=None):
+        """Sets up empty stats. If profile_route is given that route's mapbook
+        is run under cProfile and saved to profile_folder."""
+        self.enabled = enabled
+        self.profile_route = profile_route
+        self.profile_folder = profile_folder
+        self.started = time.time()
+        self._lap = self.started
+        self.stages = {}
+        self.counts = {}
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name, route=None):
+        """Returns a context manager that times a stage, optionally for a
+        route."""
+        if not self.enabled:
+            return _no_timer
+        return _StageTimer(self, name, route)
+
+    def record(self, name, seconds, route=None):
+        """Adds the wall time of one call of a stage."""
+        if not self.enabled:
+            return
+        with self._lock:
+            for table in self._tables(route):
+                stage = table.setdefault(name, {'calls': 0, 'seconds': 0.0})
+                stage['calls'] += 1
+                stage['seconds'] += seconds
+
+    def lap(self, name):
+        """Records the time since the last lap, or since the stats were set
+        up, as a stage. Used to time the steps of a script that run one after
+        another."""
+        now = time.time()
+        self.record(name, now - self._lap)
+        self._lap = now
+
+    def count(self, name, amount=1, route=None):
+        """Adds to a counter such as pages, bytes_uploaded or requests."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+            if route != None:
+                counts = self.routes.setdefault(route, {}).setdefault('counts', {})
+                counts[name] = counts.get(name, 0) + amount
+
+    def _tables(self, route):
+        """Private function that returns the stage tables to update."""
+        if route == None:
+            return [self.stages]
+        return [self.stages, self.routes.setdefault(route, {}).setdefault('stages', {})]
+
+    def profilePath(self, route):
+        """Returns the path to save the profile of a route to, or None if the
+        route is not the one being profiled."""
+        if not self.enabled or self.profile_route == None or route != self.profile_route:
+            return None
+        return os.path.join(self.profile_folder, "profile_{}.prof".format(route))
+
+    def report(self):
+        """Returns the stats as a dictionary."""
+        with self._lock:
+            return {'wall_time': time.time() - self.started, 'stages': self.stages,
+                    'counts': self.counts, 'routes': self.routes}
+
+    def write(self, folder, name="run_report"):
+        """Writes the report to <name>.json and <name>.csv in the folder and
+        returns the paths. The CSV has one row per stage or counter, for the
+        whole run and for each route."""
+        if not self.enabled:
+            return []
+        report = self.report()
+        json_path = os.path.join(folder, name + ".json")
+        out = open(json_path, "w")
+        json.dump(report, out, indent=2, sort_keys=True)
+        out.close()
+        csv_path = os.path.join(folder, name + ".csv")
+        out = open(csv_path, "wb")
+        writer = csv.writer(out)
+        writer.writerow(["route", "kind", "name", "calls", "seconds", "value"])
+        writer.writerow(["", "run", "wall_time", "", "{0:.3f}".format(report['wall_time']), ""])
+        rows = [("", report['stages'], report['counts'])]
+        for route in sorted(report['routes']):
+            rows.append((route, report['routes'][route].get('stages', {}),
+                         report['routes'][route].get('counts', {})))
+        for route, stages, counts in rows:
+            for stage in sorted(stages):
+                writer.writerow([route, "stage", stage, stages[stage]['calls'],
+                                 "{0:.3f}".format(stages[stage]['seconds']), ""])
+            for counter in sorted(counts):
+                writer.writerow([route, "count", counter, "", "", counts[counter]])
+        out.close()
+        return [json_path, csv_path]
+
+
+# Stats of the current run, replaced by the tool script when a run report is
+# asked for
+stats = RunStats(enabled=False)
+
+def timed(name):
+    """Decorator that records the wall time of each call of a function as a
+    stage in the run stats."""
+    def decorate(function):
+        def wrapper(*args, **kwargs):
+            if not stats.enabled:
+                return function(*args, **kwargs)
+            with stats.stage(name):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorate
 
 
 # reusable classes and functions
+def _parseRoutes(lines):
+    """Private generator that walks the lines of a directions file once and
+    yields a (route name, {stop number: directions text}) pair for every route.
+    Stops are grouped the same way seekLines groups them: each group ends with
+    an "Arrive at" line and the two lines that follow it."""
+    name = None
+    stops = {}
+    value = ""
+    skip = 0
+    extra = 0
+    for line in lines:
+        if name is None:
+            if "Begin route " in line:
+                name = line.split("Begin route ", 1)[1].strip()
+                stops = {}
+                value = ""
+                skip = 1
+                extra = 0
+            continue
+        if skip:
+            skip -= 1
+            continue
+        if extra:
+            value += line
+            extra -= 1
+            if extra:
+                continue
+            stops[len(stops) + 1] = value
+            value = ""
+            # the last line of a stop is read again as the first line of the
+            # next stop, as seekLines does
+        if "End of route {}".format(name) in line:
+            yield name, stops
+            name = None
+        elif "Arrive at" in line:
+            value += line
+            extra = 2
+        else:
+            value += line
+    if name is not None:
+        yield name, stops
+
+
+def _indexRoutes(fileobj):
+    """Private generator that walks a directions file opened in binary mode and
+    yields a (route name, start offset, end offset) tuple for every route. The
+    offsets are the bytes of the "Begin route" line up to the end of the "End
+    of route" line."""
+    position = 0
+    name = None
+    start = None
+    for line in fileobj:
+        if name is None:
+            if "Begin route " in line:
+                name = line.split("Begin route ", 1)[1].strip()
+                start = position
+        elif "End of route {}".format(name) in line:
+            yield name, start, position + len(line)
+            name = None
+        position += len(line)
+    if name is not None:
+        yield name, start, position
+
+
 class RouteDirection:
     """Defines a RouteDirections Object to gather key information about
-    directions that is read from the generated directions text file."""
-    def __init__(self, Directions_file):
+    directions that is read from the generated directions text file.
+
+    By default every route is parsed into memory when the object is created.
+    With streaming set to True only the byte offsets of each route are kept
+    and a route is read from the file when it is asked for, so memory use
+    stays flat no matter how large the directions file is."""
+    def __init__(self, Directions_file, streaming=False):
         """Sets up the inital properties of the RouteDirections Object"""
+        self.path = Directions_file
+        self.streaming = streaming
         self.lines = None
+        self.routes = None
+        self.names = []
+        self.offsets = {}
         self.start = None
         self.end = None
+        self._cached = (None, None)
         self._setup(Directions_file)
 
     def _setup(self, Directions_file):
-        """Private function that reads the lines from the file and stores the
-        contents in the lines property of the object."""
-        read = open(Directions_file, "r")
-        self.lines = read.readlines()
-        read.close()
+        """Private function that reads the file in a single pass. In streaming
+        mode only the route offsets are stored in the offsets property,
+        otherwise the contents are stored in the lines property and the
+        directions of every stop are indexed by route name in the routes
+        property."""
+        if self.streaming:
+            read = open(Directions_file, "rb")
+            for name, start, end in _indexRoutes(read):
+                self.names.append(name)
+                self.offsets[name] = (start, end)
+            read.close()
+        else:
+            self.lines = []
+            self.routes = {}
+            read = open(Directions_file, "r")
+            for name, stops in _parseRoutes(self._readLines(read)):
+                self.names.append(name)
+                self.routes[name] = stops
+            read.close()
+
+    def _readLines(self, fileobj):
+        """Private generator that keeps each line read from the file in the
+        lines property while passing it on to the route parser."""
+        for line in fileobj:
+            self.lines.append(line)
+            yield line
+
+    def _readRoute(self, route):
+        """Private function that reads and parses a single route from the file
+        using its offsets. The last route read is kept so the pages of a route
+        do not read the file again."""
+        if self._cached[0] != route:
+            start, end = self.offsets[route]
+            read = open(self.path, "rb")
+            read.seek(start)
+            block = read.read(end - start).replace("\r\n", "\n")
+            read.close()
+            stops = dict(_parseRoutes(block.splitlines(True)))[route]
+            self._cached = (route, stops)
+        return self._cached[1]
+
+    def get(self, route, stop):
+        """Returns the directions text for a stop number of a route. Stop
+        numbers start at 1 for the first order visited on the route."""
+        return self.getRoute(route)[stop]
+
+    def getRoute(self, route):
+        """Returns a dictionary of {stop number: directions text} for a route."""
+        if self.streaming:
+            return self._readRoute(route)
+        return self.routes[route]
+
+    def getText(self, route):
+        """Returns the directions text of all the stops of a route in order"""
+        stops = self.getRoute(route)
+        return "".join([stops[stop] for stop in sorted(stops)])
+
+    def iterRoutes(self):
+        """Generator that yields a (route name, {stop number: directions text})
+        pair for each route in file order. In streaming mode the file is read
+        again and only one route is held in memory at a time."""
+        if self.streaming:
+            read = open(self.path, "r")
+            for name, stops in _parseRoutes(read):
+                yield name, stops
+            read.close()
+        else:
+            for name in self.names:
+                yield name, self.routes[name]
 
     def findStringPositions(self, name):
         """Finds the starting and end positions of the directions for each route
         (or route name) within the directions file. The values are set to the
-        properties of the object."""
+        properties of the object. Not available in streaming mode."""
         start = "Begin route {}".format(name)
         end = "End of route {}".format(name)
         linecount = 0
@@ -73,96 +371,1581 @@ class RouteDirection:
             return lineDict
 
 
+# Parsed directions are cached in a binary file next to the directions text:
+# a header with a magic line, the md5 of the text the cache was built from and
+# the offset and length of the index, then the stop texts of each route
+# compressed with zlib as one block, then the zlib compressed index. Stops
+# that share a line share its bytes. The index is binary: the distinct
+# arrival times, each route's name, block offset, block length and number of
+# stops, then for every stop the offset and length of its text in the
+# route's block and the number of its arrival time (0 for none).
+_CACHE_MAGIC = "VRPDIR2\n"
+_CACHE_HEADER = struct.Struct("<8s32sQQ")
+_CACHE_ROUTE = struct.Struct("<QII")
+_CACHE_STOP = struct.Struct("<IIH")
+_ARRIVE_TIME = re.compile(r"(\d{1,2}:\d{2}\s*[AP]M)\s*$")
+
+
+def _arriveTime(text):
+    """Private function that returns the time at the end of the "Arrive at"
+    line of a stop's directions, or None if the line has no time."""
+    for line in text.splitlines():
+        if "Arrive at" in line:
+            match = _ARRIVE_TIME.search(line)
+            if match:
+                return match.group(1)
+    return None
+
+
+def _readCacheHeader(path):
+    """Private function that returns the source hash, index offset and index
+    length of a directions cache, or None if the file is not a directions
+    cache."""
+    try:
+        read = open(path, "rb")
+    except IOError:
+        return None
+    header = read.read(_CACHE_HEADER.size)
+    read.close()
+    if len(header) < _CACHE_HEADER.size:
+        return None
+    magic, source_hash, index_offset, index_length = _CACHE_HEADER.unpack(header)
+    if magic != _CACHE_MAGIC or index_offset == 0:
+        return None
+    return source_hash, index_offset, index_length
+
+
+def _packString(text):
+    """Private function that packs a string after its length."""
+    return struct.pack("<H", len(text)) + text
+
+
+def writeDirectionsCache(directions_file, cache_path, source_hash=None):
+    """Parses a directions text file once and writes its stops to a
+    directions cache. Each route's stops are compressed and written as soon
+    as the route is parsed, so only one route is held in memory, and the
+    index is written after the last route. The cache is written to a
+    temporary file first so a failed run never leaves half a cache behind."""
+    if source_hash == None:
+        source_hash = hashFile(directions_file)
+    arrivals = {None: 0}
+    routes = io.BytesIO()
+    stops = io.BytesIO()
+    route_count = 0
+    temp_path = cache_path + ".tmp"
+    out = open(temp_path, "wb")
+    # the index offset stays 0 until the cache is complete
+    out.write(_CACHE_HEADER.pack(_CACHE_MAGIC, source_hash, 0, 0))
+    read = open(directions_file, "r")
+    for name, route_stops in _parseRoutes(read):
+        texts = []
+        offset = 0
+        last_line = ""
+        for stop in sorted(route_stops):
+            text = route_stops[stop]
+            # a stop starts with the last line of the stop before it, which
+            # is already written, so the two stops share that line
+            shared = 0
+            if last_line and text.startswith(last_line):
+                shared = len(last_line)
+            arrive = _arriveTime(text)
+            if arrive not in arrivals:
+                arrivals[arrive] = len(arrivals)
+            stops.write(_CACHE_STOP.pack(offset - shared, len(text), arrivals[arrive]))
+            texts.append(text[shared:])
+            offset += len(text) - shared
+            last_line = text.splitlines(True)[-1] if text else ""
+        block = zlib.compress("".join(texts))
+        routes.write(_packString(name) + _CACHE_ROUTE.pack(out.tell(), len(block), len(texts)))
+        out.write(block)
+        route_count += 1
+    read.close()
+    times = [arrive for arrive in sorted(arrivals, key=arrivals.get) if arrive != None]
+    index_offset = out.tell()
+    compressor = zlib.compressobj()
+    out.write(compressor.compress(struct.pack("<H", len(times)) + \
+              "".join(map(_packString, times)) + struct.pack("<I", route_count)))
+    for part in (routes, stops):
+        part.seek(0)
+        block = part.read(1048576)
+        while block:
+            out.write(compressor.compress(block))
+            block = part.read(1048576)
+        part.close()
+    out.write(compressor.flush())
+    index_length = out.tell() - index_offset
+    out.seek(0)
+    out.write(_CACHE_HEADER.pack(_CACHE_MAGIC, source_hash, index_offset, index_length))
+    out.close()
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    os.rename(temp_path, cache_path)
+    return cache_path
+
+
+def cacheDirections(directions_file, cache_path=None):
+    """Returns the path of the directions cache of a directions text file,
+    building it only if there is no cache of the same text. The cache is
+    saved next to the text file with a .dircache extension unless a path is
+    given."""
+    if cache_path == None:
+        cache_path = os.path.splitext(directions_file)[0] + ".dircache"
+    source_hash = hashFile(directions_file)
+    header = _readCacheHeader(cache_path)
+    if header != None and header[0] == source_hash:
+        stats.count("directions cache hits")
+        return cache_path
+    with stats.stage("parse directions"):
+        return writeDirectionsCache(directions_file, cache_path, source_hash)
+
+
+class DirectionsCache:
+    """Reads the parsed directions saved by cacheDirections. Only the index
+    of route names, offsets and arrival times is read when the cache is
+    opened. The stop texts are memory mapped and decompressed a route at a
+    time when asked for, so parallel workers share the same pages of the
+    file. Has the same get, getRoute, getText and iterRoutes methods as a
+    RouteDirection."""
+    def __init__(self, cache_path):
+        """Opens the cache and reads its index"""
+        header = _readCacheHeader(cache_path)
+        if header == None:
+            raise ValueError("{0} is not a directions cache.".format(cache_path))
+        self.path = cache_path
+        self.source_hash, index_offset, index_length = header
+        self._file = open(cache_path, "rb")
+        self._file.seek(index_offset)
+        index = zlib.decompress(self._file.read(index_length))
+        position = 2
+        self._times = [None]
+        for number in range(struct.unpack_from("<H", index)[0]):
+            length = struct.unpack_from("<H", index, position)[0]
+            self._times.append(index[position + 2:position + 2 + length])
+            position += 2 + length
+        route_count = struct.unpack_from("<I", index, position)[0]
+        position += 4
+        self.names = []
+        self._routes = {}
+        first_stop = 0
+        for number in range(route_count):
+            length = struct.unpack_from("<H", index, position)[0]
+            name = index[position + 2:position + 2 + length]
+            position += 2 + length
+            block_offset, block_length, stop_count = _CACHE_ROUTE.unpack_from(index, position)
+            position += _CACHE_ROUTE.size
+            self.names.append(name)
+            self._routes[name] = (block_offset, block_length, first_stop, stop_count)
+            first_stop += stop_count
+        # the stop entries are unpacked from the index only when a route is read
+        self._stops = buffer(index, position)
+        self._cached = (None, None)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _entries(self, route):
+        """Private function that returns the (offset, length, arrival number)
+        of each stop of a route."""
+        first_stop, stop_count = self._routes[route][2:]
+        return [_CACHE_STOP.unpack_from(self._stops, (first_stop + stop) * _CACHE_STOP.size) \
+                for stop in range(stop_count)]
+
+    def _block(self, route):
+        """Private function that returns the decompressed stop texts of a
+        route. The last route read is kept."""
+        if self._cached[0] != route:
+            block_offset, block_length = self._routes[route][:2]
+            self._cached = (route, zlib.decompress(self._map[block_offset:block_offset + block_length]))
+        return self._cached[1]
+
+    def get(self, route, stop):
+        """Returns the directions text for a stop number of a route. Stop
+        numbers start at 1 for the first order visited on the route."""
+        offset, length, arrive = self._entries(route)[stop - 1]
+        return self._block(route)[offset:offset + length]
+
+    def getRoute(self, route):
+        """Returns a dictionary of {stop number: directions text} for a route."""
+        block = self._block(route)
+        stops = {}
+        for stop, entry in enumerate(self._entries(route)):
+            stops[stop + 1] = block[entry[0]:entry[0] + entry[1]]
+        return stops
+
+    def getText(self, route):
+        """Returns the directions text of all the stops of a route in order"""
+        block = self._block(route)
+        return "".join([block[entry[0]:entry[0] + entry[1]] for entry in self._entries(route)])
+
+    def arrivals(self, route):
+        """Returns a dictionary of {stop number: arrival time} for a route,
+        taken from the "Arrive at" lines. Times are strings such as
+        "8:12 AM", or None where the line had no time."""
+        return dict([(stop + 1, self._times[entry[2]]) for stop, entry in enumerate(self._entries(route))])
+
+    def iterRoutes(self):
+        """Generator that yields a (route name, {stop number: directions text})
+        pair for each route in file order."""
+        for name in self.names:
+            yield name, self.getRoute(name)
+
+    def close(self):
+        """Releases the mapped file."""
+        if self._map != None:
+            self._map.close()
+            self._map = None
+        self._cached = (None, None)
+        self._file.close()
+
+
+def openDirections(path):
+    """Returns a DirectionsCache for a directions cache and a streaming
+    RouteDirection for a directions text file."""
+    if _readCacheHeader(path) != None:
+        return DirectionsCache(path)
+    return RouteDirection(path, streaming=True)
+
+
+
+@timed("hash file")
+def hashFile(path):
+    """Returns the md5 hash of a file's contents, read in blocks."""
+    md5 = hashlib.md5()
+    read = open(path, "rb")
+    block = read.read(1048576)
+    while block:
+        md5.update(block)
+        block = read.read(1048576)
+    read.close()
+    return md5.hexdigest()
+
+
+def hashRoute(stops, directions_text, template_hash, date):
+    """Returns a hash of everything a route's outputs are built from: its
+    ordered stops, its directions text, the template map and the date used in
+    the output names."""
+    md5 = hashlib.md5()
+    md5.update(json.dumps([stops, directions_text, template_hash, date]))
+    return md5.hexdigest()
+
+
+class RouteManifest:
+    """Keeps the input hash of every route that was fully built and uploaded
+    in a JSON manifest in the output folder, so later runs can skip routes
+    whose inputs have not changed."""
+    def __init__(self, folder, name="route_manifest.json"):
+        """Loads the manifest from the folder if it exists"""
+        self.path = os.path.join(folder, name)
+        self.routes = {}
+        if os.path.exists(self.path):
+            read = open(self.path, "r")
+            try:
+                self.routes = json.load(read)
+            except ValueError:
+                arcpy.AddWarning("Unable to read {}. Rebuilding all routes.".format(self.path))
+            read.close()
+
+    def changed(self, route, route_hash):
+        """Returns True if the route was not built before with the same hash"""
+        return self.routes.get(route, {}).get('hash') != route_hash
+
+    def update(self, route, route_hash, outputs=None):
+        """Records the hash of a route that was built and uploaded, with an
+        optional dictionary describing its outputs."""
+        self.routes[route] = {'hash': route_hash, 'outputs': outputs or {}}
+
+    def save(self):
+        """Writes the manifest to the output folder"""
+        out = open(self.path, "w")
+        json.dump(self.routes, out, indent=2, sort_keys=True)
+        out.close()
+
+
+class ArcpyPDFBook:
+    """Builds a mapbook PDF with arcpy.mapping. Each exported page is appended
+    as soon as it is exported and the book is written when saved."""
+    def __init__(self, path):
+        """Creates the empty PDF document"""
+        self.path = path
+        self.pdf = arcpy.mapping.PDFDocumentCreate(path)
+
+    def addPage(self, page_file):
+        """Appends the pages of an exported PDF file to the book"""
+        self.pdf.appendPages(page_file)
+
+    def save(self):
+        """Saves the book to its path"""
+        self.pdf.saveAndClose()
+        del self.pdf
+
+
+class MemoryPDFBook:
+    """Builds a mapbook PDF in memory with the optional PyPDF2 module. Pages
+    are read into memory as they are added and the book is written to its
+    path in a single write when saved."""
+    def __init__(self, path):
+        """Creates the empty PDF writer"""
+        if PyPDF2 is None:
+            raise ImportError("MemoryPDFBook requires the PyPDF2 module.")
+        self.path = path
+        self.writer = PyPDF2.PdfFileWriter()
+        self._pages = []
+
+    def addPage(self, page_file):
+        """Reads an exported PDF file into memory and adds its pages to the
+        book. The file can be overwritten once this returns."""
+        read = open(page_file, "rb")
+        data = io.BytesIO(read.read())
+        read.close()
+        # PyPDF2 reads page content from the stream when the book is written
+        self._pages.append(data)
+        for page in PyPDF2.PdfFileReader(data).pages:
+            self.writer.addPage(page)
+
+    def save(self):
+        """Writes the book to its path"""
+        book = io.BytesIO()
+        self.writer.write(book)
+        out = open(self.path, "wb")
+        out.write(book.getvalue())
+        out.close()
+        self._pages = []
+
+
+class PageTemplate:
+    """Holds the parts of a map document a mapbook page changes. The data
+    frame and the text elements are looked up once, the first time they are
+    asked for, and kept for every page after. Text elements
+    are found by name in a single ListLayoutElements call. widths holds
+    the {element name: width} of text elements whose width is fixed;
+    ArcMap resizes a text element when its text changes, so the width is
+    applied again each time setText changes the text."""
+    def __init__(self, mxd, widths=None, scale_offset=2000):
+        """Stores the map document, the fixed element widths and the amount
+        the scale is zoomed out past each page's extent"""
+        self.mxd = mxd
+        self.widths = widths or {}
+        self.scale_offset = scale_offset
+        self._df = None
+        self._elements = None
+        self._text = {}
+
+    @property
+    def df(self):
+        """The first data frame of the map document"""
+        if self._df is None:
+            self._df = arcpy.mapping.ListDataFrames(self.mxd)[0]
+        return self._df
+
+    def element(self, name):
+        """Returns the text element with the given name"""
+        if self._elements is None:
+            self._elements = {}
+            for element in arcpy.mapping.ListLayoutElements(self.mxd, "TEXT_ELEMENT"):
+                self._elements.setdefault(element.name, element)
+        if name not in self._elements:
+            # elements the first listing did not return are looked up by name
+            self._elements[name] = arcpy.mapping.ListLayoutElements(self.mxd, \
+                                   "TEXT_ELEMENT", name)[0]
+        return self._elements[name]
+
+    def setText(self, name, text):
+        """Sets the text of a text element, skipping the write if the element
+        already shows that text"""
+        if self._text.get(name) == text:
+            return
+        element = self.element(name)
+        element.text = text
+        if name in self.widths:
+            element.elementWidth = self.widths[name]
+        self._text[name] = text
+
+    def setExtent(self, xmin, ymin, xmax, ymax):
+        """Frames a page's extent and zooms out by the scale offset"""
+        df = self.df
+        df.extent = arcpy.Extent(xmin, ymin, xmax, ymax)
+        df.scale = df.scale + self.scale_offset
+
+    def export(self, page_name):
+        """Exports the page layout to a PDF file"""
+        arcpy.mapping.ExportToPDF(self.mxd, page_name, "PAGE_LAYOUT")
+
+
+class MapbookRenderer:
+    """Renders the pages of each inspector's mapbook from a copy of the template
+    map document. Page extents and order names come from a
+    RouteStops.RouteStopTable, so no selections or cursors are needed per
+    page. Pages are exported to a single scratch file in the local temp
+    folder and added to the book straight away, and the finished book is
+    moved to the output folder in one write. pdf_book is the class used to
+    build the book, ArcpyPDFBook or MemoryPDFBook. Any object with the same
+    renderRoute and close methods can be used by buildMapbooks in its
+    place."""
+    def __init__(self, map_document, directions_file, temp_folder, stop_table, \
+                 pdf_book=ArcpyPDFBook):
+        """Opens the map document and sets up the page template that keeps
+        its data frame and text elements for every page."""
+        self.mxd = arcpy.mapping.MapDocument(map_document)
+        self.page = PageTemplate(self.mxd, {"directions": 3.25})
+        self.directions = openDirections(directions_file)
+        self.temp_folder = temp_folder
+        self.stop_table = stop_table
+        self.pdf_book = pdf_book
+
+    def renderRoute(self, Name, pdf_path):
+        """Builds the mapbook PDF for a route with one page per order and
+        returns the number of pages."""
+        page = self.page
+        book_path = os.path.join(self.temp_folder, os.path.basename(pdf_path))
+        page_name = os.path.join(self.temp_folder, "page.pdf")
+        pdf = self.pdf_book(book_path)
+        count = self.stop_table.count(Name)
+        # start page build
+        for index in range(count):
+            # frame the order and the stop before it
+            page.setExtent(*self.stop_table.pageExtent(Name, index))
+            # Find directions for inspector for select order and update map
+            page.setText("directions", self.directions.get(Name, index + 1))
+            page.setText("inspection", self.stop_table.stop(Name, index)[1])
+            # Export map and apped it to main route book pdf
+            page.export(page_name)
+            pdf.addPage(page_name)
+        pdf.save()
+        del pdf
+        if os.path.exists(page_name):
+            os.remove(page_name)
+        # move the finished book to the output folder in one write
+        if os.path.exists(pdf_path):
+            os.remove(pdf_path)
+        shutil.move(book_path, pdf_path)
+        return count
+
+    def close(self):
+        """Releases the map document and the directions. A memory mapped
+        directions cache keeps its file locked on Windows until closed."""
+        if hasattr(self.directions, 'close'):
+            self.directions.close()
+        del self.page, self.mxd
+
+
+class MapbookRendererFactory:
+    """Creates a MapbookRenderer for a worker. The template map document is
+    saved as a copy in the worker's temp folder so that no two workers share
+    a map document."""
+    def __init__(self, map_document, directions_file, stop_table, pdf_book=ArcpyPDFBook):
+        """Stores the paths of the template map document and directions file
+        or directions cache, the route stop table and the class used to build the books"""
+        self.map_document = map_document
+        self.directions_file = directions_file
+        self.stop_table = stop_table
+        self.pdf_book = pdf_book
+
+    def __call__(self, temp_folder):
+        """Returns a renderer that works on its own copy of the template"""
+        worker_mxd = os.path.join(temp_folder, os.path.basename(self.map_document))
+        template = arcpy.mapping.MapDocument(self.map_document)
+        template.saveACopy(worker_mxd)
+        del template
+        return MapbookRenderer(worker_mxd, self.directions_file, temp_folder, \
+                               self.stop_table, self.pdf_book)
+
+
+_worker_renderer = None
+
+def _startWorker(renderer_factory, temp_folder):
+    """Private function that sets up the renderer of a pool worker process in
+    its own temp folder."""
+    global _worker_renderer
+    worker_folder = os.path.join(temp_folder, "worker_{}".format(os.getpid()))
+    if not os.path.exists(worker_folder):
+        os.makedirs(worker_folder)
+    _worker_renderer = renderer_factory(worker_folder)
+
+
+def _renderJob(job, renderer=None):
+    """Private function that renders one (route name, pdf path, profile path)
+    job and returns a dictionary describing the result, including the time it
+    took. If the profile path is not None the route is run under cProfile and
+    the profile saved there. Errors are returned rather than raised so one
+    route can not stop the other routes from being built."""
+    if renderer is None:
+        renderer = _worker_renderer
+    name, pdf_path, profile_path = job
+    result = {'name': name, 'pdf': pdf_path, 'pages': 0, 'error': None, 'seconds': 0.0}
+    start = time.time()
+    try:
+        if profile_path != None:
+            profiler = cProfile.Profile()
+            result['pages'] = profiler.runcall(renderer.renderRoute, name, pdf_path)
+            profiler.dump_stats(profile_path)
+        else:
+            result['pages'] = renderer.renderRoute(name, pdf_path)
+    except:
+        tb = sys.exc_info()[2]
+        tbinfo = traceback.format_tb(tb)[0]
+        result['error'] = "Traceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
+    result['seconds'] = time.time() - start
+    return result
+
+
+def _solveShard(job):
+    """Private function that solves one shard of a VRP in its own VRP layer.
+    job is a dictionary of the network, impedance, time units, the shard's
+    name, its orders, depots and routes inputs, the folder for its layer
+    file and directions and the geodatabase its solved Orders and Routes
+    are copied to. Returns a dictionary of the output paths, the time the
+    solve took and any error, which is returned rather than raised so the
+    other shards still finish."""
+    name = job['name']
+    result = {'name': name, 'error': None, 'seconds': 0.0,
+              'layer': os.path.join(job['folder'], name + ".lyr"),
+              'directions': os.path.join(job['folder'], name + "_directions.txt"),
+              'orders': os.path.join(job['gdb'], name + "_Orders"),
+              'routes': os.path.join(job['gdb'], name + "_Routes")}
+    start = time.time()
+    try:
+        arcpy.CheckOutExtension("Network")
+        layer = arcpy.na.MakeVehicleRoutingProblemLayer(job['network'], name, \
+                job['impedance'], time_units=job['time_units'], \
+                output_path_shape="TRUE_LINES_WITHOUT_MEASURES").getOutput(0)
+        class_names = arcpy.na.GetNAClassNames(layer)
+        for sublayer, locations in (("Orders", job['orders']), ("Depots", job['depots']), \
+                                    ("Routes", job['routes'])):
+            arcpy.na.AddLocations(layer, class_names[sublayer], locations)
+        arcpy.na.Solve(layer)
+        arcpy.SaveToLayerFile_management(layer, result['layer'], "RELATIVE")
+        arcpy.Directions_na(layer, "TEXT", result['directions'], "MILES", "REPORT_TIME")
+        for sublayer in ("Orders", "Routes"):
+            solved = arcpy.mapping.ListLayers(layer, class_names[sublayer])[0]
+            arcpy.CopyFeatures_management(solved, result[sublayer.lower()])
+    except:
+        tb = sys.exc_info()[2]
+        tbinfo = traceback.format_tb(tb)[0]
+        result['error'] = "Traceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
+        if isinstance(sys.exc_info()[1], arcpy.ExecuteError):
+            result['error'] += "\n" + arcpy.GetMessages(2)
+    result['seconds'] = time.time() - start
+    return result
+
+
+def _workerPool(pool_size, initializer=None, initargs=()):
+    """Private function that starts a pool of worker processes. Inside ArcMap
+    sys.executable is ArcMap.exe, so workers need the python executable set
+    explicitly."""
+    if not os.path.basename(sys.executable).lower().startswith("python"):
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, "pythonw.exe"))
+    return multiprocessing.Pool(pool_size, initializer, initargs)
+
+
+def solveShards(jobs, pool_size=1):
+    """Solves every shard job with _solveShard and returns the results in
+    the order of the jobs. With a pool_size greater than 1 the shards are
+    solved in that many worker processes, each with its own Network Analyst
+    license and VRP layer."""
+    if pool_size <= 1 or len(jobs) <= 1:
+        results = [_solveShard(job) for job in jobs]
+    else:
+        pool = _workerPool(min(pool_size, len(jobs)))
+        try:
+            results = pool.map(_solveShard, jobs, 1)
+        finally:
+            pool.close()
+            pool.join()
+    for result in results:
+        stats.record("solve shard", result['seconds'])
+    return results
+
+
+def buildMapbooks(jobs, renderer_factory, temp_folder, pool_size=1, run_stats=None):
+    """Renders the mapbook of every (route name, pdf path) job and returns a
+    list of result dictionaries in the same order as the jobs. With a
+    pool_size greater than 1 the routes are split across that many worker
+    processes, each with its own renderer and temp folder. renderer_factory
+    must be picklable and is called with the worker's temp folder. If
+    run_stats is given each route's time and pages are recorded in it, and
+    its profile route is run under cProfile."""
+    order = dict([(job[0], index) for index, job in enumerate(jobs)])
+    results = list(iterMapbooks(jobs, renderer_factory, temp_folder, pool_size, run_stats))
+    return sorted(results, key=lambda result: order[result['name']])
+
+
+def iterMapbooks(jobs, renderer_factory, temp_folder, pool_size=1, run_stats=None, max_ahead=None):
+    """Renders the mapbooks like buildMapbooks but yields each result as soon
+    as its book is saved, in the order they finish, so the next stage can
+    start on a route while the others render. No more than max_ahead
+    (default twice the pool size) books are rendered ahead of the ones taken
+    from the generator, so a slow consumer holds the workers back."""
+    run_stats = run_stats or stats
+    jobs = [(name, pdf_path, run_stats.profilePath(name)) for name, pdf_path in jobs]
+    if not os.path.exists(temp_folder):
+        os.makedirs(temp_folder)
+    if pool_size <= 1 or len(jobs) <= 1:
+        worker_folder = os.path.join(temp_folder, "worker_0")
+        if not os.path.exists(worker_folder):
+            os.makedirs(worker_folder)
+        renderer = renderer_factory(worker_folder)
+        try:
+            for job in jobs:
+                yield _recordMapbook(run_stats, _renderJob(job, renderer))
+        finally:
+            renderer.close()
+        return
+
+    pool_size = min(pool_size, len(jobs))
+    pool = _workerPool(pool_size, _startWorker, (renderer_factory, temp_folder))
+    done = Queue.Queue()
+    waiting = list(reversed(jobs))
+    running = 0
+    try:
+        while waiting or running:
+            while waiting and running < (max_ahead or pool_size * 2):
+                pool.apply_async(_renderJob, (waiting.pop(),), callback=done.put)
+                running += 1
+            result = done.get()
+            running -= 1
+            yield _recordMapbook(run_stats, result)
+    finally:
+        # stop the workers straight away if the consumer gave up early
+        if waiting or running:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+
+
+def _recordMapbook(run_stats, result):
+    """Private function that records the time and pages of a rendered route
+    and returns its result."""
+    run_stats.record("render mapbook", result['seconds'], result['name'])
+    run_stats.count("pages", result['pages'], result['name'])
+    return result
+
+
+# ArcGIS Online endpoints, which can be pointed at a local server that
+# imitates them
+AGOL_URL = "http://www.arcgis.com/sharing/rest"
+TOKEN_URL = "https://www.arcgis.com/sharing/generateToken"
+
+class TokenManager:
+    """Generates ArcGIS Online tokens and keeps one valid for the whole run.
+    The token is refreshed refresh_margin seconds before it expires, and an
+    AGOLSession given the manager swaps the current token into every request
+    and retries a request once with a new token when it is rejected as
+    invalid or expired (error 498 or 499). It can be shared by the upload
+    threads. If cache_path is given the token is saved there and reused by
+    later runs until it is close to expiring. The token is a password for
+    the account until it expires, so the cache belongs in a folder only the
+    user can read, such as the one tokenCachePath returns, never in a shared
+    output folder."""
+    def __init__(self, username, password, referer, token_url=None, expiration=120, \
+                 refresh_margin=300, cache_path=None):
+        """Stores the credentials. expiration is the lifetime to ask for in
+        minutes and token_url defaults to TOKEN_URL."""
+        self.username = username
+        self.password = password
+        self.referer = referer
+        self.token_url = token_url or TOKEN_URL
+        self.expiration = expiration
+        self.refresh_margin = refresh_margin
+        self.cache_path = cache_path
+        self.token = None
+        self.expires = 0
+        self.refreshes = 0
+        self._lock = threading.RLock()
+
+    def _valid(self):
+        """Private function that returns True if the token is not close to
+        expiring."""
+        return self.token != None and time.time() < self.expires - self.refresh_margin
+
+    def load(self):
+        """Returns a status with a valid token, from memory or the cache if
+        there is one, otherwise the generateToken response. The response has
+        an 'error' instead of a 'token' if the token could not be made."""
+        with self._lock:
+            if not self._valid():
+                self._readCache()
+            if self._valid():
+                return {'token': self.token, 'expires': int(self.expires * 1000)}
+            return self._generate()
+
+    def get(self):
+        """Returns a valid token, generating a new one if needed. Raises
+        RuntimeError if the token can not be generated."""
+        with self._lock:
+            if self._valid():
+                return self.token
+            status = self.load()
+            if 'token' not in status:
+                raise RuntimeError("Failed to generate token: {0}".format(\
+                                   status.get('error', {}).get('message')))
+            return status['token']
+
+    def refresh(self, stale_token=None):
+        """Replaces a token that was rejected and returns the new one. If
+        another thread has already replaced stale_token its replacement is
+        returned without asking for another."""
+        with self._lock:
+            if stale_token != None and stale_token != self.token and self._valid():
+                return self.token
+            self.token = None
+            status = self._generate()
+            if 'token' not in status:
+                raise RuntimeError("Failed to refresh token: {0}".format(\
+                                   status.get('error', {}).get('message')))
+            return status['token']
+
+    def _generate(self):
+        """Private function that asks for a new token and returns the
+        generateToken response."""
+        token_params = {'username': self.username,
+                        'password': self.password,
+                        'referer': self.referer,
+                        'expiration': self.expiration,
+                        'f': 'json'}
+        token_response = requests.post(self.token_url, params=token_params)
+        token_status = json.loads(token_response.text)
+        if 'token' in token_status:
+            self.token = token_status['token']
+            if 'expires' in token_status:
+                self.expires = token_status['expires'] / 1000.0
+            else:
+                self.expires = time.time() + self.expiration * 60
+            self.refreshes += 1
+            self._writeCache()
+        return token_status
+
+    def _cacheKey(self):
+        """Private function that returns what a cached token must match."""
+        return [self.username, self.referer, self.token_url]
+
+    def _readCache(self):
+        """Private function that loads the cached token if it belongs to the
+        same user and server."""
+        if self.cache_path == None or not os.path.exists(self.cache_path):
+            return
+        try:
+            read = open(self.cache_path, "r")
+            try:
+                cached = json.load(read)
+            finally:
+                read.close()
+        except (IOError, ValueError):
+            return
+        if cached.get('key') == self._cacheKey():
+            self.token = cached.get('token')
+            self.expires = cached.get('expires', 0)
+
+    def _writeCache(self):
+        """Private function that saves the token to the cache. Outside
+        Windows the file is also made readable by the owner only; on Windows
+        the per-user folder's permissions protect it."""
+        if self.cache_path == None:
+            return
+        temp_path = self.cache_path + ".tmp"
+        out = open(temp_path, "w")
+        json.dump({'key': self._cacheKey(), 'token': self.token, \
+                   'expires': self.expires}, out)
+        out.close()
+        try:
+            os.chmod(temp_path, 0600)
+        except OSError:
+            pass
+        if os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+        os.rename(temp_path, self.cache_path)
+
+
+def tokenCachePath(name="token_cache.json"):
+    """Returns the path of the token cache in the user's own application
+    data folder, %LOCALAPPDATA%\\VRPS on Windows and ~/.vrps elsewhere, and
+    creates the folder if needed."""
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("APPDATA")
+    if base:
+        folder = os.path.join(base, "VRPS")
+    else:
+        folder = os.path.join(os.path.expanduser("~"), ".vrps")
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+        try:
+            os.chmod(folder, 0700)
+        except OSError:
+            pass
+    return os.path.join(folder, name)
+
+
+def _errorCode(response):
+    """Private function that returns the code of the JSON error in a
+    response, or None if it is not an error."""
+    if 'error' not in response.text[:64]:
+        return None
+    try:
+        return json.loads(response.text).get('error', {}).get('code')
+    except (ValueError, AttributeError):
+        return None
+
+
+def _tokenError(response):
+    """Private function that returns True if a response is an invalid or
+    expired token error."""
+    return response.status_code in (498, 499) or _errorCode(response) in (498, 499)
 
-def uploadPublish(routeid, date, folder, layer, where, username, token):
+
+# Status and error codes of requests the server turned away because it is
+# busy, which are safe to send again after a pause
+THROTTLE_CODES = (429, 503)
+# Status codes of requests that failed on the server and may or may not have
+# been carried out
+RETRY_CODES = (500, 502, 504)
+
+# requests 2.4 and later tell a connection that was never made apart from
+# other timeouts, older versions only raise ConnectionError and Timeout
+_CONNECT_TIMEOUT = getattr(requests.exceptions, 'ConnectTimeout', ())
+
+class _StatusResponse:
+    """Private stand-in for a response, returned when a request that may
+    have been carried out turns out to have been."""
+    status_code = 200
+
+    def __init__(self, status):
+        self.text = json.dumps(status)
+
+
+class AGOLSession:
+    """Sends all ArcGIS Online requests through one pooled HTTP session so
+    connections are reused, and limits how many requests are in flight at
+    once when uploads run on several threads. With a TokenManager the
+    current token is sent with every request whatever token the caller
+    passed, and a request rejected for its token is sent again once with a
+    new token.
+
+    Requests that are throttled, fail on the server or lose their connection
+    are sent again up to retries times, waiting with exponential backoff and
+    jitter or for as long as the server's Retry-After asks. A throttled
+    request pauses every thread using the session. max_rate caps the
+    requests per second sent by all threads together. Requests that create
+    something (addItem, publish) are only sent again when the server
+    certainly did not carry them out, unless a lookup is given that finds
+    what the first attempt made."""
+    def __init__(self, base_url=None, max_requests=4, tokens=None, retries=4, \
+                 backoff=1.0, max_backoff=60.0, max_rate=None):
+        """Sets up the pooled session. base_url defaults to AGOL_URL and can
+        point at a local server that imitates the sharing/rest endpoints."""
+        self.base_url = (base_url or AGOL_URL).rstrip("/")
+        self.tokens = tokens
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, \
+                                                pool_maxsize=max_requests)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(max_requests)
+        self._rate_lock = threading.Lock()
+        self._next_send = 0.0
+
+    def url(self, path, *args):
+        """Returns the full url of a sharing/rest path formatted with args"""
+        return "{0}/{1}".format(self.base_url, path.format(*args))
+
+    def post(self, url, lookup=None, idempotent=True, **kwargs):
+        """Posts to the url once a request slot is free and returns the
+        response. Set idempotent to False for requests that create an item.
+        lookup is called before such a request is sent again and should
+        return the JSON status the request would have returned if it finds
+        that the request was carried out, or None."""
+        # remember where file objects start so they can be sent again
+        files = [upload[1] for upload in (kwargs.get('files') or {}).values() \
+                 if isinstance(upload, tuple) and hasattr(upload[1], 'seek')]
+        positions = [upload.tell() for upload in files]
+        def rewind():
+            for upload, position in zip(files, positions):
+                upload.seek(position)
+
+        token_args = [kwargs[key] for key in ('params', 'data') \
+                      if isinstance(kwargs.get(key), dict) and 'token' in kwargs[key]]
+        if self.tokens == None or not token_args:
+            return self._send(url, kwargs, rewind, lookup, idempotent)
+        token = self.tokens.get()
+        for args in token_args:
+            args['token'] = token
+        response = self._send(url, kwargs, rewind, lookup, idempotent)
+        if not _tokenError(response):
+            return response
+        stats.count("token refreshes")
+        token = self.tokens.refresh(token)
+        for args in token_args:
+            args['token'] = token
+        rewind()
+        return self._send(url, kwargs, rewind, lookup, idempotent)
+
+    def _send(self, url, kwargs, rewind, lookup, idempotent):
+        """Private function that sends a request, and sends it again while it
+        can be retried."""
+        attempt = 0
+        while True:
+            self._waitToSend()
+            self._slots.acquire()
+            stats.count("requests")
+            try:
+                response = self.session.post(url, **kwargs)
+                error = None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                response = None
+                error = sys.exc_info()
+            finally:
+                self._slots.release()
+
+            retry, carried_out, wait = self._retryable(response, error)
+            if retry and attempt < self.retries and carried_out and not idempotent:
+                status = lookup() if lookup != None else None
+                if status != None:
+                    stats.count("duplicates avoided")
+                    return _StatusResponse(status)
+                retry = lookup != None
+            if not retry or attempt >= self.retries:
+                if error != None:
+                    raise error[0], error[1], error[2]
+                return response
+
+            attempt += 1
+            stats.count("retries")
+            delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+            delay = max(wait, delay / 2 + random.uniform(0, delay / 2))
+            if wait:
+                # the server is busy, hold back every thread
+                self._holdUntil(time.time() + delay)
+            time.sleep(delay)
+            rewind()
+
+    def _retryable(self, response, error):
+        """Private function that returns whether a request can be sent again,
+        whether the server may have carried it out and how long the server
+        asked to wait."""
+        if error != None:
+            return True, not isinstance(error[1], _CONNECT_TIMEOUT), 0
+        try:
+            wait = float(response.headers.get('Retry-After', 0))
+        except (TypeError, ValueError, AttributeError):
+            wait = 0
+        if response.status_code in THROTTLE_CODES or _errorCode(response) in THROTTLE_CODES:
+            stats.count("throttled")
+            return True, False, wait
+        if response.status_code in RETRY_CODES:
+            return True, True, wait
+        return False, False, 0
+
+    def _waitToSend(self):
+        """Private function that waits until the rate cap allows another
+        request."""
+        with self._rate_lock:
+            now = time.time()
+            send_at = max(now, self._next_send)
+            self._next_send = send_at + self.min_interval
+        if send_at > now:
+            time.sleep(send_at - now)
+
+    def _holdUntil(self, until):
+        """Private function that stops every thread sending until a time."""
+        with self._rate_lock:
+            self._next_send = max(self._next_send, until)
+
+    def findItem(self, username, token, title, item_type, tag):
+        """Returns the user's item with exactly this title and type that
+        carries the tag, or None. The user's content is listed rather than
+        searched, since the search index can lag behind items that were
+        just added."""
+        start = 1
+        while start > 0:
+            content_params = {'start': start, 'num': 100, 'f': 'json', 'token': token}
+            content_response = self.post(self.url("content/users/{0}", username), \
+                                         params=content_params)
+            content = json.loads(content_response.text)
+            for item in content.get('items', []):
+                if item.get('title') == title and item.get('type') == item_type and \
+                   tag in (item.get('tags') or []):
+                    return item
+            start = content.get('nextStart', -1)
+
+    def findService(self, username, token, item_id):
+        """Returns the feature service published from an item, or None."""
+        related_params = {'relationshipType': 'Service2Data', 'direction': 'reverse',
+                          'f': 'json', 'token': token}
+        related_response = self.post(self.url("content/items/{0}/relatedItems", item_id), \
+                                     params=related_params)
+        for item in json.loads(related_response.text).get('relatedItems', []):
+            if item.get('type') == "Feature Service":
+                return item
+
+
+def requestTag():
+    """Returns a tag that is unique to one request. Items are added with it
+    so a lost addItem response can be matched to the item it made, and not
+    to an item with the same title from an earlier run. The tag is removed
+    with _clearRequestTag once the item is added."""
+    return "vrps-" + uuid.uuid4().hex
+
+
+def _clearRequestTag(session, username, token, item_id):
+    """Private function that removes the request tag from an item once it
+    has been added, so it does not show in the user's content. A failure is
+    only a warning."""
+    try:
+        update_url = session.url("content/users/{0}/items/{1}/update", username, item_id)
+        update_params = {'tags': "", 'clearEmptyFields': 'true', 'f': 'json', 'token': token}
+        update_status = json.loads(session.post(update_url, params=update_params).text)
+        if update_status.get('success') != True:
+            raise ValueError(update_status.get('error', {}).get('message'))
+    except:
+        _addMessage("AddWarning", "\t\tUnable to remove the request tag from item {0}: {1}".format(\
+                    item_id, sys.exc_info()[1]))
+
+
+def _addedItem(session, username, token, title, item_type, tag):
+    """Private function that returns the addItem status of the item added
+    with the title, type and request tag, or None."""
+    item = session.findItem(username, token, title, item_type, tag)
+    if item != None:
+        return {'success': True, 'id': item['id']}
+
+
+def _publishedService(session, username, token, item_id):
+    """Private function that returns the publish status of the feature
+    service already published from the item, or None."""
+    item = session.findService(username, token, item_id)
+    if item != None:
+        return {'services': [{'serviceurl': item.get('url'), 'serviceItemId': item['id']}]}
+
+
+_default_session = None
+
+def getSession():
+    """Returns the AGOLSession shared by calls that are not given one."""
+    global _default_session
+    if _default_session is None:
+        _default_session = AGOLSession()
+    return _default_session
+
+
+_message_queue = Queue.Queue()
+
+def _addMessage(kind, text):
+    """Private function that writes a geoprocessing message of the given kind
+    (AddMessage, AddWarning or AddError). arcpy is not thread safe, so
+    messages from upload threads are queued until flushMessages is called on
+    the main thread."""
+    if threading.current_thread().name == "MainThread":
+        getattr(arcpy, kind)(text)
+    else:
+        _message_queue.put((kind, text))
+
+def flushMessages():
+    """Writes the messages queued by upload threads."""
+    while True:
+        try:
+            kind, text = _message_queue.get_nowait()
+        except Queue.Empty:
+            break
+        getattr(arcpy, kind)(text)
+
+
+@timed("package layer")
+def packageLayer(routeid, date, folder, layer, where):
     """Prepares the data for upload to ArcGIS online by doing a selection for
-    the input data, making a shapefile, zipping the shapefile, adding it to
-    ArcGIS online, and publishing the data"""
+    the input data, making a shapefile and zipping the shapefile. Returns the
+    name of the shapefile, the path of the zip file and the layer name."""
     file_name = "{0}_{1}_{2}".format(routeid, layer.name, date)
-    zip_file = os.path.join(folder, file_name+ ".zip")
     arcpy.env.workspace = folder
     arcpy.SelectLayerByAttribute_management(layer, "NEW_SELECTION", where)
     arcpy.CopyFeatures_management(layer, file_name +".shp")
+    return [file_name, zipShapefile(folder, file_name), layer.name]
+
+
+# Extensions of the files that can make up a shapefile
+SHAPEFILE_PARTS = [".shp", ".shx", ".dbf", ".prj", ".cpg", ".sbn", ".sbx",
+                   ".shp.xml", ".qix", ".fbn", ".fbx", ".ain", ".aih", ".atx",
+                   ".ixs", ".mxs", ".xml"]
 
-    # create a zip file of the shapefile to upload
-    zf = zipfile.ZipFile(zip_file, "w")
-    for shpfile_part in arcpy.ListFiles(file_name+"*"):
-        if shpfile_part != file_name + ".zip":
-            zf.write(os.path.join(folder, shpfile_part), shpfile_part, \
-                                zipfile.ZIP_DEFLATED)
+def shapefileParts(folder, file_name):
+    """Returns the names of the files that make up a shapefile. Names are
+    matched exactly so routes whose names share a prefix are not mixed."""
+    return [file_name + extension for extension in SHAPEFILE_PARTS \
+            if os.path.exists(os.path.join(folder, file_name + extension))]
+
+
+def _writeZip(target, folder, file_name, compression):
+    """Private function that writes the parts of a shapefile to a zip file
+    path or file object."""
+    zf = zipfile.ZipFile(target, "w", compression)
+    for shpfile_part in shapefileParts(folder, file_name):
+        zf.write(os.path.join(folder, shpfile_part), shpfile_part)
     zf.close()
 
+
+@timed("zip shapefile")
+def zipShapefile(folder, file_name, compression=zipfile.ZIP_DEFLATED):
+    """Creates a zip file of a shapefile to upload and returns its path"""
+    zip_file = os.path.join(folder, file_name+ ".zip")
+    _writeZip(zip_file, folder, file_name, compression)
+    return zip_file
+
+
+def packShapefile(folder, file_name, compression=zipfile.ZIP_DEFLATED):
+    """Zips a shapefile in memory and returns the archive as a file object
+    ready to be used as an upload body. compression is zipfile.ZIP_DEFLATED
+    or zipfile.ZIP_STORED, which skips compression."""
+    archive = io.BytesIO()
+    _writeZip(archive, folder, file_name, compression)
+    archive.seek(0)
+    return archive
+
+
+def packShapefiles(folder, file_names, compression=zipfile.ZIP_DEFLATED, workers=4):
+    """Zips several shapefiles in memory at the same time on a pool of
+    threads and returns {file name: archive}. zlib and file reads release the
+    interpreter lock, so the archives are compressed in parallel."""
+    pool = ThreadPool(max(1, min(workers, len(file_names))))
+    try:
+        archives = pool.map(lambda file_name: packShapefile(folder, file_name, \
+                            compression), file_names)
+    finally:
+        pool.close()
+        pool.join()
+    return dict(zip(file_names, archives))
+
+
+def groupRows(rows, key_index, keys=None):
+    """Groups rows into a dictionary of {key: [rows]} using the value at
+    key_index, keeping the order the rows were read in. If keys is given
+    only rows with one of those keys are kept."""
+    groups = {}
+    if keys is not None:
+        for key in keys:
+            groups[key] = []
+    for row in rows:
+        key = row[key_index]
+        if key in groups:
+            groups[key].append(row)
+        elif keys is None:
+            groups[key] = [row]
+    return groups
+
+
+def readLayerRows(layer, fields):
+    """Reads every row of a layer with a single search cursor. The layer's
+    selection is cleared first so all features are read."""
+    arcpy.SelectLayerByAttribute_management(layer, "CLEAR_SELECTION")
+    cursor = arcpy.da.SearchCursor(layer, fields)
+    rows = [row for row in cursor]
+    del cursor
+    return rows
+
+
+class ShapefileWriter:
+    """Writes groups of rows read from a layer to new shapefiles that use the
+    layer as their template."""
+    def __init__(self, folder, layer):
+        """Looks up the geometry, spatial reference and fields of the layer
+        once for all the shapefiles written."""
+        desc = arcpy.Describe(layer)
+        self.folder = folder
+        self.layer = layer
+        self.shape_type = desc.shapeType.upper()
+        self.spatial_reference = desc.spatialReference
+        self.fields = [field.name for field in arcpy.ListFields(layer) \
+                       if field.type not in ("OID", "Geometry")]
+
+    def write(self, file_name, rows):
+        """Creates file_name.shp in the folder and inserts the rows, which
+        must hold the values of the fields property followed by SHAPE@."""
+        arcpy.CreateFeatureclass_management(self.folder, file_name + ".shp", \
+                self.shape_type, self.layer, spatial_reference=self.spatial_reference)
+        # shapefile field names are cut to 10 characters, so match the new
+        # fields to the layer's fields by position
+        out_fields = [field.name for field in arcpy.ListFields(os.path.join(\
+                      self.folder, file_name + ".shp")) \
+                      if field.type not in ("OID", "Geometry")]
+        out_fields = out_fields[len(out_fields) - len(self.fields):]
+        cursor = arcpy.da.InsertCursor(os.path.join(self.folder, file_name + ".shp"), \
+                                       out_fields + ["SHAPE@"])
+        for row in rows:
+            cursor.insertRow(row)
+        del cursor
+
+
+def exportRouteFeatures(layer, key_field, routes, folder, date, reader=readLayerRows, writer=None):
+    """Writes one shapefile per route from a Routes or Orders layer while
+    reading the layer only once. key_field holds the route name (Name for
+    Routes, RouteName for Orders). reader(layer, fields) returns the rows and
+    writer.write(file_name, rows) writes a shapefile; both can be replaced to
+    run without arcpy. Returns {route name: shapefile name}."""
+    if writer is None:
+        writer = ShapefileWriter(folder, layer)
+    fields = writer.fields + ["SHAPE@"]
+    groups = groupRows(reader(layer, fields), fields.index(key_field), routes)
+    outputs = {}
+    for route in routes:
+        file_name = "{0}_{1}_{2}".format(route, layer.name, date)
+        writer.write(file_name, groups[route])
+        outputs[route] = file_name
+    return outputs
+
+
+def uploadSignature(path, title, part_size=5242880, key=None):
+    """Returns what the progress of a ChunkedUpload of a file must match to
+    be resumed: the size and hash of the file, the part size, the title and
+    the key."""
+    return [os.path.getsize(path), hashFile(path), part_size, title, key]
+
+
+def _readProgress(progress_path):
+    """Private function that returns the saved progress of a ChunkedUpload,
+    or an empty dictionary."""
+    if not os.path.exists(progress_path):
+        return {}
+    read = open(progress_path, "r")
+    try:
+        return json.load(read)
+    except ValueError:
+        return {}
+    finally:
+        read.close()
+
+
+def uploadInProgress(path, key=None, part_size=5242880):
+    """Returns True if an upload of the file by uploadPDF stopped partway
+    and can be resumed, because neither the file nor its key changed since.
+    The file should then be uploaded again as it is, not rebuilt."""
+    if not os.path.exists(path):
+        return False
+    progress = _readProgress(path + ".upload.json")
+    return progress.get('itemId') != None and progress.get('signature') == \
+           uploadSignature(path, os.path.basename(path), part_size, key)
+
+
+class ChunkedUpload:
+    """Uploads a large file to ArcGIS Online in parts with addItem
+    (multipart), addPart and commit. Parts are read from the file one at a
+    time by each upload thread, so memory use is bounded by the part size
+    times the number of threads. When the source is a path the parts that
+    have been uploaded are saved to a progress file next to it, and a later
+    run with the same file resumes the upload where it stopped. The progress
+    is matched to the file by the hash of its contents and an optional key,
+    such as the hash of the inputs the file was built from. An item left by
+    an upload that can not be resumed is deleted before a new one is
+    started."""
+    def __init__(self, source, file_name, title, item_type, username, token, \
+                 session=None, part_size=5242880, workers=4, key=None):
+        """Sets up the upload. source is a file path or a file object such as
+        an archive made by packShapefile; only paths can be resumed."""
+        self.source = source
+        self.file_name = file_name
+        self.title = title
+        self.item_type = item_type
+        self.username = username
+        self.token = token
+        self.session = session or getSession()
+        self.part_size = part_size
+        self.workers = workers
+        self.item_id = None
+        self.parts = []
+        self.tag = requestTag()
+        self._lock = threading.Lock()
+        if isinstance(source, basestring):
+            self.size = os.path.getsize(source)
+            self.progress_path = source + ".upload.json"
+            self._signature = uploadSignature(source, title, part_size, key)
+        else:
+            source.seek(0, 2)
+            self.size = source.tell()
+            self.progress_path = None
+            self._signature = None
+        self.part_count = max(1, (self.size + part_size - 1) // part_size)
+
+    def _loadProgress(self):
+        """Private function that picks up the item id and finished parts of
+        an earlier attempt at uploading the same file. The item of an earlier
+        attempt at a different file is deleted."""
+        if self.progress_path == None:
+            return
+        progress = _readProgress(self.progress_path)
+        if progress.get('signature') == self._signature:
+            self.item_id = progress['itemId']
+            self.parts = progress['parts']
+        elif progress.get('itemId') != None:
+            _addMessage("AddMessage", "\t\t{0} changed since its upload stopped, deleting the partial item.".format(\
+                        self.file_name))
+            try:
+                delete_url = self.session.url("content/users/{0}/items/{1}/delete", \
+                                              self.username, progress['itemId'])
+                self.session.post(delete_url, params={'f': 'json', 'token': self.token})
+            except:
+                _addMessage("AddWarning", "\t\tUnable to delete partial item {0}: {1}".format(\
+                            progress['itemId'], sys.exc_info()[1]))
+
+    def _saveProgress(self):
+        """Private function that records the item id and finished parts."""
+        if self.progress_path == None:
+            return
+        temp_path = self.progress_path + ".tmp"
+        out = open(temp_path, "w")
+        json.dump({'signature': self._signature, 'itemId': self.item_id,
+                   'parts': self.parts}, out)
+        out.close()
+        if os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+        os.rename(temp_path, self.progress_path)
+
+    def _readPart(self, part_num):
+        """Private function that reads the bytes of a part (numbered from 1)."""
+        offset = (part_num - 1) * self.part_size
+        if self.progress_path == None:
+            with self._lock:
+                self.source.seek(offset)
+                return self.source.read(self.part_size)
+        read = open(self.source, "rb")
+        try:
+            read.seek(offset)
+            return read.read(self.part_size)
+        finally:
+            read.close()
+
+    def _post(self, path, params, files=None, idempotent=True):
+        """Private function that posts to an item endpoint and returns the
+        JSON response. Requests that are not idempotent are only sent again
+        if the first attempt did not add an item with the upload's tag."""
+        url = self.session.url(path, self.username, self.item_id)
+        params = dict(params, f='json', token=self.token)
+        response = self.session.post(url, params=params, files=files, idempotent=idempotent, \
+                   lookup=lambda: _addedItem(self.session, self.username, self.token, \
+                                             self.title, self.item_type, self.tag))
+        return json.loads(response.text)
+
+    def _addPart(self, part_num):
+        """Private function that uploads one part and records it. Returns
+        None on success or the error response."""
+        try:
+            data = self._readPart(part_num)
+            status = self._post("content/users/{0}/items/{1}/addPart", \
+                                {'partNum': part_num}, \
+                                {'file': (self.file_name, data)})
+        except:
+            return {'error': {'code': None, 'message': str(sys.exc_info()[1])}}
+        if status.get('success') != True:
+            return status
+        stats.count("bytes uploaded", len(data))
+        with self._lock:
+            self.parts.append(part_num)
+            self._saveProgress()
+
+    def run(self):
+        """Uploads the missing parts and commits the item. Returns the addItem
+        style status: {'success': True, 'id': item id} or {'error': ...}."""
+        self._loadProgress()
+        if self.item_id == None:
+            status = self._post("content/users/{0}/addItem", \
+                     {'title': self.title, 'type': self.item_type, 'tags': self.tag, \
+                      'multipart': 'true', 'filename': self.file_name}, idempotent=False)
+            if status.get('success') != True:
+                return status
+            self.item_id = status['id']
+            self._saveProgress()
+        elif self.parts:
+            _addMessage("AddMessage", "\t\tResuming upload of {0} at {1} of {2} parts.".format(\
+                        self.file_name, len(self.parts), self.part_count))
+
+        missing = [part for part in range(1, self.part_count + 1) if part not in self.parts]
+        pool = ThreadPool(max(1, min(self.workers, len(missing))))
+        try:
+            errors = [error for error in pool.imap_unordered(self._addPart, missing) if error != None]
+        finally:
+            pool.close()
+            pool.join()
+        if errors:
+            return {'error': {'code': errors[0].get('error', {}).get('code'),
+                    'message': "{0} of {1} parts failed, run again to resume. {2}".format(\
+                    len(errors), self.part_count, errors[0].get('error', {}).get('message'))}}
+
+        status = self._post("content/users/{0}/items/{1}/commit", \
+                            {'title': self.title, 'type': self.item_type})
+        if status.get('success') != True:
+            return status
+        status = self._waitForCommit()
+        if 'error' in status:
+            return status
+        if self.progress_path != None and os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+        _clearRequestTag(self.session, self.username, self.token, self.item_id)
+        return {'success': True, 'id': self.item_id}
+
+    def _waitForCommit(self, interval=1.0, max_interval=15.0, timeout=1800):
+        """Private function that polls the item status until the commit job
+        has finished putting the parts together."""
+        deadline = time.time() + timeout
+        while True:
+            status = self._post("content/users/{0}/items/{1}/status", {})
+            if 'error' in status or status.get('status') == "completed":
+                return status
+            if status.get('status') == "failed" or time.time() > deadline:
+                return {'error': {'code': None, 'message': "Commit of {0} did not complete: {1}".format(\
+                        self.file_name, status.get('statusMessage'))}}
+            time.sleep(interval)
+            interval = min(interval * 1.5, max_interval)
+
+
+@timed("add item")
+def addFileItem(source, file_name, title, item_type, username, token, session=None, \
+                chunk_threshold=10485760, part_size=5242880, workers=4, key=None):
+    """Adds a file to ArcGIS Online and returns the addItem response. source is
+    a file path or a file object. Files larger than chunk_threshold bytes are
+    sent as a resumable ChunkedUpload, smaller ones in a single request. key
+    is matched when resuming, see ChunkedUpload."""
+    session = session or getSession()
+    if isinstance(source, basestring):
+        size = os.path.getsize(source)
+    else:
+        source.seek(0, 2)
+        size = source.tell()
+    if size > chunk_threshold:
+        upload = ChunkedUpload(source, file_name, title, item_type, username, \
+                               token, session, part_size, workers, key)
+        return upload.run()
+
+    addItem_url = session.url("content/users/{0}/addItem", username)
+    tag = requestTag()
+    addItem_params = {'title': title, 'type': item_type, 'tags': tag, 'f': 'json', 'token': token}
+    if isinstance(source, basestring):
+        upload_file = open(source, 'rb')
+    else:
+        upload_file = source
+        upload_file.seek(0)
+    try:
+        addItem_response = session.post(addItem_url, params=addItem_params, \
+                           files={'file': (file_name, upload_file)}, idempotent=False, \
+                           lookup=lambda: _addedItem(session, username, token, title, item_type, tag))
+    finally:
+        if upload_file is not source:
+            upload_file.close()
+    stats.count("bytes uploaded", size)
+    addItem_status = json.loads(addItem_response.text)
+    if addItem_status.get('success') == True:
+        _clearRequestTag(session, username, token, addItem_status['id'])
+    return addItem_status
+
+
+@timed("publish")
+def publishPackage(file_name, zip_file, layer_name, username, token, session=None, share_queue=None):
+    """Adds a zipped shapefile made by packageLayer to ArcGIS online, publishes
+    it and shares the service with the organization. zip_file is the path of
+    the zip file or an archive made by packShapefile. If a ShareQueue is given
+    the service is added to it instead of being shared straight away. Returns
+    the service title, url, item id and the id of the asynchronous publish
+    job (None if the server did not return one). Safe to call from upload
+    threads."""
+    session = session or getSession()
     # Upload zip file
     try:
-        addItem_url = "http://www.arcgis.com/sharing/rest/content/users/{0}/addItem".format(username)
-        addItem_params = {'title': "{}".format(file_name), "type": "Shapefile",
-                  'f': 'json', 'token':token}
-        addItem_filesup = {'file':open(zip_file, 'rb')}
-        addItem_response = requests.post(addItem_url, params=addItem_params, files=addItem_filesup)
-        addItem_status = json.loads(addItem_response.text)
+        addItem_status = addFileItem(zip_file, file_name + ".zip", \
+                         "{}".format(file_name), "Shapefile", username, token, session)
 
         # if there is an error uploading zip file return messages
         if 'error' in addItem_status:
             code = addItem_status['error']['code']
             msg = addItem_status['error']['message']
-            arcpy.AddWarning('Unable to upload {0}.zip. Error {1}: {2}'.format(file_name, code, msg))
-            arcpy.AddWarning('Manually upload zip file.')
+            _addMessage("AddWarning", 'Unable to upload {0}.zip. Error {1}: {2}'.format(file_name, code, msg))
+            _addMessage("AddWarning", 'Manually upload zip file.')
 
         # if upload succeeds being publishing of zip file
         elif addItem_status['success'] == True:
             itemid = addItem_status['id']
-            arcpy.AddMessage("\t\tUploaded {} to AGOL.".format(layer.name))
+            _addMessage("AddMessage", "\t\tUploaded {} to AGOL.".format(layer_name))
 
-            publish_zip_url = "http://www.arcgis.com/sharing/rest/content/users/{0}/publish".format(username)
+            publish_zip_url = session.url("content/users/{0}/publish", username)
             publishParams = json.dumps({'name': file_name})
             publish_zip_params = {'itemID': itemid,
                               'filetype':'shapefile',
                               'f': 'json',
                               'publishParameters': publishParams,
                               'token': token}
-            publish_zip_response = requests.post(publish_zip_url, \
-                                                 params=publish_zip_params)
+            publish_zip_response = session.post(publish_zip_url, \
+                                 params=publish_zip_params, idempotent=False, \
+                                 lookup=lambda: _publishedService(session, username, token, itemid))
             publish_zip_status = json.loads(publish_zip_response.text)
 
             # if there is an error publishing return messages
             if 'error' in publish_zip_status:
                 code = publish_zip_status['error']['code']
                 msg = publish_zip_status['error']['message']
-                arcpy.AddError('Unable to publish {0}.zip. Error {1}: {2}'.format(file_name, code, msg))
-                arcpy.AddError('Manually publish zip file.')
+                _addMessage("AddError", 'Unable to publish {0}.zip. Error {1}: {2}'.format(file_name, code, msg))
+                _addMessage("AddError", 'Manually publish zip file.')
 
             # if publishing succeeds capture service url and id to return
             else:
-                arcpy.AddMessage('\t\tPublished {} as feature service.'.format(layer.name))
+                _addMessage("AddMessage", '\t\tPublished {} as feature service.'.format(layer_name))
                 services = publish_zip_status['services']
                 for service in services:
                     serviceurl = service['serviceurl'] + "/0"
                     serviceItemId = service['serviceItemId']
-                    service_share_url = "http://www.arcgis.com/sharing/rest/content/users/{0}/items/{1}/share".format(username,serviceItemId)
+                    jobId = service.get('jobId')
+                    if share_queue != None:
+                        share_queue.add(serviceItemId, "{} feature service".format(file_name))
+                        continue
+                    service_share_url = session.url("content/users/{0}/items/{1}/share", username, serviceItemId)
                     service_share_params = {'everyone': 'false', 'org':'true', 'f':'json', 'token':token}
-                    service_share_response = requests.post(service_share_url, params=service_share_params)
+                    service_share_response = session.post(service_share_url, params=service_share_params)
 
-                return [file_name, serviceurl, serviceItemId]
+                return [file_name, serviceurl, serviceItemId, jobId]
         else:
-            arcpy.AddWarning(addItem_status)
+            _addMessage("AddWarning", addItem_status)
     except:
         tb = sys.exc_info()[2]
         tbinfo = traceback.format_tb(tb)[0]
         tmsg = "Traceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
-        arcpy.AddError("Unable to upload and/or publish {}.zip. Manually upload and publish.".format(file_name))
-        arcpy.AddError(tmsg)
+        _addMessage("AddError", "Unable to upload and/or publish {}.zip. Manually upload and publish.".format(file_name))
+        _addMessage("AddError", tmsg)
+
+
+def uploadPublish(routeid, date, folder, layer, where, username, token, session=None, \
+                  publisher=None):
+    """Prepares the data for upload to ArcGIS online by doing a selection for
+    the input data, making a shapefile, zipping the shapefile, adding it to
+    ArcGIS online, and publishing the data. If a publisher is given the
+    data is published through it instead."""
+    file_name, zip_file, layer_name = packageLayer(routeid, date, folder, layer, where)
+    if publisher != None:
+        return publisher.publishPackage(file_name, zip_file, layer_name)
+    return publishPackage(file_name, zip_file, layer_name, username, token, session)
 
 
-def makeWebmap(name, date,  route_service, order_service, username, token):
+def webmapTitle(name, date):
+    """Returns the title of a route's webmap"""
+    return "{0}'s Inspections for {1}".format(name, date.replace("_", "-"))
+
+
+def webmapJSON(route_service, order_service):
+    """Returns the JSON text of a route's webmap with its Orders and Routes
+    services over imagery. The services are lists of title and service url
+    in that order."""
+    return json.dumps({'operationalLayers': [{'url': order_service[1],
+        'visibility':'true',"opacity":1, 'title': order_service[0]},
+        {'url': route_service[1],'visibility':'true',"opacity":1,
+        'title': route_service[0]}],
+        "baseMap":
+        {'baseMapLayers':[{'id':"World_Imagery_1068",
+        'opacity':1,'visibility':'true',
+        'url':'http://services.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer'}]
+         ,'title':'Imagery'},'version':'1.9.1'})
+
+
+@timed("webmap")
+def makeWebmap(name, date,  route_service, order_service, username, token, session=None, share_queue=None):
     """ Creates a webmap with each inspector's order locations and routes. Input
     for route_service and order_service must be a list containing title and
-    service url in that order."""
-    webmap_name = "{0}'s Inspections for {1}".format(name, date.replace("_", "-"))
-    route_service_title = route_service[0]
-    route_service_url = route_service[1]
+    service url in that order. If a ShareQueue is given the webmap is added to
+    it instead of being shared straight away."""
+    session = session or getSession()
+    webmap_name = webmapTitle(name, date)
     route_serviceItemID = route_service[2]
-    order_service_title = order_service[0]
-    order_service_url = order_service[1]
     bookmark_name = "{} Routes".format(name)
 
     # Try to create webmap
@@ -173,20 +1956,14 @@ def makeWebmap(name, date,  route_service, order_service, username, token):
 ##        service_data_response = requests.get(service_data_url, params=service_data_params)
 ##        service_data_extent =  json.loads(service_data_response.text)['extent']
 ##        extent = {'xmax' : service_data_extent[1][0], 'xmin': service_data_extent[0][0], 'ymax': service_data_extent[1][1], 'ymin':service_data_extent[0][1]}
-        webmap_url = "http://www.arcgis.com/sharing/rest/content/users/{0}/addItem".format(username)
-        text = json.dumps({'operationalLayers': [{'url': order_service_url,
-            'visibility':'true',"opacity":1, 'title': order_service_title},
-            {'url': route_service_url,'visibility':'true',"opacity":1,
-            'title': route_service_title}],
-            "baseMap":
-            {'baseMapLayers':[{'id':"World_Imagery_1068",
-            'opacity':1,'visibility':'true',
-            'url':'http://services.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer'}]
-             ,'title':'Imagery'},'version':'1.9.1'})
+        webmap_url = session.url("content/users/{0}/addItem", username)
+        text = webmapJSON(route_service, order_service)
         #'bookmarks':[{'extent': service_data_extent, 'name': webmap_name}]
+        tag = requestTag()
         webmap_params = {'title': webmap_name, 'type':'Web Map', 'text':text,
-                         'f': 'json','token': token}
-        webmap_response = requests.post(webmap_url, params=webmap_params)
+                         'tags': tag, 'f': 'json','token': token}
+        webmap_response = session.post(webmap_url, params=webmap_params, idempotent=False, \
+                          lookup=lambda: _addedItem(session, username, token, webmap_name, "Web Map", tag))
         webmap_status = json.loads(webmap_response.text)
 
         # check for errors
@@ -194,115 +1971,626 @@ def makeWebmap(name, date,  route_service, order_service, username, token):
             code = webmap_status['error']['code']
             msg = webmap_status['error']['message']
             details = webmap_status['error']['details']
-            arcpy.AddError('\tUnable to add webmap {0}. Error {1}: {2}, {3}'.format(file_name, code, msg, details))
-            arcpy.AddError('\tManually create webmap.')
+            _addMessage("AddError", '\tUnable to add webmap {0}. Error {1}: {2}, {3}'.format(webmap_name, code, msg, details))
+            _addMessage("AddError", '\tManually create webmap.')
 
         # Share the webmap with the organization
         elif webmap_status['success'] == True:
-            arcpy.AddMessage('\t{} webmap added to AGOL.'.format(webmap_name))
+            _addMessage("AddMessage", '\t{} webmap added to AGOL.'.format(webmap_name))
             webmap_id =  webmap_status['id']
-            share_webmap_url ="http://www.arcgis.com/sharing/rest/content/users/{0}/items/{1}/share".format(username,webmap_id)
+            _clearRequestTag(session, username, token, webmap_id)
+            if share_queue != None:
+                share_queue.add(webmap_id, "{} webmap".format(webmap_name))
+                return webmap_id
+            share_webmap_url = session.url("content/users/{0}/items/{1}/share", username, webmap_id)
             share_webmap_params = {'everyone': 'false', 'org':'true', 'f':'json', 'token':token}
-            share_webmap_response = requests.post(share_webmap_url, params=share_webmap_params)
+            share_webmap_response = session.post(share_webmap_url, params=share_webmap_params)
             share_webmap_status = json.loads(share_webmap_response.text)
 
             # Check for errors when sharing webmap
             if 'error' in share_webmap_status:
                 code = share_webmap_status['error']['code']
                 msg = share_webmap_status['error']['message']
-                arcpy.AddError('\tUnable to share webmap {0}. Error {1}: {2}'.format(file_name, code, msg))
-                arcpy.AddError('\tManually share webmap.')
+                _addMessage("AddError", '\tUnable to share webmap {0}. Error {1}: {2}'.format(webmap_name, code, msg))
+                _addMessage("AddError", '\tManually share webmap.')
 
             elif 'itemId' in share_webmap_status:
-                arcpy.AddMessage("\t{} webmap has been shared.".format(webmap_name))
+                _addMessage("AddMessage", "\t{} webmap has been shared.".format(webmap_name))
             else:
-                arcpy.AddWarning(share_webmap_status)
+                _addMessage("AddWarning", share_webmap_status)
+            return webmap_id
         else:
-            arcpy.AddWarning(webmap_status)
+            _addMessage("AddWarning", webmap_status)
 
     except:
         tb = sys.exc_info()[2]
         tbinfo = traceback.format_tb(tb)[0]
         tmsg = "Traceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
-        arcpy.AddError("Unable to create {} webmap. Manually finish setup.".format(webmap_name))
-        arcpy.AddError(tmsg)
+        _addMessage("AddError", "Unable to create {} webmap. Manually finish setup.".format(webmap_name))
+        _addMessage("AddError", tmsg)
+
+
+class PublishJobTracker:
+    """Waits for asynchronous publish jobs to finish. One scheduler thread
+    keeps every pending job of every route and polls the jobs that are due
+    at the same time on a small pool of threads. Each job's poll interval
+    grows by the backoff factor while it is still processing, so quick jobs
+    are noticed quickly and slow jobs are not polled too often."""
+    def __init__(self, username, token, session=None, interval=1.0, \
+                 max_interval=30.0, backoff=1.5, timeout=1800, poll_workers=4):
+        """Sets up the tracker. Times are in seconds."""
+        self.username = username
+        self.token = token
+        self.session = session or getSession()
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.jobs = {}
+        self.polls = 0
+        self._waiters = []
+        self._condition = threading.Condition()
+        self._pool = ThreadPool(poll_workers)
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def track(self, services, callback):
+        """Calls callback(ready) on the tracker thread once the publish jobs
+        of all the services returned by publishPackage have finished. ready
+        is True only if every job completed. Services without a job id are
+        treated as ready. The callback should hand any slow work to another
+        thread."""
+        now = time.time()
+        keys = []
+        with self._condition:
+            for service in services:
+                if len(service) < 4 or service[3] == None:
+                    continue
+                key = (service[2], service[3])
+                keys.append(key)
+                if key not in self.jobs:
+                    self.jobs[key] = {'status': None, 'next': now + self.interval,
+                                      'interval': self.interval, 'deadline': now + self.timeout}
+            self._waiters.append([keys, callback])
+            self._condition.notify()
+
+    def _run(self):
+        """Private scheduler loop that polls due jobs and calls the callbacks
+        of finished waiters."""
+        while True:
+            with self._condition:
+                while not self._stopped and not self._dueJobs() and not self._readyWaiters(False):
+                    pending = [job['next'] for job in self.jobs.values() if job['status'] == None]
+                    if pending:
+                        self._condition.wait(max(0.01, min(pending) - time.time()))
+                    else:
+                        self._condition.wait()
+                if self._stopped:
+                    return
+                due = self._dueJobs()
+            if due:
+                self.polls += len(due)
+                statuses = self._pool.map(self._poll, due)
+                now = time.time()
+                with self._condition:
+                    for key, status in zip(due, statuses):
+                        job = self.jobs[key]
+                        if status in ("completed", "failed"):
+                            job['status'] = status
+                        elif now > job['deadline']:
+                            job['status'] = "timeout"
+                        else:
+                            job['interval'] = min(job['interval'] * self.backoff, self.max_interval)
+                            job['next'] = now + job['interval']
+            with self._condition:
+                ready = self._readyWaiters(True)
+            for keys, callback in ready:
+                callback(min([True] + [self.jobs[key]['status'] == "completed" for key in keys]))
+
+    def _dueJobs(self):
+        """Private function that returns the keys of the unfinished jobs that
+        are due to be polled."""
+        now = time.time()
+        return [key for key, job in self.jobs.items() \
+                if job['status'] == None and job['next'] <= now]
+
+    def _readyWaiters(self, remove):
+        """Private function that returns the waiters whose jobs have all
+        finished, removing them from the waiting list if remove is True."""
+        ready = [waiter for waiter in self._waiters \
+                 if None not in [self.jobs[key]['status'] for key in waiter[0]]]
+        if remove:
+            self._waiters = [waiter for waiter in self._waiters if waiter not in ready]
+        return ready
+
+    def _poll(self, key):
+        """Private function that asks the server for the status of a publish
+        job and returns it, or None if the request failed."""
+        item_id, job_id = key
+        try:
+            status_url = self.session.url("content/users/{0}/items/{1}/status", self.username, item_id)
+            status_params = {'jobId': job_id, 'jobType': 'publish', 'f': 'json', 'token': self.token}
+            status_response = self.session.post(status_url, params=status_params)
+            status = json.loads(status_response.text)
+            if 'error' in status:
+                _addMessage("AddWarning", "\tUnable to check publish job {0}. Error {1}: {2}".format(\
+                            job_id, status['error']['code'], status['error']['message']))
+                return None
+            if status.get('status') == "failed":
+                _addMessage("AddError", "\tPublish job {0} failed: {1}".format(job_id, status.get('statusMessage')))
+            return status.get('status')
+        except:
+            return None
+
+    def stop(self):
+        """Stops the scheduler thread."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+        self._pool.close()
+        self._pool.join()
 
 
+class UploadPipeline:
+    """Runs the addItem -> publish -> share -> webmap chain of each route on a
+    pool of threads, and uploads each route's mapbook PDF next to it. Routes
+    are submitted as soon as their mapbook is built, so uploads for
+    different routes overlap with each other and with the rendering. With a
+    PublishJobTracker a route's webmap is only made once both of its
+    services are ready, and the upload threads are free for other routes
+    while the jobs run. No more than max_pending shapefile pairs and PDFs
+    are waiting to be uploaded at once; submit blocks until one is uploaded,
+    which holds back the stage producing the routes so the books and
+    archives waiting for upload do not pile up. Routes whose data is
+    uploaded and only wait for their publish jobs do not count."""
+    def __init__(self, username, token, session=None, workers=4, share_queue=None, \
+                 tracker=None, max_pending=None, package_folder=None, \
+                 compression=zipfile.ZIP_DEFLATED, publisher=None):
+        """Starts the upload threads. All threads share one session. If a
+        ShareQueue is given the services, webmaps and PDFs are added to it to
+        be shared later in bulk. max_pending defaults to four per thread.
+        Packages submitted without an archive are zipped on the upload
+        thread from the shapefiles in package_folder. publisher defaults to
+        an AGOLPublisher with the username, token and session."""
+        self.username = username
+        self.token = token
+        self.session = session or getSession()
+        self.publisher = publisher or AGOLPublisher(username, token, self.session)
+        self.share_queue = share_queue
+        self.tracker = tracker
+        self.workers = workers
+        self.max_pending = max_pending or workers * 4
+        self.package_folder = package_folder
+        self.compression = compression
+        self.pool = ThreadPool(workers)
+        self.names = []
+        self.results = {}
+        self.pdfs = {}
+        self.webmaps = {}
+        self.chain_time = 0.0
+        self.most_pending = 0
+        self._pending = 0
+        self._uploading = 0
+        self._condition = threading.Condition()
+        self._started = time.time()
+
+    def submit(self, name, date, route_package, order_package, pdf_path=None, pdf_key=None):
+        """Queues the upload of a route, waiting first if max_pending routes
+        are already queued. route_package and order_package are the lists
+        returned by packageLayer for the Routes and Orders shapefiles, or
+        [file name, None, layer name] to zip the shapefile on the upload
+        thread. If pdf_path is given the route's mapbook is uploaded too,
+        with pdf_key as the key of a resumable upload."""
+        uploads = 1 if pdf_path == None else 2
+        with self._condition:
+            while self._uploading > 0 and self._uploading + uploads > self.max_pending:
+                self._condition.wait(0.5)
+                flushMessages()
+            self.names.append(name)
+            self._pending += uploads
+            self._uploading += uploads
+            self.most_pending = max(self.most_pending, self._uploading)
+        self.pool.apply_async(self._publish, (name, date, route_package, order_package))
+        if pdf_path != None:
+            self.pool.apply_async(self._uploadPDF, (name, pdf_path, pdf_key))
+
+    def _pack(self, packages):
+        """Private function that zips the shapefiles of a route's packages
+        that were submitted without an archive. Both of a route's shapefiles
+        are compressed at the same time."""
+        names = [package[0] for package in packages if package[1] == None]
+        archives = packShapefiles(self.package_folder, names, self.compression, len(names))
+        return [[package[0], archives[package[0]], package[2]] if package[1] == None \
+                else package for package in packages]
+
+    def _publish(self, name, date, route_package, order_package):
+        """Private function run on an upload thread that publishes both
+        shapefiles of a route and then creates its webmap, or hands it to the
+        tracker to create once the services are ready."""
+        start = time.time()
+        services = [None, None]
+        try:
+            try:
+                route_package, order_package = self._pack([route_package, order_package])
+                services[0] = self.publisher.publishPackage(route_package[0], \
+                            route_package[1], route_package[2], self.share_queue)
+                services[1] = self.publisher.publishPackage(order_package[0], \
+                            order_package[1], order_package[2], self.share_queue)
+            finally:
+                self._uploaded()
+            if None in services:
+                self._finish(name, services, start)
+            elif self.tracker != None:
+                self.tracker.track(services, lambda ready: self.pool.apply_async(\
+                                   self._webmap, (name, date, services, ready, start)))
+            else:
+                self._webmap(name, date, services, True, start)
+        except:
+            _addMessage("AddError", "\tUnable to upload {0}'s shapefiles: {1}".format(name, sys.exc_info()[1]))
+            self._finish(name, services, start)
 
-def uploadPDF(mapbook, username, token):
-    """Uploads a pdf to ArcGIS Online and shares the file with the
-    organization"""
+    def _webmap(self, name, date, services, ready, start):
+        """Private function run on an upload thread that creates a route's
+        webmap once its services are published. It finishes the route and
+        reports any error itself, so _publish never finishes it a second
+        time."""
+        try:
+            if ready:
+                webmap_id = self.publisher.makeWebmap(name, date, services[0], services[1], \
+                                                      self.share_queue)
+                if webmap_id != None:
+                    with self._condition:
+                        self.webmaps[name] = webmap_id
+            else:
+                _addMessage("AddError", "\tServices for {} did not finish publishing. Manually create webmap.".format(name))
+        except:
+            _addMessage("AddError", "\tUnable to create {0}'s webmap: {1}".format(name, sys.exc_info()[1]))
+        finally:
+            self._finish(name, services, start)
+
+    def _uploadPDF(self, name, pdf_path, key=None):
+        """Private function run on an upload thread that uploads a route's
+        mapbook and adds it to the share queue."""
+        uploaded = None
+        try:
+            uploaded = self.publisher.uploadPDF(pdf_path, key)
+            if uploaded != None and self.share_queue != None:
+                for pdf_id in uploaded:
+                    self.share_queue.add(pdf_id, uploaded[pdf_id])
+        finally:
+            with self._condition:
+                if uploaded != None:
+                    self.pdfs[name] = uploaded.items()[0]
+                self._pending -= 1
+            self._uploaded()
+
+    def _uploaded(self):
+        """Private function that frees the place of an upload that is done so
+        another route can be submitted."""
+        with self._condition:
+            self._uploading -= 1
+            self._condition.notify_all()
+
+    def _finish(self, name, services, start):
+        """Private function that records the result of a route."""
+        _addMessage("AddMessage", "\tFinsihed uploading {}'s shapefiles and webmap.".format(name))
+        stats.record("upload route", time.time() - start, name)
+        with self._condition:
+            self.chain_time += time.time() - start
+            self.results[name] = services
+            self._pending -= 1
+            self._condition.notify_all()
+
+    def join(self):
+        """Waits for every submitted route and PDF to finish, writes the
+        queued messages and returns {route name: [routes service, orders
+        service]}. The uploaded PDFs are in the pdfs property as {route name:
+        (pdf id, pdf name)} and the webmaps in the webmaps property as
+        {route name: webmap id}. The wall time is reported next to the time the
+        chains would have taken one after another."""
+        with self._condition:
+            while self._pending > 0:
+                self._condition.wait(0.5)
+                flushMessages()
+        self.pool.close()
+        self.pool.join()
+        flushMessages()
+        wall_time = time.time() - self._started
+        arcpy.AddMessage("Uploaded {0} routes in {1:.1f} s with {2} thread(s) ({3:.1f} s serial).".format(\
+                         len(self.names), wall_time, self.workers, self.chain_time))
+        return self.results
+
+
+@timed("upload pdf")
+def uploadPDF(mapbook, username, token, session=None, key=None):
+    """Uploads a pdf to ArcGIS Online. Large mapbooks are uploaded in parts
+    and can be resumed by running again; key is the hash of the route the
+    book was built from. Returns {item id: pdf name}."""
+    session = session or getSession()
     bookname = os.path.basename(mapbook)
-    upload_pdf_url = "http://www.arcgis.com/sharing/rest/content/users/{0}/addItem".format(username)
-    upload_pdf_params = {'title':bookname, 'type':'PDF', 'f': 'json','token': token}
-    pdf_filesup = {'file':open(mapbook, 'rb')}
     try:
-        upload_pdf_request = requests.post(upload_pdf_url,
-                                    params=upload_pdf_params, files=pdf_filesup)
-        upload_pdf_status = json.loads(upload_pdf_request.text)
+        upload_pdf_status = addFileItem(mapbook, bookname, bookname, 'PDF', \
+                            username, token, session, key=key)
         if 'error' in upload_pdf_status:
             code = upload_pdf_status['error']['code']
             msg = upload_pdf_status['error']['message']
-            arcpy.AddError('\tUnable to upload PDF. Error {0}: {1}'.format(code, msg))
-            arcpy.AddError('\tManually upload PDF files.')
+            _addMessage("AddError", '\tUnable to upload PDF. Error {0}: {1}'.format(code, msg))
+            _addMessage("AddError", '\tManually upload PDF files.')
 
         elif upload_pdf_status['success'] == True:
-            arcpy.AddMessage("\tUploaded {} PDF to AGOL.".format(bookname))
+            _addMessage("AddMessage", "\tUploaded {} PDF to AGOL.".format(bookname))
             pdf_id = upload_pdf_status['id']
             return {pdf_id: bookname}
         else:
-            arcpy.AddWarning(upload_pdf_status)
+            _addMessage("AddWarning", upload_pdf_status)
 
     except:
         tb = sys.exc_info()[2]
         tbinfo = traceback.format_tb(tb)[0]
         tmsg = "Traceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
-        arcpy.AddError("Failed to upload PDF.")
-        arcpy.AddError(tmsg)
+        _addMessage("AddError", "Failed to upload PDF.")
+        _addMessage("AddError", tmsg)
 
 
 
-def sharePDFs(itemsDictionary, username, token):
-    """Uses a dictionary formated as {itemid; pdfname} to share pdfs on AGOL"""
-    string_items_list = ""
-    for item in itemsDictionary:
-        string_items_list += item +  ","
-    string_items_list[:-1]
-    share_pdf_url = "http://www.arcgis.com/sharing/rest/content/users/{0}/shareItems".format(username)
-    share_pdf_params = {'everyone': 'false', 'org':'true', 'items': string_items_list, 'f':'json', 'token':token}
+class ShareQueue:
+    """Collects the ids of created items (feature services, webmaps and PDFs)
+    so they can be shared with the organization in a few bulk shareItems
+    requests instead of one request per item. Items can be added from upload
+    threads."""
+    def __init__(self, chunk_size=100):
+        """Sets up the empty queue. chunk_size is the most items shared by one
+        request."""
+        self.chunk_size = chunk_size
+        self.items = []
+        self.labels = {}
+        self._lock = threading.Lock()
+
+    def add(self, item_id, label):
+        """Queues an item to share. label names the item in messages."""
+        with self._lock:
+            if item_id not in self.labels:
+                self.items.append(item_id)
+            self.labels[item_id] = label
+
+    def flush(self, username=None, token=None, session=None, publisher=None):
+        """Shares every queued item with the organization and empties the
+        queue. Returns {item id: True or False} for each item. publisher
+        defaults to an AGOLPublisher with the username, token and session."""
+        publisher = publisher or AGOLPublisher(username, token, session)
+        with self._lock:
+            items = self.items
+            labels = self.labels
+            self.items = []
+            self.labels = {}
+        shared = {}
+        for start in range(0, len(items), self.chunk_size):
+            chunk = items[start:start + self.chunk_size]
+            shared.update(publisher.shareItems(chunk, labels))
+        return shared
+
+
+def _shareItems(items, labels, username, token, session):
+    """Private function that shares a list of item ids with one shareItems
+    request and returns {item id: True or False}."""
+    shared = dict([(item, False) for item in items])
+    share_url = session.url("content/users/{0}/shareItems", username)
+    share_params = {'everyone': 'false', 'org':'true', 'items': ",".join(items), 'f':'json', 'token':token}
     try:
-        share_pdf_response = requests.post(share_pdf_url, params=share_pdf_params)
-        share_pdf_status = json.loads(share_pdf_response.text)
-        if 'results' in share_pdf_status:
-            share_pdf_results = share_pdf_status['results']
-            if share_pdf_results != []:
-                for result in share_pdf_results:
-                    pdf_name  = itemsDictionary[result['itemId']]
+        share_response = session.post(share_url, data=share_params)
+        share_status = json.loads(share_response.text)
+        if 'results' in share_status:
+            share_results = share_status['results']
+            if share_results != []:
+                for result in share_results:
+                    item_name  = labels.get(result['itemId'], result['itemId'])
                     if result['success'] == True:
-                        arcpy.AddMessage("\tShared {} on AGOL.".format(pdf_name))
-                        print "\tShared {} on AGOL.".format(pdf_name)
+                        shared[result['itemId']] = True
+                        _addMessage("AddMessage", "\tShared {} on AGOL.".format(item_name))
 
                     else:
                         if 'error' in result:
                             code = result['error']['code']
                             msg = result['error']['message']
-                            arcpy.AddError("\tUnable to share {0}. Error {1}: {2}".format(pdf_name, code, msg))
-                            arcpy.AddError("\tManually share PDF file.")
+                            _addMessage("AddError", "\tUnable to share {0}. Error {1}: {2}".format(item_name, code, msg))
+                            _addMessage("AddError", "\tManually share {}.".format(item_name))
 
                         else:
-                            arcpy.AddWarning("\tUnable to share {}.".format(pdf_name))
-                            arcpy.AddWarning("\tManually share PDF file.")
+                            _addMessage("AddWarning", "\tUnable to share {}.".format(item_name))
+                            _addMessage("AddWarning", "\tManually share {}.".format(item_name))
+                for item in items:
+                    if item not in [result['itemId'] for result in share_results]:
+                        _addMessage("AddWarning", "\tNo sharing result for {}. Manually share it.".format(labels.get(item, item)))
             else:
-                arcpy.AddWarning("\tUnable to share PDFs.'")
-                arcpy.AddWarning("\tManually share PDF files.")
+                _addMessage("AddWarning", "\tUnable to share items.")
+                _addMessage("AddWarning", "\tManually share items.")
         else:
-            arcpy.AddWarning(share_pdf_status)
+            _addMessage("AddWarning", share_status)
     except:
         tb = sys.exc_info()[2]
         tbinfo = traceback.format_tb(tb)[0]
         tmsg = "Traceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
-        arcpy.AddError("Unable to share PDF. Manually Share.")
-        arcpy.AddError(tmsg)
+        _addMessage("AddError", "Unable to share items. Manually Share.")
+        _addMessage("AddError", tmsg)
+    return shared
+
+
+def sharePDFs(itemsDictionary, username, token, session=None, publisher=None):
+    """Uses a dictionary formated as {itemid; pdfname} to share pdfs on AGOL,
+    or through the publisher if one is given"""
+    share_queue = ShareQueue()
+    for item in itemsDictionary:
+        share_queue.add(item, itemsDictionary[item])
+    return share_queue.flush(username, token, session, publisher)
+
+
+# publishing backends
+class AGOLPublisher:
+    """Publishes services, webmaps and PDFs to ArcGIS Online and shares them
+    with the organization, using the module functions with one username,
+    token and session. UploadPipeline and ShareQueue publish through this
+    class by default. Any object with the same publishPackage, makeWebmap,
+    uploadPDF and shareItems methods can be used in its place."""
+    def __init__(self, username, token, session=None):
+        """Stores the account and the session used for every request"""
+        self.username = username
+        self.token = token
+        self.session = session or getSession()
+
+    def publishPackage(self, file_name, zip_file, layer_name, share_queue=None):
+        """Adds and publishes a zipped shapefile, see publishPackage"""
+        return publishPackage(file_name, zip_file, layer_name, self.username, \
+                              self.token, self.session, share_queue)
+
+    def makeWebmap(self, name, date, route_service, order_service, share_queue=None):
+        """Creates a route's webmap, see makeWebmap"""
+        return makeWebmap(name, date, route_service, order_service, self.username, \
+                          self.token, self.session, share_queue)
+
+    def uploadPDF(self, mapbook, key=None):
+        """Uploads a mapbook, see uploadPDF"""
+        return uploadPDF(mapbook, self.username, self.token, self.session, key)
+
+    def shareItems(self, items, labels):
+        """Shares item ids with the organization in one request and returns
+        {item id: True or False}"""
+        return _shareItems(items, labels, self.username, self.token, self.session)
+
+    def close(self):
+        """Nothing to release, the session is shared."""
+        pass
+
+
+class LocalPublisher:
+    """Stands in for ArcGIS Online in a dry run. Items are copied to a folder
+    and recorded in a SQLite database, publish.sqlite, in the same folder,
+    with their type, title, service url, webmap JSON and whether they were
+    shared. Nothing is sent over the network, so rendering and packaging can
+    be timed on their own and whole runs repeated quickly. Has the same
+    methods as AGOLPublisher and can be used from upload threads."""
+    def __init__(self, folder, copy_files=True):
+        """Opens or creates the store in the folder. With copy_files False
+        only the size of each file is recorded."""
+        self.folder = folder
+        self.copy_files = copy_files
+        if not os.path.exists(os.path.join(folder, "items")):
+            os.makedirs(os.path.join(folder, "items"))
+        self.path = os.path.join(folder, "publish.sqlite")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        # a dry run store is thrown away, so writes are not synced to disk
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("CREATE TABLE IF NOT EXISTS items (id TEXT PRIMARY KEY, "
+                         "title TEXT, type TEXT, file TEXT, size INTEGER, url TEXT, "
+                         "source TEXT, data TEXT, shared INTEGER DEFAULT 0, created REAL)")
+        self._db.commit()
+
+    def _addItem(self, title, item_type, file_name=None, source=None, url=None, \
+                 source_id=None, data=None):
+        """Private function that stores an item and its file and returns its
+        id. source is a file path or file object."""
+        item_id = uuid.uuid4().hex
+        size = 0
+        stored = None
+        if source != None:
+            item_folder = os.path.join(self.folder, "items", item_id)
+            os.makedirs(item_folder)
+            stored = os.path.join(item_folder, file_name)
+            if isinstance(source, basestring):
+                size = os.path.getsize(source)
+                if self.copy_files:
+                    shutil.copyfile(source, stored)
+            else:
+                source.seek(0)
+                content = source.read()
+                size = len(content)
+                if self.copy_files:
+                    out = open(stored, "wb")
+                    out.write(content)
+                    out.close()
+            stats.count("bytes uploaded", size)
+        with self._lock:
+            self._db.execute("INSERT INTO items (id, title, type, file, size, url, source, "
+                             "data, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", \
+                             (item_id, title, item_type, stored, size, url, source_id, \
+                              data, time.time()))
+            self._db.commit()
+        return item_id
+
+    @timed("publish")
+    def publishPackage(self, file_name, zip_file, layer_name, share_queue=None):
+        """Stores a zipped shapefile and a feature service item made from it.
+        Returns the service title, url, item id and a job id of None, as
+        publishPackage does."""
+        try:
+            item_id = self._addItem(file_name, "Shapefile", file_name + ".zip", zip_file)
+            url = "local://{0}/FeatureServer".format(file_name)
+            service_id = self._addItem(file_name, "Feature Service", url=url, source_id=item_id)
+            _addMessage("AddMessage", '\t\tPublished {} as local feature service.'.format(layer_name))
+            if share_queue != None:
+                share_queue.add(service_id, "{} feature service".format(file_name))
+            else:
+                self.shareItems([service_id], {})
+            return [file_name, url + "/0", service_id, None]
+        except:
+            _addMessage("AddError", "Unable to store {0}.zip: {1}".format(file_name, sys.exc_info()[1]))
+
+    @timed("webmap")
+    def makeWebmap(self, name, date, route_service, order_service, share_queue=None):
+        """Stores a route's webmap JSON as a Web Map item and returns its id"""
+        webmap_name = webmapTitle(name, date)
+        try:
+            webmap_id = self._addItem(webmap_name, "Web Map", \
+                        data=webmapJSON(route_service, order_service))
+            _addMessage("AddMessage", '\t{} webmap added to the local store.'.format(webmap_name))
+            if share_queue != None:
+                share_queue.add(webmap_id, "{} webmap".format(webmap_name))
+            else:
+                self.shareItems([webmap_id], {})
+            return webmap_id
+        except:
+            _addMessage("AddError", "Unable to store {0} webmap: {1}".format(webmap_name, sys.exc_info()[1]))
+
+    @timed("upload pdf")
+    def uploadPDF(self, mapbook, key=None):
+        """Stores a mapbook and returns {item id: pdf name}. Nothing is
+        resumed, so the key is not used."""
+        bookname = os.path.basename(mapbook)
+        try:
+            return {self._addItem(bookname, "PDF", bookname, mapbook): bookname}
+        except:
+            _addMessage("AddError", "Unable to store {0}: {1}".format(bookname, sys.exc_info()[1]))
+
+    def shareItems(self, items, labels):
+        """Marks the items as shared and returns {item id: True or False},
+        False for ids that are not in the store"""
+        with self._lock:
+            shared = {}
+            for item_id in items:
+                cursor = self._db.execute("UPDATE items SET shared = 1 WHERE id = ?", (item_id,))
+                shared[item_id] = cursor.rowcount == 1
+            self._db.commit()
+        return shared
+
+    def items(self, item_type=None):
+        """Returns a list of dictionaries of the stored items, all of them or
+        those of one type"""
+        with self._lock:
+            if item_type == None:
+                cursor = self._db.execute("SELECT * FROM items ORDER BY created")
+            else:
+                cursor = self._db.execute("SELECT * FROM items WHERE type = ? ORDER BY created", \
+                                          (item_type,))
+            fields = [column[0] for column in cursor.description]
+            return [dict(zip(fields, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        """Closes the database."""
+        with self._lock:
+            self._db.close()
 
 
 
@@ -0,0 +1,95 @@
+'''
+Title: Business day calendar checks
+Created: 10/17/2026
+
+Description: Checks BusinessDays on known dates: weekends and holidays are
+skipped, the next business day rolls over into the next month and year and
+over a leap day, businessDays chains days, and parseDate/parseDates read
+both date formats and reject anything else. Also checks the date the core
+script gives the routes.
+'''
+import os, sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+fake_arcpy.install(0, 0, [])
+import BusinessDays
+import Project_core_sawendel
+
+
+def checkNextBusinessDay():
+    """Weekends and holidays are skipped across month and year ends."""
+    calendar = BusinessDays.BusinessCalendar()
+    # Thursday, then Friday to Monday, and Saturday and Sunday to Monday
+    assert calendar.nextBusinessDay(date(2026, 7, 2)) == date(2026, 7, 3)
+    assert calendar.nextBusinessDay(date(2026, 7, 3)) == date(2026, 7, 6)
+    assert calendar.nextBusinessDay(date(2026, 10, 17)) == date(2026, 10, 19)
+    assert calendar.nextBusinessDay(date(2026, 10, 18)) == date(2026, 10, 19)
+    assert not calendar.isBusinessDay(date(2026, 10, 17))
+    assert calendar.isBusinessDay(date(2026, 10, 19))
+    # month end on a Friday, and the leap day
+    assert calendar.nextBusinessDay(date(2026, 1, 30)) == date(2026, 2, 2)
+    assert calendar.nextBusinessDay(date(2028, 2, 28)) == date(2028, 2, 29)
+    # the year end, with New Year's Day off
+    holidays = BusinessDays.BusinessCalendar([date(2025, 12, 25), date(2026, 1, 1)])
+    assert calendar.nextBusinessDay(date(2025, 12, 31)) == date(2026, 1, 1)
+    assert holidays.nextBusinessDay(date(2025, 12, 31)) == date(2026, 1, 2)
+    assert holidays.nextBusinessDay(date(2025, 12, 24)) == date(2025, 12, 26)
+    assert not holidays.isBusinessDay(date(2026, 1, 1))
+    # a holiday on a Monday after the weekend
+    assert BusinessDays.BusinessCalendar([date(2026, 7, 6)]).nextBusinessDay(\
+           date(2026, 7, 3)) == date(2026, 7, 7)
+    # a different weekend
+    assert BusinessDays.BusinessCalendar(weekend=(5, 6)).nextBusinessDay(\
+           date(2026, 7, 2)) == date(2026, 7, 5)
+    # no day means the next business day after today
+    assert calendar.nextBusinessDay() > date.today()
+    print "Next business days check out."
+
+
+def checkBusinessDays():
+    """businessDays returns consecutive business days after the day."""
+    calendar = BusinessDays.BusinessCalendar([date(2026, 1, 1)])
+    assert calendar.businessDays(4, date(2025, 12, 30)) == \
+           [date(2025, 12, 31), date(2026, 1, 2), date(2026, 1, 5), date(2026, 1, 6)]
+    assert calendar.businessDays(0, date(2025, 12, 30)) == []
+    assert len(calendar.businessDays(260, date(2025, 12, 31))) == 260
+    print "businessDays checks out."
+
+
+def checkParsing():
+    """Both formats are read and anything else raises ValueError."""
+    assert BusinessDays.parseDate("2026-12-25") == date(2026, 12, 25)
+    assert BusinessDays.parseDate("12/25/2026") == date(2026, 12, 25)
+    assert BusinessDays.parseDates(" 2026-12-25; 01/01/2027 ;;") == \
+           [date(2026, 12, 25), date(2027, 1, 1)]
+    assert BusinessDays.parseDates("") == []
+    for text in ("25/12/2026", "2026-02-30", "tomorrow", "2026-12-25;nope"):
+        try:
+            BusinessDays.parseDates(text)
+            raise AssertionError("{0} was read as a date".format(text))
+        except ValueError:
+            pass
+    print "Date parsing checks out."
+
+
+def checkCoreDate():
+    """The core script dates the routes MM_DD_YYYY on the next business day."""
+    calendar = BusinessDays.BusinessCalendar()
+    expected = calendar.nextBusinessDay().strftime("%m_%d_%Y")
+    assert Project_core_sawendel.calculateNextDay(calendar) == expected
+    assert Project_core_sawendel.calculateNextDay() == expected
+    print "Route date checks out."
+
+
+def main():
+    """Runs the checks."""
+    checkNextBusinessDay()
+    checkBusinessDays()
+    checkParsing()
+    checkCoreDate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+'''
+Title: Directions parser benchmark
+Created: 10/17/2026
+
+Description: Compares the original findStringPositions/seekLines scan that the
+mapbook loop ran for every page with the indexed lookups of RouteDirection on a
+synthetic directions file of about 100,000 lines, and checks that both modes
+of RouteDirection return the same text as the scan for every stop. Run with
+--memory to compare the peak memory of the in-memory and streaming modes as
+the file grows; the script fails if the streaming mode does not stay flat.
+'''
+import os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+fake_arcpy.install(0, 0, [])
+import VRPS
+import synthetic
+
+
+def scanLookups(d, names, stop_count):
+    """Looks up every stop the way the mapbook loop originally did."""
+    for name in names:
+        for stop in range(1, stop_count + 1):
+            d.findStringPositions(name)
+            d.seekLines()[stop]
+
+
+def indexLookups(d, names, stop_count):
+    """Looks up every stop through the route index."""
+    for name in names:
+        for stop in range(1, stop_count + 1):
+            d.get(name, stop)
+
+
+def checkLookups(path, names, stop_count):
+    """Every stop of both modes must match the original scan's text."""
+    scan = VRPS.RouteDirection(path)
+    for streaming in (False, True):
+        d = VRPS.RouteDirection(path, streaming=streaming)
+        for name in names:
+            scan.findStringPositions(name)
+            expected = scan.seekLines()
+            assert len(expected) == stop_count, name
+            for stop in range(1, stop_count + 1):
+                assert d.get(name, stop) == expected[stop], (name, stop, streaming)
+    print "Indexed and streaming lookups match the scan for {0} routes.".format(len(names))
+
+
+def memory():
+    """Fails if the streaming mode's peak memory grows with the directions
+    file, and prints the in-memory mode's peak to compare."""
+    synthetic.memoryGrowth("Streaming", ["import VRPS",
+                           "d = VRPS.RouteDirection({directions!r}, streaming=True)",
+                           "for name in d.names: d.getRoute(name)"],
+                           compare=("In-memory", ["import VRPS",
+                           "d = VRPS.RouteDirection({directions!r}, streaming=False)",
+                           "for name in d.names: d.getRoute(name)"]))
+
+
+def main(route_count=400, stop_count=40, scan_routes=5):
+    """Runs the benchmark. The scan is only timed for scan_routes routes and
+    scaled up since it grows with routes x stops x file length."""
+    folder = tempfile.mkdtemp()
+    directions = os.path.join(folder, "directions.txt")
+    lines = synthetic.writeDirections(directions, route_count, stop_count)
+    names = synthetic.routeNames(route_count)
+    print "Synthetic directions: {0} routes, {1} stops each, {2} lines".format(
+          route_count, stop_count, lines)
+    checkLookups(directions, names[:50], stop_count)
+
+    start = time.time()
+    d = VRPS.RouteDirection(directions)
+    build = time.time() - start
+    print "Build index:           {0:.3f} s".format(build)
+
+    start = time.time()
+    indexLookups(d, names, stop_count)
+    lookups = time.time() - start
+    print "Indexed lookups (all): {0:.3f} s".format(lookups)
+
+    start = time.time()
+    scanLookups(d, names[:scan_routes], stop_count)
+    scan = (time.time() - start) * route_count / scan_routes
+    print "Scan lookups (est.):   {0:.3f} s".format(scan)
+    print "Speedup:               {0:.0f}x".format(scan / (build + lookups))
+
+    os.remove(directions)
+    os.rmdir(folder)
+
+
+if __name__ == '__main__':
+    if "--memory" in sys.argv:
+        memory()
+    else:
+        main()
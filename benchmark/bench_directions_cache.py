@@ -0,0 +1,149 @@
+'''
+Title: Directions cache benchmark
+Created: 10/17/2026
+
+Description: Compares parsing a synthetic directions file with RouteDirection
+to building and loading the directions cache of VRPS.cacheDirections. A
+cache that is already up to date is only hashed, and opening it reads just
+the index, so a single route can be read without loading the rest. Also
+checks that every stop and arrival time read back from the cache matches the
+parsed text, that a changed directions file rebuilds the cache, that closing
+a mapbook renderer releases it and that the cache is smaller than the text. Run with --memory to compare the peak memory
+of building the cache as the file grows; the script fails if it does not
+stay flat.
+'''
+import os, sys, tempfile, time, shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+fake_arcpy.install(0, 0, [])
+import VRPS
+import synthetic
+
+
+def timeIt(function, repeat=3):
+    """Returns the fastest wall time of a few calls of function."""
+    best = None
+    for attempt in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def checkRoundTrip(directions, cache_path):
+    """The cache must return the same stops as parsing the text, and an
+    arrival time for every stop."""
+    parsed = VRPS.RouteDirection(directions)
+    cache = VRPS.DirectionsCache(cache_path)
+    assert cache.names == parsed.names
+    for name in parsed.names:
+        assert cache.getRoute(name) == parsed.getRoute(name), name
+        assert cache.getText(name) == parsed.getText(name), name
+        arrivals = cache.arrivals(name)
+        assert len(arrivals) == len(parsed.getRoute(name))
+        assert None not in arrivals.values(), name
+    cache.close()
+    print "Round trip: {0} routes match the parsed text.".format(len(parsed.names))
+
+
+def checkRendererClose(folder, cache_path):
+    """Closing a mapbook renderer releases its memory mapped cache."""
+    mxd = os.path.join(folder, "template.mxd")
+    open(mxd, "wb").close()
+    renderer = VRPS.MapbookRenderer(mxd, cache_path, folder, None)
+    cache = renderer.directions
+    assert cache._map != None
+    renderer.close()
+    assert cache._map == None and cache._file.closed
+    print "Closing the renderer releases the directions cache."
+
+
+def checkRebuild(directions, cache_path, route_count, stop_count):
+    """A directions file with different contents must not reuse the cache."""
+    old_hash = VRPS.DirectionsCache(cache_path).source_hash
+    synthetic.writeDirections(directions, route_count, stop_count, seed=1)
+    VRPS.cacheDirections(directions, cache_path)
+    cache = VRPS.DirectionsCache(cache_path)
+    assert cache.source_hash != old_hash
+    assert cache.getRoute(cache.names[0]) == VRPS.RouteDirection(directions).getRoute(cache.names[0])
+    cache.close()
+    print "Changed directions rebuilt the cache."
+
+
+def memory():
+    """Fails if the peak memory of building the cache grows with the
+    directions file."""
+    synthetic.memoryGrowth("Build", ["import VRPS",
+                           "VRPS.writeDirectionsCache({directions!r}, {output!r})"])
+
+
+def main(route_count=2000, stop_count=40):
+    """Runs the checks and the benchmark."""
+    folder = tempfile.mkdtemp()
+    try:
+        directions = os.path.join(folder, "directions.txt")
+        cache_path = os.path.join(folder, "directions.dircache")
+        lines = synthetic.writeDirections(directions, route_count, stop_count)
+        names = synthetic.routeNames(route_count)
+        print "Synthetic directions: {0} routes, {1} stops each, {2} lines, {3:.1f} MB".format(\
+              route_count, stop_count, lines, os.path.getsize(directions) / 1048576.0)
+
+        def parse():
+            d = VRPS.RouteDirection(directions)
+            d.getRoute(names[-1])
+
+        def stream():
+            d = VRPS.RouteDirection(directions, streaming=True)
+            d.getRoute(names[-1])
+
+        def build():
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            VRPS.cacheDirections(directions, cache_path)
+
+        def rerun():
+            cache = VRPS.DirectionsCache(VRPS.cacheDirections(directions, cache_path))
+            cache.getRoute(names[-1])
+            cache.close()
+
+        def loadAll():
+            cache = VRPS.DirectionsCache(cache_path)
+            for name in cache.names:
+                cache.getRoute(name)
+            cache.close()
+
+        def loadOne():
+            cache = VRPS.DirectionsCache(cache_path)
+            cache.getRoute(names[-1])
+            cache.close()
+
+        parse_time = timeIt(parse)
+        print "Parse the text, one route:          {0:.3f} s".format(parse_time)
+        print "Index the text (streaming), one route: {0:.3f} s".format(timeIt(stream))
+        print "Build the cache:                    {0:.3f} s".format(timeIt(build))
+        rerun_time = timeIt(rerun)
+        print "Rerun with a current cache, one route: {0:.3f} s ({1:.1f}x)".format(\
+              rerun_time, parse_time / rerun_time)
+        load_time = timeIt(loadOne)
+        print "Open the cache, one route:          {0:.3f} s ({1:.1f}x)".format(\
+              load_time, parse_time / load_time)
+        print "Open the cache, every route:        {0:.3f} s".format(timeIt(loadAll))
+        print "Cache {0:.1f} MB, text {1:.1f} MB".format(os.path.getsize(cache_path) / 1048576.0, \
+              os.path.getsize(directions) / 1048576.0)
+        assert os.path.getsize(cache_path) < os.path.getsize(directions)
+
+        checkRoundTrip(directions, cache_path)
+        checkRendererClose(folder, cache_path)
+        checkRebuild(directions, cache_path, route_count, stop_count)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if "--memory" in sys.argv:
+        memory()
+    else:
+        main()
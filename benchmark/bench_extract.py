@@ -0,0 +1,108 @@
+'''
+Title: Route feature export benchmark
+Created: 10/17/2026
+
+Description: Compares the original per-route export, VRPS.packageLayer,
+which selects each route's features in the Orders layer, copies them to a
+shapefile and zips it, with VRPS.exportRouteFeatures, which reads the layer
+once and writes every route's shapefile with VRPS.ShapefileWriter before the
+same zip. Both run against the fake arcpy module, where each geoprocessing
+tool call costs tool_time seconds and each cursor a tenth of that. The
+shapefiles of both must have the same field names, types and rows,
+including long field names cut to 10 characters.
+'''
+import os, sys, time, random, tempfile, shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+arcpy = fake_arcpy.install(0, 0, [])
+import VRPS
+import synthetic
+
+
+def makeLayer(route_count, stop_count, seed=0):
+    """Returns an Orders layer with stop_count orders per route in random
+    order. Its time window fields have names longer than a shapefile field
+    and share their first 10 characters."""
+    rand = random.Random(seed)
+    fields = [fake_arcpy.Field("Name", "String"), fake_arcpy.Field("RouteName", "String"),
+              fake_arcpy.Field("Sequence", "Integer"), fake_arcpy.Field("ServiceTime", "Double"),
+              fake_arcpy.Field("TimeWindowStart1", "Date"), fake_arcpy.Field("TimeWindowEnd1", "Date")]
+    rows = []
+    for route in synthetic.routeNames(route_count):
+        for stop in range(stop_count):
+            rows.append({'Name': "Order {0}-{1}".format(route, stop), 'RouteName': route,
+                         'Sequence': stop + 2, 'ServiceTime': 30.0,
+                         'TimeWindowStart1': "8:00", 'TimeWindowEnd1': "17:00",
+                         'SHAPE': ((rand.random(), rand.random()),)})
+    rand.shuffle(rows)
+    for oid, row in enumerate(rows):
+        row['OBJECTID'] = oid + 1
+    return fake_arcpy.Layer("Orders", "Point", fields, rows)
+
+
+def perRoute(layer, routes, folder):
+    """Selects, copies and zips each route's features, as the core script did
+    before exportRouteFeatures."""
+    for route in routes:
+        VRPS.packageLayer(route, "date", folder, layer, "RouteName = '{0}'".format(route))
+
+
+def batch(layer, routes, folder):
+    """Reads the layer once for all routes, then zips each shapefile."""
+    outputs = VRPS.exportRouteFeatures(layer, "RouteName", routes, folder, "date")
+    for route in routes:
+        VRPS.zipShapefile(folder, outputs[route])
+    return outputs
+
+
+def readFile(path):
+    read = open(path, "rb")
+    data = read.read()
+    read.close()
+    return data
+
+
+def checkOutputs(old_folder, new_folder, outputs):
+    """Each route's shapefile must have the same fields, with the same cut
+    names and types, and the same rows and shapes from both exports."""
+    for route, file_name in sorted(outputs.items()):
+        old_path = os.path.join(old_folder, file_name + ".shp")
+        new_path = os.path.join(new_folder, file_name + ".shp")
+        old_fields = [(field.name, field.type) for field in arcpy.ListFields(old_path)]
+        new_fields = [(field.name, field.type) for field in arcpy.ListFields(new_path)]
+        assert new_fields == old_fields, (route, old_fields, new_fields)
+        for extension in (".shp", ".dbf"):
+            assert readFile(os.path.join(new_folder, file_name + extension)) == \
+                   readFile(os.path.join(old_folder, file_name + extension)), (route, extension)
+        assert VRPS.shapefileParts(new_folder, file_name) == VRPS.shapefileParts(old_folder, file_name)
+    assert ("TimeWindow", "Date") in old_fields and ("TimeWind_1", "Date") in old_fields, old_fields
+
+
+def main(route_counts=(10, 100, 1000), stop_count=40, tool_time=0.005):
+    """Times both exports for each number of routes."""
+    fake_arcpy.LATENCIES.update({'select': tool_time, 'copy_features': tool_time,
+                                 'create_featureclass': tool_time, 'open_cursor': tool_time / 10})
+    print "Routes  Per route s  Batch s"
+    for route_count in route_counts:
+        layer = makeLayer(route_count, stop_count)
+        routes = synthetic.routeNames(route_count)
+        old_folder = tempfile.mkdtemp()
+        new_folder = tempfile.mkdtemp()
+        try:
+            start = time.time()
+            perRoute(layer, routes, old_folder)
+            per_route = time.time() - start
+            start = time.time()
+            outputs = batch(layer, routes, new_folder)
+            batched = time.time() - start
+            checkOutputs(old_folder, new_folder, outputs)
+        finally:
+            shutil.rmtree(old_folder, ignore_errors=True)
+            shutil.rmtree(new_folder, ignore_errors=True)
+        print "{0:6d}  {1:11.3f}  {2:7.3f}".format(route_count, per_route, batched)
+    print "Both exports write the same fields, cut names and rows."
+
+
+if __name__ == '__main__':
+    main()
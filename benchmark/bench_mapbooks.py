@@ -0,0 +1,69 @@
+'''
+Title: Mapbook scheduler benchmark
+Created: 10/17/2026
+
+Description: Runs VRPS.buildMapbooks with a stub renderer that sleeps instead
+of exporting pages, so the worker pool can be timed and checked without
+ArcGIS. Results must come back in route order for every pool size.
+'''
+import os, sys, tempfile, time, shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+fake_arcpy.install(0, 0, [])
+import VRPS
+import synthetic
+
+
+class StubRenderer:
+    """Stands in for VRPS.MapbookRenderer. Each page costs page_time seconds
+    and the mapbook is written as a small text file."""
+    def __init__(self, temp_folder, pages, page_time):
+        self.temp_folder = temp_folder
+        self.pages = pages
+        self.page_time = page_time
+
+    def renderRoute(self, name, pdf_path):
+        for page in range(self.pages):
+            time.sleep(self.page_time)
+        out = open(pdf_path, "w")
+        out.write("{0} {1}\n".format(name, self.temp_folder))
+        out.close()
+        return self.pages
+
+    def close(self):
+        pass
+
+
+class StubRendererFactory:
+    """Picklable factory for StubRenderer."""
+    def __init__(self, pages, page_time):
+        self.pages = pages
+        self.page_time = page_time
+
+    def __call__(self, temp_folder):
+        return StubRenderer(temp_folder, self.pages, self.page_time)
+
+
+def main(route_count=32, pages=10, page_time=0.01, pool_sizes=(1, 2, 4, 8, 16)):
+    """Times buildMapbooks for each pool size."""
+    folder = tempfile.mkdtemp()
+    names = synthetic.routeNames(route_count)
+    jobs = [(name, os.path.join(folder, name + ".pdf")) for name in names]
+    factory = StubRendererFactory(pages, page_time)
+    print "{0} routes, {1} pages each, {2} s per page".format(route_count, pages, page_time)
+    serial = None
+    for pool_size in pool_sizes:
+        start = time.time()
+        results = VRPS.buildMapbooks(jobs, factory, os.path.join(folder, "temp"), pool_size)
+        elapsed = time.time() - start
+        if serial is None:
+            serial = elapsed
+        assert [result['name'] for result in results] == names
+        assert not [result for result in results if result['error']]
+        print "Pool size {0:2d}: {1:.2f} s ({2:.1f}x)".format(pool_size, elapsed, serial / elapsed)
+    shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
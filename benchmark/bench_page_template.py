@@ -0,0 +1,128 @@
+'''
+Title: Page template benchmark
+Created: 10/17/2026
+
+Description: Compares the page loop that looked up the directions and
+inspection text elements on every page with MapbookRenderer, which keeps
+them in a VRPS.PageTemplate. The pages are built with the fake arcpy module
+with a latency on each element lookup and text change, the way a large
+template map slows them down. Also checks against a fake map document that
+the template lists the elements once, writes the same page text
+and extents as the original loop and keeps the fixed element width.
+'''
+import os, sys, time, tempfile, shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy, synthetic
+arcpy = fake_arcpy.install(0, 0, [])
+import VRPS, RouteStops
+
+
+def stopTable(names, stop_count):
+    """Returns a RouteStopTable of stop_count stops on each route."""
+    rows = []
+    for route in names:
+        for stop in range(1, stop_count + 1):
+            rows.append((route, stop, "Order {0}-{1}".format(route, stop), \
+                         2000000.0 + stop * 500, 700000.0 + stop * 300))
+    return RouteStops.RouteStopTable(rows)
+
+
+def lookupEveryPage(mxd_path, directions, stop_table, names, folder):
+    """Builds the pages the way the mapbook loop did before the template,
+    and returns the page files' contents."""
+    mxd = arcpy.mapping.MapDocument(mxd_path)
+    df = arcpy.mapping.ListDataFrames(mxd)[0]
+    d = VRPS.RouteDirection(directions, streaming=True)
+    pages = []
+    page_name = os.path.join(folder, "page.pdf")
+    for Name in names:
+        for index in range(stop_table.count(Name)):
+            xmin, ymin, xmax, ymax = stop_table.pageExtent(Name, index)
+            df.extent = arcpy.Extent(xmin, ymin, xmax, ymax)
+            df.scale = df.scale + 2000
+            DirecttextElement = arcpy.mapping.ListLayoutElements(mxd, \
+                             "TEXT_ELEMENT", "directions")[0]
+            DirecttextElement.text = d.get(Name, index + 1)
+            DirecttextElement.elementWidth = 3.25
+            InspectTexttElement = arcpy.mapping.ListLayoutElements(mxd, \
+                             "TEXT_ELEMENT", "inspection")[0]
+            InspectTexttElement.text = stop_table.stop(Name, index)[1]
+            arcpy.mapping.ExportToPDF(mxd, page_name, "PAGE_LAYOUT")
+            read = open(page_name)
+            pages.append(read.read())
+            read.close()
+    return pages
+
+
+def templatePages(mxd_path, directions, stop_table, names, folder):
+    """Builds the same pages through a PageTemplate."""
+    page = VRPS.PageTemplate(arcpy.mapping.MapDocument(mxd_path), {"directions": 3.25})
+    d = VRPS.RouteDirection(directions, streaming=True)
+    pages = []
+    page_name = os.path.join(folder, "page.pdf")
+    for Name in names:
+        for index in range(stop_table.count(Name)):
+            page.setExtent(*stop_table.pageExtent(Name, index))
+            page.setText("directions", d.get(Name, index + 1))
+            page.setText("inspection", stop_table.stop(Name, index)[1])
+            page.export(page_name)
+            read = open(page_name)
+            pages.append(read.read())
+            read.close()
+    assert page.element("directions").elementWidth == 3.25
+    return pages
+
+
+def checkTemplate(mxd_path, directions, stop_table, names, folder):
+    """The template must list the elements once and build the
+    same pages as the original loop."""
+    fake_arcpy.install(0, 0, [])
+    expected = lookupEveryPage(mxd_path, directions, stop_table, names, folder)
+    before = fake_arcpy.calls().get('list_elements', 0)
+    assert templatePages(mxd_path, directions, stop_table, names, folder) == expected
+    assert fake_arcpy.calls()['list_elements'] - before == 1
+    page = VRPS.PageTemplate(arcpy.mapping.MapDocument(mxd_path))
+    assert page.element("legend").name == "legend"
+    print "Template pages match the original loop with 1 element listing."
+
+
+def main(route_count=20, stop_count=20, lookup_latency=0.002, text_latency=0.001):
+    """Times rendering with and without the template."""
+    folder = tempfile.mkdtemp()
+    try:
+        names = synthetic.routeNames(route_count)
+        directions = os.path.join(folder, "directions.txt")
+        synthetic.writeDirections(directions, route_count, stop_count)
+        stop_table = stopTable(names, stop_count)
+        mxd_path = os.path.join(folder, "template.mxd")
+        open(mxd_path, "wb").close()
+        checkTemplate(mxd_path, directions, stop_table, names[:3], folder)
+
+        fake_arcpy.install(0, 0, [], {'list_elements': lookup_latency, 'set_element': text_latency})
+        start = time.time()
+        lookupEveryPage(mxd_path, directions, stop_table, names, folder)
+        every_page = time.time() - start
+        calls = fake_arcpy.calls()
+        print "Lookup on every page: {0:.2f} s, {1} element lookups".format(\
+              every_page, calls.get('list_elements', 0))
+
+        fake_arcpy.install(0, 0, [], {'list_elements': lookup_latency, 'set_element': text_latency})
+        books = os.path.join(folder, "books")
+        os.mkdir(books)
+        renderer = VRPS.MapbookRenderer(mxd_path, directions, folder, stop_table)
+        start = time.time()
+        for name in names:
+            renderer.renderRoute(name, os.path.join(books, name + ".pdf"))
+        template = time.time() - start
+        renderer.close()
+        calls = fake_arcpy.calls()
+        print "Page template:        {0:.2f} s, {1} element lookups ({2:.1f}x)".format(\
+              template, calls.get('list_elements', 0), every_page / template)
+    finally:
+        fake_arcpy.LATENCIES.update({'list_elements': 0.0, 'set_element': 0.0})
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
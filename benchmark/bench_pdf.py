@@ -0,0 +1,84 @@
+'''
+Title: Mapbook PDF merge benchmark
+Created: 10/17/2026
+
+Description: Times the merge step of the mapbook with synthetic pages. The
+original flow wrote every page to its own file in the output folder before
+merging; the current flow reuses one local scratch page and writes the book
+to the output folder once. Requires the optional PyPDF2 module.
+'''
+import os, sys, tempfile, time, shutil, io
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+fake_arcpy.install(0, 0, [])
+import VRPS
+import PyPDF2
+
+
+def makePage():
+    """Returns the bytes of a synthetic one page PDF."""
+    writer = PyPDF2.PdfFileWriter()
+    writer.addBlankPage(612, 792)
+    page = io.BytesIO()
+    writer.write(page)
+    return page.getvalue()
+
+
+PAGE = makePage()
+
+def writePage(path, number):
+    """Writes a synthetic page as the export of a stop would."""
+    out = open(path, "wb")
+    out.write(PAGE)
+    out.close()
+
+
+def perPageFiles(output_folder, pages):
+    """The original flow: one page file per stop in the output folder."""
+    temp = os.path.join(output_folder, "Inspector_temp")
+    os.makedirs(temp)
+    book = VRPS.MemoryPDFBook(os.path.join(output_folder, "book_a.pdf"))
+    for number in range(pages):
+        page = os.path.join(temp, "Inspector_{0}.pdf".format(number))
+        writePage(page, number)
+        book.addPage(page)
+    book.save()
+    shutil.rmtree(temp)
+    return pages + 1
+
+
+def scratchPage(output_folder, scratch_folder, pages):
+    """The current flow: one reused scratch page and one write of the book."""
+    page = os.path.join(scratch_folder, "page.pdf")
+    book_path = os.path.join(scratch_folder, "book_b.pdf")
+    book = VRPS.MemoryPDFBook(book_path)
+    for number in range(pages):
+        writePage(page, number)
+        book.addPage(page)
+    book.save()
+    os.remove(page)
+    shutil.move(book_path, os.path.join(output_folder, "book_b.pdf"))
+    return 1
+
+
+def main(pages=500):
+    """Runs both flows and reports the time and files written to the output
+    folder."""
+    output_folder = tempfile.mkdtemp()
+    scratch_folder = tempfile.mkdtemp()
+    print "{0} synthetic pages".format(pages)
+    start = time.time()
+    files = perPageFiles(output_folder, pages)
+    print "Per page files: {0:.2f} s, {1} files written to output".format(time.time() - start, files)
+    start = time.time()
+    files = scratchPage(output_folder, scratch_folder, pages)
+    print "Scratch page:   {0:.2f} s, {1} file written to output".format(time.time() - start, files)
+    reader = PyPDF2.PdfFileReader(open(os.path.join(output_folder, "book_b.pdf"), "rb"))
+    assert reader.getNumPages() == pages
+    shutil.rmtree(output_folder)
+    shutil.rmtree(scratch_folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+'''
+Title: Render and upload pipeline benchmark
+Created: 10/17/2026
+
+Description: Compares rendering every mapbook, then uploading every route,
+then uploading every PDF with the pipeline that hands each route's
+shapefiles and PDF to the upload threads as soon as its book is saved.
+Rendering uses the stub renderer from bench_mapbooks.py and uploads go to
+the fake ArcGIS Online server. Also checks that the number of routes
+waiting for upload never goes above max_pending when the uploads are the
+slower stage, and that a route whose webmap fails is finished only once.
+'''
+import os, sys, time, tempfile, shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+fake_arcpy.install(0, 0, [])
+import VRPS
+import synthetic
+from fake_agol import FakeAGOL
+from bench_uploads import makePackages
+from bench_mapbooks import StubRendererFactory
+
+
+def sequential(server, names, date, folder, factory, pool_size, workers):
+    """Renders all books, then uploads all routes, then all PDFs."""
+    packages = makePackages(names, date)
+    session = VRPS.AGOLSession(server.base_url, max_requests=workers)
+    start = time.time()
+    jobs = [(name, os.path.join(folder, name + ".pdf")) for name in names]
+    mapbooks = VRPS.buildMapbooks(jobs, factory, os.path.join(folder, "temp"), pool_size)
+    tracker = VRPS.PublishJobTracker("bench", "faketoken", session, interval=0.2)
+    uploads = VRPS.UploadPipeline("bench", "faketoken", session, workers, tracker=tracker)
+    for mapbook in mapbooks:
+        uploads.submit(mapbook['name'], date, packages[mapbook['name']][0], \
+                       packages[mapbook['name']][1])
+    uploads.join()
+    tracker.stop()
+    for mapbook in mapbooks:
+        VRPS.uploadPDF(mapbook['pdf'], "bench", "faketoken", session)
+    VRPS.flushMessages()
+    return time.time() - start
+
+
+def pipelined(server, names, date, folder, factory, pool_size, workers, max_pending=None):
+    """Uploads each route and PDF as soon as its book is rendered. Returns
+    the wall time, the PDFs uploaded and the most routes pending at once."""
+    packages = makePackages(names, date)
+    session = VRPS.AGOLSession(server.base_url, max_requests=workers)
+    start = time.time()
+    jobs = [(name, os.path.join(folder, name + ".pdf")) for name in names]
+    tracker = VRPS.PublishJobTracker("bench", "faketoken", session, interval=0.2)
+    uploads = VRPS.UploadPipeline("bench", "faketoken", session, workers, \
+                                  tracker=tracker, max_pending=max_pending)
+    for mapbook in VRPS.iterMapbooks(jobs, factory, os.path.join(folder, "temp"), pool_size):
+        uploads.submit(mapbook['name'], date, packages[mapbook['name']][0], \
+                       packages[mapbook['name']][1], mapbook['pdf'])
+    results = uploads.join()
+    tracker.stop()
+    assert len([name for name in names if None not in results[name]]) == len(names)
+    return time.time() - start, len(uploads.pdfs), uploads.most_pending
+
+
+class FailingWebmapPublisher:
+    """Publishes instantly and fails every webmap."""
+    def __init__(self):
+        self.count = 0
+
+    def publishPackage(self, file_name, archive, layer_name, share_queue=None):
+        self.count += 1
+        return [file_name, "http://services/{0}".format(self.count), "item{0}".format(self.count)]
+
+    def makeWebmap(self, name, date, route_service, order_service, share_queue=None):
+        raise RuntimeError("webmap failed")
+
+    def uploadPDF(self, pdf_path, key=None):
+        time.sleep(0.05)
+        return {"pdf_" + os.path.basename(pdf_path): os.path.basename(pdf_path)}
+
+
+def checkWebmapErrors(folder, route_count=6):
+    """Without a tracker a failed webmap is reported and its route finished
+    once, so join still waits for the PDFs."""
+    date = "01_01_2030"
+    names = synthetic.routeNames(route_count)
+    packages = makePackages(names, date, 1024)
+    fake_arcpy.install(0, 0, [])
+    uploads = VRPS.UploadPipeline("bench", "faketoken", workers=2, \
+                                  publisher=FailingWebmapPublisher())
+    for name in names:
+        pdf_path = os.path.join(folder, name + ".pdf")
+        open(pdf_path, "wb").close()
+        uploads.submit(name, date, packages[name][0], packages[name][1], pdf_path)
+    uploads.join()
+    texts = [text for kind, text in fake_arcpy.messages()]
+    assert uploads._pending == 0, uploads._pending
+    assert len(uploads.pdfs) == route_count
+    assert len([text for text in texts if "Finsihed uploading" in text]) == route_count
+    assert len([text for text in texts if "webmap failed" in text]) == route_count
+    print "Failed webmaps are reported and each route is finished once."
+
+
+def main(route_count=24, pages=10, page_time=0.02, latency=0.02, pool_size=2, workers=4):
+    """Times both orders and checks the backpressure."""
+    date = "01_01_2030"
+    names = synthetic.routeNames(route_count)
+    folder = tempfile.mkdtemp()
+    server = FakeAGOL(latency, publish_delay=0.5).start()
+    factory = StubRendererFactory(pages, page_time)
+    try:
+        checkWebmapErrors(folder)
+        print "{0} routes, {1} pages of {2} s, {3} render workers, {4} upload threads".format(\
+              route_count, pages, page_time, pool_size, workers)
+        serial = sequential(server, names, date, folder, factory, pool_size, workers)
+        print "Render, then upload, then PDFs: {0:.2f} s".format(serial)
+        elapsed, pdfs, most_pending = pipelined(server, names, date, folder, factory, \
+                                                pool_size, workers)
+        assert pdfs == route_count
+        print "Pipelined:                      {0:.2f} s ({1:.1f}x), at most {2} pending".format(\
+              elapsed, serial / elapsed, most_pending)
+
+        # uploads much slower than rendering must hold the rendering back
+        slow_server = FakeAGOL(0.1, publish_delay=0.5).start()
+        try:
+            elapsed, pdfs, most_pending = pipelined(slow_server, names, date, folder, \
+                                          StubRendererFactory(1, 0.0), pool_size, 2, max_pending=4)
+        finally:
+            slow_server.stop()
+        print "Slow uploads with max_pending 4: {0:.2f} s, at most {1} pending".format(\
+              elapsed, most_pending)
+        assert most_pending <= 4
+    finally:
+        server.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
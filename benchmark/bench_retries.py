@@ -0,0 +1,148 @@
+'''
+Title: Retry and rate limit benchmark
+Created: 10/17/2026
+
+Description: Uploads routes and PDFs to the fake ArcGIS Online server while
+it throttles, fails and loses the responses of a share of the requests, and
+checks that every route and PDF still uploads without creating duplicate
+items. A rerun on the same day through lost responses must add its own
+items rather than take the earlier run's items with the same titles for
+its own. Then compares uploads with and without a requests-per-second cap
+against a server that throttles above a set rate.
+'''
+import os, sys, time, tempfile, shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+fake_arcpy.install(0, 0, [])
+import VRPS
+import synthetic
+from fake_agol import FakeAGOL
+from bench_uploads import makePackages
+
+
+def uploadRoutes(server, names, date, workers=4, max_rate=None, pdf_folder=None):
+    """Uploads every route's packages and, if a folder is given, its PDF.
+    Returns the number of routes and PDFs that failed and the wall time."""
+    packages = makePackages(names, date, size=1024)
+    # with 15% of requests failing, four retries run out on about one run in
+    # twenty, so the benchmark allows more
+    session = VRPS.AGOLSession(server.base_url, max_requests=workers, retries=8, \
+                               backoff=0.05, max_backoff=1.0, max_rate=max_rate)
+    start = time.time()
+    tracker = VRPS.PublishJobTracker("bench", "faketoken", session, interval=0.2)
+    uploads = VRPS.UploadPipeline("bench", "faketoken", session, workers, tracker=tracker)
+    for name in names:
+        uploads.submit(name, date, packages[name][0], packages[name][1])
+    results = uploads.join()
+    tracker.stop()
+    failed = len([name for name in names if None in results[name]])
+    if pdf_folder != None:
+        for name in names:
+            pdf_path = os.path.join(pdf_folder, "{0}_RouteBook_{1}.pdf".format(name, date))
+            out = open(pdf_path, "wb")
+            out.write(os.urandom(2048))
+            out.close()
+            if VRPS.uploadPDF(pdf_path, "bench", "faketoken", session) == None:
+                failed += 1
+        VRPS.flushMessages()
+    return failed, time.time() - start
+
+
+def taggedItems(server):
+    """Returns the ids of the items that still carry a request tag."""
+    return [itemid for itemid, item in server.items.items() \
+            if [tag for tag in item['tags'] if tag.startswith("vrps-")]]
+
+
+def checkFailures(route_count, failures):
+    """Uploads through injected failures and checks nothing is lost or
+    added twice, and that no item keeps its request tag."""
+    date = "01_01_2030"
+    names = synthetic.routeNames(route_count)
+    folder = tempfile.mkdtemp()
+    server = FakeAGOL(0.005, publish_delay=0.2, failures=failures, retry_after=0).start()
+    VRPS.stats = VRPS.RunStats()
+    try:
+        failed, elapsed = uploadRoutes(server, names, date, pdf_folder=folder)
+        tagged = taggedItems(server)
+    finally:
+        server.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+    duplicates = [key for key, count in server.titles().items() if count > 1]
+    counts = VRPS.stats.counts
+    VRPS.stats = VRPS.RunStats(enabled=False)
+    print "Injected {0}: {1} routes in {2:.1f} s, {3} failed, {4} retries, {5} duplicates avoided".format(\
+          ", ".join(["{0} {1:.0%}".format(kind, rate) for kind, rate in sorted(failures.items())]), \
+          route_count, elapsed, failed, counts.get("retries", 0), counts.get("duplicates avoided", 0))
+    assert failed == 0, "{0} uploads failed".format(failed)
+    assert not duplicates, "duplicate items: {0}".format(duplicates[:5])
+    assert not tagged, "items left with a request tag: {0}".format(tagged[:5])
+
+
+def checkRerun(route_count, failures):
+    """A second run on the same day loses responses, and each of its lost
+    requests must be matched to the item it made, never to the first run's
+    item with the same title, so every title ends up with one item per
+    run."""
+    date = "01_01_2030"
+    names = synthetic.routeNames(route_count)
+    folder = tempfile.mkdtemp()
+    server = FakeAGOL(0.005, publish_delay=0.2, retry_after=0).start()
+    VRPS.stats = VRPS.RunStats()
+    try:
+        failed, elapsed = uploadRoutes(server, names, date, pdf_folder=folder)
+        assert failed == 0
+        assert not taggedItems(server), "the request tags were not removed"
+        first = set(server.items)
+        # an item from the first run is found by its own tag only
+        itemid = sorted(first)[0]
+        item = server.items[itemid]
+        session = VRPS.AGOLSession(server.base_url)
+        assert VRPS._addedItem(session, "bench", "faketoken", item['title'], item['type'], \
+                               VRPS.requestTag()) == None
+        server.items[itemid]['tags'].append("vrps-first")
+        assert VRPS._addedItem(session, "bench", "faketoken", item['title'], item['type'], \
+                               "vrps-first") == {'success': True, 'id': itemid}
+        server.failures = failures
+        failed, elapsed = uploadRoutes(server, names, date, pdf_folder=folder)
+    finally:
+        server.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+    counts = VRPS.stats.counts
+    VRPS.stats = VRPS.RunStats(enabled=False)
+    wrong = [key for key, count in server.titles().items() if count != 2]
+    print "Rerun with {0} lost responses: {1} failed, {2} duplicates avoided, {3} items taken " \
+          "from the first run".format(server.counts.get("injected drop", 0), failed, \
+          counts.get("duplicates avoided", 0), len(wrong))
+    assert failed == 0, "{0} uploads failed".format(failed)
+    assert counts.get("duplicates avoided", 0) > 0
+    assert not wrong, "items not made once per run: {0}".format(wrong[:5])
+
+
+def compareRates(route_count, server_rate, client_rate):
+    """Uploads against a server that throttles above server_rate requests per
+    second with and without the session's rate cap."""
+    date = "01_01_2030"
+    names = synthetic.routeNames(route_count)
+    for max_rate in (None, client_rate):
+        server = FakeAGOL(0.0, max_rate=server_rate, retry_after=1).start()
+        try:
+            failed, elapsed = uploadRoutes(server, names, date, workers=8, max_rate=max_rate)
+        finally:
+            server.stop()
+        print "Cap {0}: {1} routes in {2:.1f} s, {3} throttled, {4} failed".format(\
+              max_rate or "none", route_count, elapsed, server.counts.get("over rate", 0), failed)
+        assert failed == 0
+
+
+def main(route_count=40):
+    """Runs the failure and rate checks."""
+    checkFailures(route_count, {'throttle': 0.05, 'error': 0.05, 'drop': 0.05})
+    checkFailures(route_count, {'drop': 0.2})
+    checkRerun(route_count, {'drop': 0.2})
+    compareRates(route_count, 40, 30)
+
+
+if __name__ == '__main__':
+    main()
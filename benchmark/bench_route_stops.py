@@ -0,0 +1,110 @@
+'''
+Title: Route stop table benchmark
+Created: 10/17/2026
+
+Description: Checks the page framing of RouteStops on small hand made routes:
+the first page frames the stop with the depot, later pages the stop with the
+stop before it, stops at the same point get a page min_size across, rows in
+any order come out in sequence, and an unknown route has no stops. Also
+reads a table through readRouteStops from fake arcpy layers and times the
+extent of every page of a large synthetic fleet.
+'''
+import os, sys, time, random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+arcpy = fake_arcpy.install(0, 0, [])
+import RouteStops
+import synthetic
+
+
+def close(extent, expected):
+    """Returns True if two extents match to a thousandth of a map unit."""
+    return max([abs(a - b) for a, b in zip(extent, expected)]) < 0.001
+
+
+def checkFraming():
+    """Pages frame the depot or the stop before, with the margin around."""
+    rows = [("A", 3, "Order 3", 300.0, 0.0),
+            ("A", 1, "Order 1", 1000.0, 1000.0),
+            ("A", 2, "Order 2", 2000.0, 1000.0),
+            ("B", 1, "Order B1", 50.0, 50.0),
+            ("B", 2, "Order B2", 50.0, 50.0),
+            (None, 1, "Unrouted", 9.0, 9.0)]
+    table = RouteStops.RouteStopTable(rows, {'A': (0.0, 0.0)})
+    # rows in any order come out in sequence, unrouted orders are dropped
+    assert [stop[0] for stop in table.stops("A")] == [1, 2, 3]
+    assert table.stop("A", 0)[1] == "Order 1" and table.count("A") == 3
+    assert sorted(table.routes) == ["A", "B"]
+
+    # the first page frames the depot and the first stop
+    assert table.pagePoints("A", 0) == [(1000.0, 1000.0), (0.0, 0.0)]
+    assert close(table.pageExtent("A", 0), (-100.0, -100.0, 1100.0, 1100.0))
+    # later pages frame the stop before, here 1000 wide and min_size high
+    assert table.pagePoints("A", 1) == [(2000.0, 1000.0), (1000.0, 1000.0)]
+    assert close(table.pageExtent("A", 1), (900.0, 700.0, 2100.0, 1300.0))
+    assert close(table.pageExtent("A", 1, margin=0.0, min_size=0.0), \
+                 (1000.0, 1000.0, 2000.0, 1000.0))
+
+    # a route without a depot frames its first stop on its own
+    assert table.pagePoints("B", 0) == [(50.0, 50.0)]
+    # stops at the same point get a page min_size across plus the margin
+    assert close(table.pageExtent("B", 1), (-250.0, -250.0, 350.0, 350.0))
+    assert close(table.pageExtent("B", 1, margin=0.0, min_size=100.0), \
+                 (0.0, 0.0, 100.0, 100.0))
+
+    # an unknown route has no stops and no pages
+    assert table.stops("C") == [] and table.count("C") == 0
+    for call in (table.stop, table.pagePoints, table.pageExtent):
+        try:
+            call("C", 0)
+            raise AssertionError("{0} returned a page of an unknown route".format(call.__name__))
+        except IndexError:
+            pass
+    print "Page framing checks out."
+
+
+def checkReadRouteStops():
+    """readRouteStops reads the orders and gives every route the depot."""
+    orders = fake_arcpy.Layer("Orders", "Point", [], \
+             [{'Name': "Order 2", 'RouteName': "A", 'Sequence': 3, 'SHAPE': ((20.0, 5.0),)},
+              {'Name': "Order 1", 'RouteName': "A", 'Sequence': 2, 'SHAPE': ((10.0, 5.0),)},
+              {'Name': "Order 3", 'RouteName': "B", 'Sequence': 2, 'SHAPE': ((30.0, 5.0),)}])
+    depots = fake_arcpy.Layer("Depots", "Point", [], \
+             [{'Name': "Other Office", 'SHAPE': ((99.0, 99.0),)},
+              {'Name': "Assessors Office", 'SHAPE': ((0.0, 0.0),)}])
+    table = RouteStops.readRouteStops(orders, depots, "Assessors Office")
+    assert [stop[1] for stop in table.stops("A")] == ["Order 1", "Order 2"]
+    assert table.depots == {'A': (0.0, 0.0), 'B': (0.0, 0.0)}
+    assert RouteStops.readRouteStops(orders).depots == {}
+    print "readRouteStops reads the orders in sequence with the depot."
+
+
+def timeExtents(route_count=2000, stop_count=40):
+    """Times the extent of every page of a synthetic fleet."""
+    rand = random.Random(0)
+    rows = []
+    for route in synthetic.routeNames(route_count):
+        for stop in range(stop_count, 0, -1):
+            rows.append((route, stop, "Order {0}-{1}".format(route, stop), \
+                         rand.uniform(0, 50000), rand.uniform(0, 50000)))
+    start = time.time()
+    table = RouteStops.RouteStopTable(rows)
+    build = time.time() - start
+    start = time.time()
+    for route in table.routes:
+        for index in range(table.count(route)):
+            table.pageExtent(route, index)
+    pages = time.time() - start
+    print "{0} pages: table {1:.3f} s, extents {2:.3f} s".format(len(rows), build, pages)
+
+
+def main():
+    """Runs the checks."""
+    checkFraming()
+    checkReadRouteStops()
+    timeExtents()
+
+
+if __name__ == '__main__':
+    main()
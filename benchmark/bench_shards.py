@@ -0,0 +1,188 @@
+'''
+Title: Shard partition benchmark
+Created: 10/17/2026
+
+Description: Checks and times the pure Python parts of the sharded solve in
+Shards.py on synthetic points. Orders are scattered around several depots
+and split by depot and into clusters, and every order and route must land
+in exactly one shard, orders with their nearest depot and routes in
+proportion to the orders of each cluster. The directions of a synthetic
+solution are split into one file per shard and merged again, and must read
+the same as the original file.
+'''
+import os, sys, time, random, tempfile, shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Shards
+import synthetic
+
+
+def syntheticFleet(order_count, route_count, depot_count, seed=0):
+    """Returns (order id, x, y) orders scattered around depot_count depots,
+    the (name, x, y) depots and (route name, start depot) routes."""
+    rand = random.Random(seed)
+    depots = [("Depot {0}".format(index + 1), 2000000.0 + index * 40000.0, \
+               700000.0 + (index % 2) * 30000.0) for index in range(depot_count)]
+    orders = []
+    for order_id in range(1, order_count + 1):
+        name, x, y = depots[rand.randrange(depot_count)]
+        orders.append((order_id, x + rand.gauss(0, 6000), y + rand.gauss(0, 6000)))
+    routes = [(name, depots[index % depot_count][0]) \
+              for index, name in enumerate(synthetic.routeNames(route_count))]
+    return orders, depots, routes
+
+
+def checkCoverage(shards, orders, routes):
+    """Every order and route must be in exactly one shard, with the depots
+    the route starts and ends at."""
+    order_ids = [order_id for shard in shards for order_id in shard['orders']]
+    route_names = [name for shard in shards for name in shard['routes']]
+    assert sorted(order_ids) == sorted([order[0] for order in orders])
+    assert sorted(route_names) == sorted([route[0] for route in routes])
+    places = dict([(route[0], route[1:]) for route in routes])
+    for shard in shards:
+        for name in shard['routes']:
+            for depot in places[name]:
+                assert not depot or depot in shard['depots'], (name, depot, shard['name'])
+
+
+def checkDepots(order_count=5000, route_count=120, depot_count=4):
+    """Orders go to their nearest depot, routes stay with their depot."""
+    orders, depots, routes = syntheticFleet(order_count, route_count, depot_count)
+    start = time.time()
+    shards = Shards.partitionByDepot(orders, depots, routes)
+    elapsed = time.time() - start
+    checkCoverage(shards, orders, routes)
+    assert len(shards) == depot_count
+    places = dict([(name, (x, y)) for name, x, y in depots])
+    lookup = dict([(order[0], order) for order in orders])
+    for shard in shards:
+        depot_x, depot_y = places[shard['depots'][0]]
+        for order_id in shard['orders'][:200]:
+            order_id, x, y = lookup[order_id]
+            mine = (x - depot_x) ** 2 + (y - depot_y) ** 2
+            assert mine <= min([(x - dx) ** 2 + (y - dy) ** 2 for dx, dy in places.values()])
+    print "By depot: {0} orders into {1} shards of {2} orders in {3:.3f} s".format(\
+          order_count, len(shards), "/".join([str(len(shard['orders'])) for shard in shards]), elapsed)
+
+
+def checkMissingDepots():
+    """Routes without a start depot still go to a shard, and a route whose
+    depot is not in the depots table is an error."""
+    orders = [(1, 0.0, 0.0), (2, 1.0, 0.0), (3, 100.0, 0.0), (4, 101.0, 0.0), (5, 102.0, 0.0)]
+    depots = [("A", 0.0, 0.0), ("C", 100.0, 0.0)]
+    routes = [("r1", "A"), ("r2", ""), ("r3", None), ("r4", "C")]
+    shards = Shards.partitionByDepot(orders, depots, routes)
+    checkCoverage(shards, orders, routes)
+    # the depot C shard has the most orders for each route, then both tie
+    assert [shard['routes'] for shard in shards] == [["r1", "r3"], ["r4", "r2"]], shards
+    for routes in ([("r1", "A"), ("r3", "B")], [("r2", "")], []):
+        try:
+            Shards.partitionByDepot(orders, depots, routes)
+            raise AssertionError("{0} were split by depot".format(routes))
+        except ValueError:
+            pass
+    print "Routes without a depot are shared out, unknown depots are errors."
+
+
+def checkEndDepots():
+    """A route that ends at another shard's depot takes that depot with it,
+    and an unknown end depot is an error."""
+    orders = [(1, 0.0, 0.0), (2, 1.0, 0.0), (3, 100.0, 0.0), (4, 101.0, 0.0)]
+    depots = [("A", 0.0, 0.0), ("C", 100.0, 0.0)]
+    routes = [("r1", "A", "C"), ("r2", "A", "A"), ("r3", "C", None), ("r4", "", "A")]
+    shards = Shards.partitionByDepot(orders, depots, routes)
+    checkCoverage(shards, orders, routes)
+    assert [shard['depots'] for shard in shards] == [["A", "C"], ["C", "A"]], shards
+    try:
+        Shards.partitionByDepot(orders, depots, [("r1", "A", "B")])
+        raise AssertionError("a route ending at an unknown depot was split by depot")
+    except ValueError:
+        pass
+    print "Routes keep the depots they end at, unknown end depots are errors."
+
+
+def checkClusters(order_count=5000, route_count=120, count=6):
+    """Clusters cover everything and get routes in proportion to orders."""
+    orders, depots, routes = syntheticFleet(order_count, route_count, 2)
+    routes = [route[0] for route in routes]
+    start = time.time()
+    shards = Shards.partitionByCluster(orders, depots, routes, count)
+    elapsed = time.time() - start
+    checkCoverage(shards, orders, [(name,) for name in routes])
+    assert len(shards) == count
+    # routes can start and end at any depot
+    assert [shard['depots'] for shard in shards] == [["Depot 1", "Depot 2"]] * count
+    for shard in shards:
+        share = float(len(shard['orders'])) / order_count * route_count
+        assert abs(len(shard['routes']) - share) <= 1.0, (shard['name'], share)
+    # the same seed gives the same shards
+    again = Shards.partitionByCluster(orders, depots, routes, count)
+    assert [shard['orders'] for shard in again] == [shard['orders'] for shard in shards]
+    # never more shards than routes, and every shard gets a route
+    few = Shards.partitionByCluster(orders, depots, routes[:3], count)
+    assert len(few) == 3 and min([len(shard['routes']) for shard in few]) == 1
+    print "By cluster: {0} orders into {1} shards of {2} orders in {3:.3f} s".format(\
+          order_count, len(shards), "/".join([str(len(shard['orders'])) for shard in shards]), elapsed)
+
+
+def checkAllocate():
+    """Route shares add up and give every cluster at least one route."""
+    assert Shards.allocate(10, [5, 3, 2]) == [5, 3, 2]
+    assert Shards.allocate(4, [100, 1, 1]) == [2, 1, 1]
+    assert Shards.allocate(7, [0, 10, 10]) == [0, 4, 3]
+    assert sum(Shards.allocate(101, [37, 13, 50, 1])) == 101
+    assert Shards.whereIn("Name", ["A", "O'Neil"]) == "Name IN ('A', 'O''Neil')"
+    assert Shards.whereIn("OBJECTID", [1, 2], quote=False) == "OBJECTID IN (1, 2)"
+    assert Shards.whereIn("Name", []) == "1 = 0"
+    print "Route allocation and where clauses check out."
+
+
+def checkMerge(folder, route_count=200, stop_count=10, shard_count=4):
+    """Directions split into shard files merge back to the same text."""
+    directions = os.path.join(folder, "directions.txt")
+    synthetic.writeDirections(directions, route_count, stop_count)
+    read = open(directions)
+    text = read.read()
+    read.close()
+    blocks = ["Begin route " + block for block in text.split("Begin route ")[1:]]
+    paths = []
+    for shard in range(shard_count):
+        path = os.path.join(folder, "shard_{0}_directions.txt".format(shard + 1))
+        out = open(path, "w")
+        out.write("".join(blocks[shard::shard_count]))
+        out.close()
+        paths.append(path)
+    merged = os.path.join(folder, "merged.txt")
+    names = Shards.mergeDirections(paths, merged)
+    assert sorted(names) == synthetic.routeNames(route_count)
+    read = open(merged)
+    merged_blocks = ["Begin route " + block for block in read.read().split("Begin route ")[1:]]
+    read.close()
+    assert sorted(merged_blocks) == sorted(blocks)
+    try:
+        Shards.mergeDirections(paths + paths[:1], merged)
+        raise AssertionError("a route in two shards was merged")
+    except ValueError:
+        pass
+    print "Merged directions of {0} shards match the original {1} routes.".format(\
+          shard_count, route_count)
+
+
+def main():
+    """Runs the checks."""
+    folder = tempfile.mkdtemp()
+    try:
+        checkAllocate()
+        checkDepots()
+        checkMissingDepots()
+        checkEndDepots()
+        checkClusters()
+        checkClusters(20000, 400, 8)
+        checkMerge(folder)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+'''
+Title: Share queue benchmark
+Created: 10/17/2026
+
+Description: Checks how VRPS.ShareQueue splits the queued items into
+shareItems requests and maps the results back to the routes. Each route
+queues its PDF, two feature services and webmap, and the route count is
+chosen so neither the routes nor the items divide evenly into chunks. One
+chunk fails on the fake server. Its items must come back as not shared,
+every other item as shared, and finishScenario must record only the routes
+whose items were all shared.
+'''
+import os, sys, tempfile, shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+fake_arcpy.install(0, 0, [])
+import VRPS
+import Project_core_sawendel
+import synthetic
+from fake_agol import FakeAGOL
+
+
+class Uploads:
+    """Stands in for a joined UploadPipeline with each route's item ids."""
+    def __init__(self):
+        self.results = {}
+        self.pdfs = {}
+        self.webmaps = {}
+
+
+def queueRoutes(server, shares, names):
+    """Adds a PDF, Routes and Orders services and a webmap for each route to
+    the server and the share queue. Returns the Uploads and each route's
+    item ids."""
+    uploads = Uploads()
+    route_items = {}
+    for name in names:
+        items = [server.newItem({'title': "{0}_{1}".format(name, kind)}) \
+                 for kind in ("pdf", "Routes", "Orders", "webmap")]
+        for item, kind in zip(items, ("pdf", "Routes", "Orders", "webmap")):
+            shares.add(item, "{0} {1}".format(name, kind))
+        uploads.pdfs[name] = (items[0], None)
+        uploads.results[name] = [(None, None, items[1]), (None, None, items[2])]
+        uploads.webmaps[name] = items[3]
+        route_items[name] = items
+    # an item queued twice is only shared once
+    shares.add(route_items[names[0]][0], "{0} pdf".format(names[0]))
+    return uploads, route_items
+
+
+def checkChunks(route_count=13, chunk_size=10, failed_chunk=2):
+    """Chunks hold chunk_size items but the last, the failed chunk's items
+    are not shared and only routes with every item shared are recorded."""
+    server = FakeAGOL().start()
+    session = VRPS.AGOLSession(server.base_url, retries=0)
+    folder = tempfile.mkdtemp()
+    try:
+        shares = VRPS.ShareQueue(chunk_size)
+        names = synthetic.routeNames(route_count)
+        uploads, route_items = queueRoutes(server, shares, names)
+        queued = list(shares.items)
+        assert len(queued) == route_count * 4
+        chunks = [queued[start:start + chunk_size] for start in range(0, len(queued), chunk_size)]
+        server.fail_shares.add(chunks[failed_chunk][-1])
+
+        shared = shares.flush("bench", "token", session)
+        VRPS.flushMessages()
+        assert server.share_requests == chunks, [len(chunk) for chunk in server.share_requests]
+        assert [len(chunk) for chunk in chunks][-2:] == [chunk_size, len(queued) % chunk_size]
+        assert sorted(shared) == sorted(queued)
+        for item in queued:
+            expected = item not in chunks[failed_chunk]
+            assert shared[item] == expected == server.items[item]['shared'], item
+        assert shares.items == [] and shares.flush("bench", "token", session) == {}
+
+        manifest = VRPS.RouteManifest(folder)
+        mapbooks = [{'name': name} for name in names]
+        hashes = dict([(name, "hash " + name) for name in names])
+        Project_core_sawendel.finishScenario(uploads, mapbooks, manifest, hashes, shared)
+        failed = set(chunks[failed_chunk])
+        recorded = [name for name in names if not failed.intersection(route_items[name])]
+        assert sorted(VRPS.RouteManifest(folder).routes) == recorded
+        # each route queued 4 items in turn, so the failed chunk holds items
+        # of the routes its positions fall in, cutting across some of them
+        start = failed_chunk * chunk_size
+        touched = set([names[index // 4] for index in range(start, start + len(chunks[failed_chunk]))])
+        assert len(recorded) == route_count - len(touched), (recorded, touched)
+        assert manifest.routes[recorded[0]]['outputs']['webmap'] == route_items[recorded[0]][3]
+    finally:
+        # close the kept alive connection before the server stops
+        session.session.close()
+        server.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+    print "{0} items in {1} chunks of {2}, chunk {3} failed: {4} of {5} routes recorded.".format(\
+          len(queued), len(chunks), chunk_size, failed_chunk + 1, len(recorded), route_count)
+
+
+def main():
+    """Runs the checks."""
+    checkChunks()
+    checkChunks(route_count=7, chunk_size=3, failed_chunk=0)
+
+
+if __name__ == '__main__':
+    main()
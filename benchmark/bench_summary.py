@@ -0,0 +1,158 @@
+'''
+Title: Route summary benchmark
+Created: 10/17/2026
+
+Description: Times RouteSummary.summarizeDirections on synthetic directions
+files with more and more routes, and checks its totals against a plain line
+by line count of the same files and against reading them in small blocks.
+Also checks a small hand written file with feet, "< 1 min" maneuvers and a
+maneuver without a time. Run with --memory to compare the peak memory of
+the summary as the file grows; the script fails if it does not stay flat.
+'''
+import os, sys, re, time, tempfile, shutil
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import RouteSummary
+import synthetic
+
+
+def countLines(path):
+    """Works out each route's totals one line at a time, the way they were
+    added up by hand. Returns {route: [stops, minutes, miles, longest leg]}."""
+    totals = {}
+    name = None
+    leg = 0.0
+    read = open(path)
+    for line in read:
+        if line.startswith("Begin route "):
+            name = line.split("Begin route ", 1)[1].strip()
+            totals[name] = [0, 0.0, 0.0, 0.0]
+            leg = 0.0
+        elif name is None or not re.match(r"\s*\d+:", line):
+            continue
+        elif "Arrive at" in line:
+            totals[name][0] += 1
+            totals[name][3] = max(totals[name][3], leg)
+            leg = 0.0
+        elif " mi " in line:
+            fields = line.split()
+            miles = float(fields[fields.index("mi") - 1])
+            totals[name][1] += float(fields[fields.index("min") - 1])
+            totals[name][2] += miles
+            leg += miles
+        if line.startswith("End of route") or "Finish at" in line:
+            totals[name][3] = max(totals[name][3], leg)
+    read.close()
+    return totals
+
+
+def checkTotals(summary, totals):
+    """The vectorized totals must match the line by line count."""
+    assert sorted(summary.names) == sorted(totals)
+    for name in summary.names:
+        route = summary.route(name)
+        stops, minutes, miles, longest = totals[name]
+        assert route['stops'] == stops, name
+        assert abs(route['drive_minutes'] - minutes) < 0.1, name
+        assert abs(route['miles'] - miles) < 0.01, name
+        assert abs(route['longest_leg_miles'] - longest) < 0.01, name
+
+
+def checkBlocks(directions, summary):
+    """Blocks smaller than a route, and lines before the first route, must
+    give the same totals as reading the file in one block."""
+    for block_size in (50, 4096):
+        blocks = RouteSummary.summarizeDirections(directions, block_size)
+        assert blocks.names == summary.names, block_size
+        for total in RouteSummary.CSV_FIELDS[1:]:
+            assert numpy.array_equal(getattr(blocks, total), getattr(summary, total)), total
+    read = open(directions)
+    text = read.read()
+    read.close()
+    preface = directions + ".preface"
+    out = open(preface, "w")
+    out.write("Directions\n1:  Go 0.5 mi  3 min\n" + text)
+    out.close()
+    assert RouteSummary.summarizeDirections(preface, 64).route(summary.names[0]) == \
+           summary.route(summary.names[0])
+    os.remove(preface)
+
+
+def memory():
+    """Fails if the summary's peak memory grows with the directions file."""
+    synthetic.memoryGrowth("Summary", ["import RouteSummary",
+                           "RouteSummary.summarizeDirections({directions!r})"])
+
+
+def checkFormats():
+    """Feet, "< 1 min", a maneuver without a time and tied legs are read."""
+    text = "\n".join(["Header line 1:  0.5 mi  3 min",
+                      "Begin route A",
+                      "    Total time: 12 min   Total distance: 2.0 mi",
+                      "1:  Start at Depot",
+                      "2:  Go north on MAIN ST          1,056 ft    < 1 min",
+                      "3:  Turn left on OAK ST          1.5 mi    4 min",
+                      "4:  Arrive at Order 1              8:05 AM",
+                      "    Service time: 30 min",
+                      "5:  Continue on OAK ST           0.3 mi",
+                      "6:  Finish at Depot",
+                      "End of route A", ""])
+    summary = RouteSummary.parseDirections(text)
+    route = summary.route("A")
+    assert summary.names == ["A"]
+    assert route['stops'] == 1
+    assert route['miles'] == 2.0, route
+    assert route['drive_minutes'] == 4.5, route
+    assert route['longest_leg_miles'] == 1.7 and route['longest_leg_minutes'] == 4.5, route
+    assert RouteSummary.parseDirections("no routes").names == []
+    # two legs of the same length, the first one's time is kept
+    ties = RouteSummary.parseDirections("\n".join(["Begin route B",
+                      "1:  Start at Depot",
+                      "2:  Go north on MAIN ST          1.0 mi    3 min",
+                      "3:  Arrive at Order 1              8:05 AM",
+                      "4:  Go south on MAIN ST          1.0 mi    5 min",
+                      "5:  Arrive at Order 2              8:40 AM",
+                      "6:  Finish at Depot",
+                      "End of route B",
+                      "Begin route C",
+                      "1:  Start at Depot",
+                      "2:  Go east on OAK ST            0.5 mi    2 min",
+                      "3:  Finish at Depot",
+                      "End of route C", ""]))
+    assert ties.route("B")['longest_leg_minutes'] == 3.0, ties.route("B")
+    assert ties.route("C")['longest_leg_miles'] == 0.5, ties.route("C")
+    print "Feet, < 1 min, untimed maneuvers and tied legs read correctly."
+
+
+def main(sizes=(100, 1000, 4000), stop_count=10):
+    """Times the summary for each number of routes."""
+    folder = tempfile.mkdtemp()
+    try:
+        checkFormats()
+        directions = os.path.join(folder, "directions.txt")
+        for route_count in sizes:
+            lines = synthetic.writeDirections(directions, route_count, stop_count)
+            start = time.time()
+            summary = RouteSummary.summarizeDirections(directions)
+            elapsed = time.time() - start
+            start = time.time()
+            totals = countLines(directions)
+            by_line = time.time() - start
+            checkTotals(summary, totals)
+            if route_count == sizes[0]:
+                checkBlocks(directions, summary)
+            summary.write(folder)
+            fleet = summary.fleet()
+            print "{0:5d} routes, {1:7d} lines: {2:.3f} s (line by line {3:.3f} s), " \
+                  "{4:.0f} mi, longest leg {5} mi on {6}".format(route_count, lines, elapsed, \
+                  by_line, fleet['miles'], fleet['longest_leg_miles'], fleet['longest_leg_route'])
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if "--memory" in sys.argv:
+        memory()
+    else:
+        main()
@@ -0,0 +1,113 @@
+'''
+Title: Token refresh benchmark
+Created: 10/17/2026
+
+Description: Checks VRPS.TokenManager against the fake ArcGIS Online server
+with tokens that expire every few seconds. Routes are uploaded while the
+tokens expire on their own and while every token is revoked partway
+through, and no upload may fail. Also checks that a cached token is reused
+by a new manager and that threads that see the same rejected token only
+cause one refresh.
+'''
+import os, sys, time, tempfile, shutil, threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+fake_arcpy.install(0, 0, [])
+import VRPS
+import synthetic
+from fake_agol import FakeAGOL
+from bench_uploads import makePackages
+
+
+def uploadRoutes(server, tokens, names, date, workers=4, revoke_after=None):
+    """Uploads a route package for every name and returns the number of
+    routes that failed and the wall time."""
+    packages = makePackages(names, date, size=1024)
+    session = VRPS.AGOLSession(server.base_url, max_requests=workers, tokens=tokens)
+    token = tokens.get()
+    start = time.time()
+    tracker = VRPS.PublishJobTracker("bench", token, session, interval=0.2)
+    uploads = VRPS.UploadPipeline("bench", token, session, workers, tracker=tracker)
+    for number, name in enumerate(names):
+        if number == revoke_after:
+            server.expireTokens()
+        uploads.submit(name, date, packages[name][0], packages[name][1])
+        time.sleep(0.05)
+    results = uploads.join()
+    tracker.stop()
+    failed = len([name for name in names if None in results[name]])
+    return failed, time.time() - start
+
+
+def checkCache(server, folder):
+    """A second manager with the same cache file must not ask for a token.
+    The cache goes in the user's application data folder."""
+    saved = os.environ.get("LOCALAPPDATA")
+    os.environ["LOCALAPPDATA"] = os.path.join(folder, "LocalAppData")
+    try:
+        cache_path = VRPS.tokenCachePath()
+    finally:
+        if saved == None:
+            del os.environ["LOCALAPPDATA"]
+        else:
+            os.environ["LOCALAPPDATA"] = saved
+    assert cache_path == os.path.join(folder, "LocalAppData", "VRPS", "token_cache.json")
+    assert os.path.isdir(os.path.dirname(cache_path))
+    first = VRPS.TokenManager("bench", "password", "http://localhost", \
+            server.base_url + "/generateToken", refresh_margin=1, cache_path=cache_path)
+    token = first.get()
+    requests_made = server.counts.get("generateToken", 0)
+    second = VRPS.TokenManager("bench", "password", "http://localhost", \
+             server.base_url + "/generateToken", refresh_margin=1, cache_path=cache_path)
+    assert second.get() == token
+    assert server.counts.get("generateToken", 0) == requests_made
+    if os.name != "nt":
+        assert os.stat(cache_path).st_mode & 0077 == 0
+    print "Cached token reused without a new request."
+
+
+def checkConcurrentRefresh(server):
+    """Threads that all see the same rejected token must share one refresh."""
+    tokens = VRPS.TokenManager("bench", "password", "http://localhost", \
+             server.base_url + "/generateToken", refresh_margin=1)
+    stale = tokens.get()
+    refreshed = []
+    threads = [threading.Thread(target=lambda: refreshed.append(tokens.refresh(stale))) \
+               for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(refreshed)) == 1 and refreshed[0] != stale
+    assert tokens.refreshes == 2
+    print "16 threads refreshing the same token made 1 request."
+
+
+def main(route_count=40, token_lifetime=2.0):
+    """Runs the checks and the uploads."""
+    date = "01_01_2030"
+    names = synthetic.routeNames(route_count)
+    folder = tempfile.mkdtemp()
+    server = FakeAGOL(0.01, publish_delay=0.3, token_lifetime=token_lifetime).start()
+    try:
+        checkCache(server, folder)
+        checkConcurrentRefresh(server)
+        tokens = VRPS.TokenManager("bench", "password", "http://localhost", \
+                 server.base_url + "/generateToken", refresh_margin=1)
+        failed, elapsed = uploadRoutes(server, tokens, names, date)
+        print "Tokens lasting {0} s: {1} routes in {2:.1f} s, {3} failed, {4} tokens made".format(\
+              token_lifetime, route_count, elapsed, failed, tokens.refreshes)
+        assert failed == 0
+        rejected = server.counts.get("rejected tokens", 0)
+        failed, elapsed = uploadRoutes(server, tokens, names, date, revoke_after=route_count // 2)
+        print "Tokens revoked partway: {0} routes in {1:.1f} s, {2} failed, {3} requests retried".format(\
+              route_count, elapsed, failed, server.counts.get("rejected tokens", 0) - rejected)
+        assert failed == 0
+    finally:
+        server.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
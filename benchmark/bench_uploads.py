@@ -0,0 +1,136 @@
+'''
+Title: Upload pipeline benchmark
+Created: 10/17/2026
+
+Description: Uploads, publishes and shares synthetic route packages through
+VRPS.UploadPipeline against the local fake ArcGIS Online server and compares
+one upload thread with several. Publish jobs take publish_delay seconds to
+finish and are waited on with a VRPS.PublishJobTracker.
+
+Also checks that a multipart upload that stopped partway resumes on the
+same item when the book is written again with the same contents, and that
+the partial item is deleted when the book changed.
+'''
+import os, sys, time, io, zipfile, tempfile, shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+fake_arcpy.install(0, 0, [])
+import VRPS
+import synthetic
+from fake_agol import FakeAGOL
+
+
+def makePackages(names, date, size=65536):
+    """Makes a small in-memory zip for the Routes and Orders layers of every
+    route and returns them as {route name: [route package, order package]}."""
+    packages = {}
+    for name in names:
+        packages[name] = []
+        for layer_name in ("Routes", "Orders"):
+            file_name = "{0}_{1}_{2}".format(name, layer_name, date)
+            archive = io.BytesIO()
+            zf = zipfile.ZipFile(archive, "w")
+            zf.writestr(file_name + ".shp", os.urandom(size))
+            zf.close()
+            packages[name].append([file_name, archive, layer_name])
+    return packages
+
+
+def run(server, packages, names, date, workers):
+    """Uploads every package and returns the wall time and the connections
+    the server saw."""
+    connections = server.counts.get("connections", 0)
+    session = VRPS.AGOLSession(server.base_url, max_requests=workers)
+    start = time.time()
+    tracker = VRPS.PublishJobTracker("bench", "faketoken", session, interval=0.2)
+    uploads = VRPS.UploadPipeline("bench", "faketoken", session, workers, tracker=tracker)
+    for name in names:
+        for package in packages[name]:
+            package[1].seek(0)
+        uploads.submit(name, date, packages[name][0], packages[name][1])
+    results = uploads.join()
+    elapsed = time.time() - start
+    tracker.stop()
+    assert len([name for name in names if None not in results[name]]) == len(names)
+    return elapsed, server.counts.get("connections", 0) - connections
+
+
+def writeBook(path, seed, size=3 * 1048576):
+    """Writes a mapbook stand-in of size bytes made from the seed."""
+    block = (seed * (1048576 // len(seed) + 1))[:1048576]
+    out = open(path, "wb")
+    for index in range(size // 1048576):
+        out.write(block)
+    out.close()
+
+
+def checkResume(part_size=524288):
+    """A stopped upload resumes after the book is written again with the
+    same contents and a new modified time, and its item is deleted when the
+    book or its route changed."""
+    folder = tempfile.mkdtemp()
+    server = FakeAGOL().start()
+    # failed parts are not sent again, so the upload stops
+    session = VRPS.AGOLSession(server.base_url, retries=0)
+    def upload(path, key):
+        return VRPS.addFileItem(path, os.path.basename(path), os.path.basename(path), \
+               "PDF", "bench", "faketoken", session, chunk_threshold=1048576, \
+               part_size=part_size, workers=2, key=key)
+    try:
+        path = os.path.join(folder, "Route_1_RouteBook_01_01_2030.pdf")
+        writeBook(path, "first book")
+        server.fail_parts = set([3])
+        assert 'error' in upload(path, "route hash")
+        assert VRPS.uploadInProgress(path, "route hash", part_size)
+        first_item = [itemid for itemid in server.items][0]
+
+        # the book is written again with the same contents, as a rerun would
+        time.sleep(0.01)
+        writeBook(path, "first book")
+        os.utime(path, (time.time() + 60, time.time() + 60))
+        assert VRPS.uploadInProgress(path, "route hash", part_size)
+        assert not VRPS.uploadInProgress(path, "other route hash", part_size)
+        added = server.counts.get("addItem", 0)
+        status = upload(path, "route hash")
+        assert status == {'success': True, 'id': first_item}, status
+        assert server.counts.get("addItem", 0) == added
+        assert server.items[first_item].get('committed')
+        assert not VRPS.uploadInProgress(path, "route hash", part_size)
+
+        # a changed book starts over and deletes the partial item
+        server.fail_parts = set([2])
+        assert 'error' in upload(path, "route hash")
+        partial = [itemid for itemid in server.items if itemid != first_item][0]
+        writeBook(path, "second book")
+        assert not VRPS.uploadInProgress(path, "route hash", part_size)
+        status = upload(path, "route hash")
+        assert status.get('success') and status['id'] not in (first_item, partial), status
+        assert partial not in server.items
+        VRPS.flushMessages()
+    finally:
+        server.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+    print "Stopped uploads resume after a rewrite and partial items of changed books are deleted."
+
+
+def main(route_count=40, latency=0.05, publish_delay=1.0, worker_counts=(1, 4, 8)):
+    """Times the pipeline for each number of upload threads."""
+    checkResume()
+    date = "01_01_2030"
+    names = synthetic.routeNames(route_count)
+    packages = makePackages(names, date)
+    server = FakeAGOL(latency, publish_delay=publish_delay).start()
+    print "{0} routes, {1} s server latency, {2} s publish jobs".format(route_count, latency, publish_delay)
+    serial = None
+    for workers in worker_counts:
+        elapsed, connections = run(server, packages, names, date, workers)
+        if serial is None:
+            serial = elapsed
+        print "{0:2d} thread(s): {1:.2f} s ({2:.1f}x), {3} connections".format(
+              workers, elapsed, serial / elapsed, connections)
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
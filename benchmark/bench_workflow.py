@@ -0,0 +1,252 @@
+'''
+Title: End to end workflow benchmark
+Created: 10/17/2026
+
+Description: Runs the main workflow of Project_core_sawendel.py end to end
+against the fake arcpy module and the fake ArcGIS Online server for several
+numbers of routes, and prints the time of each stage from the run report.
+Results can be saved and compared to a saved baseline, in which case the
+script exits with an error when a stage has become slower than the
+tolerance allows, the run wrote any errors or its manifest did not record
+every route as shared. With --scenarios the run is a batch of that many
+scenarios for the following business days. With --dry-run the run publishes
+to a VRPS.LocalPublisher instead of the fake server, and the items it stored
+and shared are checked. With --shard-by DEPOT or CLUSTER the VRP is solved
+in shards, with the routes starting and ending at the fake's two depots,
+and every shard must have solved in its own geodatabase.
+
+Usage: python bench_workflow.py [route counts] [--stops N] [--scenarios N]
+       [--dry-run] [--shard-by DEPOT|CLUSTER] [--shard-count N]
+       [--save results.json]
+       [--baseline results.json] [--tolerance 1.5]
+'''
+import os, sys, json, tempfile, shutil, argparse
+
+BENCHMARK = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK))
+import fake_arcpy, synthetic
+arcpy = fake_arcpy.install(0, 0, [])
+import VRPS
+import Project_core_sawendel
+from fake_agol import FakeAGOL
+
+# Stages of the core script in the order they run, the stages timed inside
+# VRPS are printed after them
+STAGES = ["token", "license", "solve", "directions", "export", "mapbooks",
+          "upload", "share"]
+
+
+def runWorkflow(route_count, stop_count=10, latency=0.0, publish_delay=0.0, \
+                pool_size=1, upload_workers=4, arcpy_latencies=None, scenarios=0, \
+                dry_run=False, shard_by=None, shard_count=4):
+    """Runs the workflow once on synthetic data in a new output folder and
+    returns the run report with the number of errors written. With a number
+    of scenarios the run is a batch run of that many scenarios. A dry run
+    publishes to a local folder and adds the number of stored items of each
+    type to the report. shard_by DEPOT or CLUSTER solves in shards."""
+    folder = tempfile.mkdtemp(prefix="bench_workflow_")
+    server = FakeAGOL(latency, publish_delay=publish_delay).start()
+    VRPS.AGOL_URL = server.base_url
+    VRPS.TOKEN_URL = server.base_url + "/generateToken"
+    try:
+        template = os.path.join(folder, "template.mxd")
+        open(template, "wb").close()
+        routestable = os.path.join(folder, "routes.dbf")
+        parameters = ["network", "TravelTime", "Minutes", "orders", "depots", \
+                      routestable, folder, template, "bench", "password", \
+                      str(pool_size), str(upload_workers), "false", "true", "true"]
+        optional = [""] * 8
+        if scenarios:
+            scenario_table = os.path.join(folder, "scenarios.csv")
+            out = open(scenario_table, "wb")
+            out.write("name,date,orders,routes,depots\n")
+            for number in range(scenarios):
+                out.write("scenario_{0},,,,\n".format(number + 1))
+            out.close()
+            optional[3] = scenario_table
+        publish_folder = os.path.join(folder, "dry_run")
+        if dry_run:
+            optional[7] = publish_folder
+        if shard_by:
+            optional[5] = shard_by
+            optional[6] = str(shard_count)
+        parameters += optional
+        fake_arcpy.install(route_count, stop_count, parameters, arcpy_latencies)
+        # routes take turns at the two depots and every third ends at the other
+        depots = ["Assessors Office", "Annex"]
+        fake_arcpy.addTable(routestable, ["Name", "StartDepotName", "EndDepotName"], \
+                            [{'Name': name, 'StartDepotName': depots[index % 2],
+                              'EndDepotName': depots[(index + (index % 3 == 0)) % 2]} \
+                             for index, name in enumerate(synthetic.routeNames(route_count))])
+        Project_core_sawendel.main()
+        VRPS.flushMessages()
+        read = open(os.path.join(folder, "run_report.json"))
+        report = json.load(read)
+        read.close()
+        report['errors'] = [text for kind, text in fake_arcpy.messages() if kind == "AddError"]
+        report['requests_served'] = server.counts.get("requests", 0)
+        report['errors'] += checkManifests(folder, route_count * max(scenarios, 1))
+        if dry_run:
+            report['errors'] += checkDryRun(publish_folder, route_count * max(scenarios, 1))
+        if shard_by:
+            report['errors'] += checkShards(folder)
+        return report
+    finally:
+        server.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def checkManifests(folder, route_count):
+    """Returns errors unless the manifests in the output folder record every
+    route with its PDF, feature services and webmap."""
+    errors = []
+    routes = {}
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            if name in ("route_manifest.json", "dry_run_manifest.json"):
+                read = open(os.path.join(root, name))
+                for route, entry in json.load(read).items():
+                    routes[os.path.join(root, route)] = entry
+                read.close()
+    if len(routes) != route_count:
+        errors.append("The manifests recorded {0} of {1} routes".format(len(routes), route_count))
+    for route in sorted(routes):
+        outputs = routes[route]['outputs']
+        missing = [key for key in ("pdf", "routes", "orders", "webmap") if not outputs.get(key)]
+        if missing:
+            errors.append("The manifest has no {0} for {1}".format(", ".join(missing), route))
+    return errors
+
+
+def checkShards(folder):
+    """Returns errors unless the run solved shards, each in a geodatabase of
+    its own that holds only that shard's inputs and solution."""
+    errors = []
+    shard_folders = [root for root, dirs, files in os.walk(folder) \
+                     if os.path.basename(root) == "shards"]
+    if not shard_folders:
+        errors.append("The run solved no shards")
+    for shard_folder in shard_folders:
+        layers = [name[:-4] for name in os.listdir(shard_folder) if name.endswith(".lyr")]
+        for name in layers:
+            gdb = os.path.join(shard_folder, name + ".gdb")
+            if not os.path.isdir(gdb):
+                errors.append("{0} has no geodatabase of its own".format(name))
+            for suffix in ("_input_orders", "_input_depots", "_input_routes", "_Orders", "_Routes"):
+                if not arcpy.Exists(os.path.join(gdb, name + suffix)):
+                    errors.append("{0} did not write {1}{2} to its geodatabase".format(\
+                                  name, name, suffix))
+    return errors
+
+
+def checkDryRun(publish_folder, route_count):
+    """Returns errors for a dry run whose store does not hold a shapefile and
+    feature service for each route's Orders and Routes, a webmap and a PDF
+    for each route, all of them shared."""
+    errors = []
+    publisher = VRPS.LocalPublisher(publish_folder)
+    items = publisher.items()
+    publisher.close()
+    expected = {'Shapefile': 2, 'Feature Service': 2, 'Web Map': 1, 'PDF': 1}
+    for item_type in sorted(expected):
+        count = len([item for item in items if item['type'] == item_type])
+        if count != expected[item_type] * route_count:
+            errors.append("Dry run stored {0} {1} items for {2} routes".format(\
+                          count, item_type, route_count))
+    for item in items:
+        if item['type'] != "Shapefile" and not item['shared']:
+            errors.append("Dry run item {0} was not shared".format(item['title']))
+        if item['file'] != None and not os.path.exists(item['file']):
+            errors.append("Dry run item {0} has no file".format(item['title']))
+    return errors
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of the stages that are slower than the baseline by more
+    than the tolerance. A quarter second of slack is allowed so the short
+    stages do not fail on timer noise."""
+    slower = []
+    for route_count in results:
+        if route_count not in baseline:
+            continue
+        stages = results[route_count]['stages']
+        base_stages = baseline[route_count]['stages']
+        for stage in sorted(stages):
+            if stage not in base_stages:
+                continue
+            seconds = stages[stage]['seconds']
+            base_seconds = base_stages[stage]['seconds']
+            if seconds > base_seconds * tolerance + 0.25:
+                slower.append("{0} routes, {1}: {2:.2f} s (baseline {3:.2f} s)".format(\
+                              route_count, stage, seconds, base_seconds))
+    return slower
+
+
+def printResults(results):
+    """Prints the seconds of each stage with one column per route count."""
+    counts = sorted(results, key=int)
+    stages = list(STAGES)
+    for route_count in counts:
+        for stage in sorted(results[route_count]['stages']):
+            if stage not in stages:
+                stages.append(stage)
+    print "{0:24s}".format("stage") + "".join(["{0:>12s}".format(count + " routes") for count in counts])
+    for stage in stages:
+        row = "{0:24s}".format(stage)
+        for route_count in counts:
+            seconds = results[route_count]['stages'].get(stage, {}).get('seconds')
+            row += "{0:>12s}".format("" if seconds is None else "{0:.3f}".format(seconds))
+        print row
+    for name in ("wall_time", "requests_served"):
+        print "{0:24s}".format(name) + "".join(["{0:>12}".format(\
+              round(results[count][name], 3)) for count in counts])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Times the workflow end to end without ArcGIS.")
+    parser.add_argument("routes", nargs="*", type=int, default=[10, 100, 1000])
+    parser.add_argument("--stops", type=int, default=10, help="orders on each route")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to each request")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="seconds to export a page")
+    parser.add_argument("--pool-size", type=int, default=1)
+    parser.add_argument("--upload-workers", type=int, default=4)
+    parser.add_argument("--scenarios", type=int, default=0, help="scenarios in a batch run")
+    parser.add_argument("--dry-run", action="store_true", help="publish to a local folder")
+    parser.add_argument("--shard-by", choices=["DEPOT", "CLUSTER"], help="solve the VRP in shards")
+    parser.add_argument("--shard-count", type=int, default=4, help="clusters to shard into")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for route_count in args.routes:
+        report = runWorkflow(route_count, args.stops, args.latency, \
+                 pool_size=args.pool_size, upload_workers=args.upload_workers, \
+                 arcpy_latencies={'export_page': args.page_latency}, \
+                 scenarios=args.scenarios, dry_run=args.dry_run, \
+                 shard_by=args.shard_by, shard_count=args.shard_count)
+        results[str(route_count)] = report
+        print "{0} routes x {1} stops: {2:.2f} s, {3} errors".format(\
+              route_count, args.stops, report['wall_time'], len(report['errors']))
+    printResults(results)
+
+    if args.save:
+        out = open(args.save, "w")
+        json.dump(results, out, indent=2, sort_keys=True)
+        out.close()
+    failed = [error for route_count in results for error in results[route_count]['errors']]
+    for error in failed[:10]:
+        print "Error: " + error
+    if args.baseline:
+        read = open(args.baseline)
+        slower = compare(results, json.load(read), args.tolerance)
+        read.close()
+        for line in slower:
+            print "Slower than baseline: " + line
+        failed += slower
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
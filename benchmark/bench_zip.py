@@ -0,0 +1,63 @@
+'''
+Title: Shapefile packaging benchmark
+Created: 10/17/2026
+
+Description: Compares the original packaging of route shapefiles (zip written
+to disk and read back for the upload) with zipping in memory, one route at a
+time and on several threads, using synthetic shapefile parts.
+'''
+import os, sys, tempfile, time, shutil, random, zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_arcpy
+fake_arcpy.install(0, 0, [])
+import VRPS
+import synthetic
+
+
+def writeShapefiles(folder, names, size, seed=0):
+    """Writes fake .shp, .shx, .dbf and .prj parts for each name. The bytes
+    repeat enough to compress like real attribute data."""
+    rand = random.Random(seed)
+    words = ["Inspector", "Order", "Street", "Main", "North", "Route"]
+    for name in names:
+        for extension, part_size in ((".shp", size), (".shx", size // 10),
+                                     (".dbf", size), (".prj", 400)):
+            text = " ".join([rand.choice(words) + str(rand.randint(0, 99))
+                             for i in range(part_size // 8)])
+            out = open(os.path.join(folder, name + extension), "wb")
+            out.write(text[:part_size])
+            out.close()
+
+
+def onDisk(folder, names):
+    """Zips each shapefile to disk and reads it back as the upload did."""
+    for name in names:
+        zip_file = VRPS.zipShapefile(folder, name)
+        read = open(zip_file, "rb")
+        read.read()
+        read.close()
+        os.remove(zip_file)
+
+
+def main(route_count=60, size=200000, workers=8):
+    """Times each packaging path."""
+    folder = tempfile.mkdtemp()
+    names = ["{0}_Orders_date".format(name) for name in synthetic.routeNames(route_count)]
+    writeShapefiles(folder, names, size)
+    print "{0} shapefiles of about {1} KB".format(route_count, size * 2 // 1024)
+    timings = [("On disk, deflated", lambda: onDisk(folder, names)),
+               ("Memory, deflated, 1 thread", lambda: VRPS.packShapefiles(folder, names, workers=1)),
+               ("Memory, deflated, {0} threads".format(workers), lambda: VRPS.packShapefiles(folder, names, workers=workers)),
+               ("Memory, stored, {0} threads".format(workers), lambda: VRPS.packShapefiles(folder, names, zipfile.ZIP_STORED, workers))]
+    for label, run in timings:
+        start = time.time()
+        run()
+        print "{0:30s} {1:.2f} s".format(label, time.time() - start)
+    archive = VRPS.packShapefile(folder, names[0])
+    assert sorted(zipfile.ZipFile(archive).namelist()) == sorted(VRPS.shapefileParts(folder, names[0]))
+    shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+'''
+Title: Fake ArcGIS Online server
+Created: 10/17/2026
+
+Description: A local HTTP server that imitates the sharing/rest endpoints the
+solution calls (generateToken, addItem, publish, share, shareItems, update,
+delete, the user's content listing and an item's related items) so the
+upload code can be timed and exercised without an ArcGIS Online organization.
+Every response can be delayed to imitate network latency, publish jobs can
+be made to take a while to finish and the parts of multipart uploads listed
+in fail_parts fail once. A shareItems request that includes an item listed
+in fail_shares is answered with an error, and the items of every
+shareItems request are kept in share_requests. With a token_lifetime each generated token expires
+after that many seconds and requests with an expired or unknown token get
+error 498, as ArcGIS Online answers them.
+
+Failures can be injected at random with the rates in failures: throttle
+answers 429 with a Retry-After header, error answers 502 without carrying
+out the request and drop carries out the request but answers 500, as when
+a response is lost. With a max_rate the server throttles requests beyond
+that many per second.
+'''
+import json, threading, time, socket, random, re, urlparse, BaseHTTPServer, SocketServer
+
+
+class FakeAGOLHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers sharing/rest requests with canned JSON responses."""
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        # headers are written one at a time, do not let Nagle hold them back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        length = int(self.headers.getheader("Content-Length") or 0)
+        body = self.rfile.read(length)
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query, True))
+        if body and "multipart/form-data" not in (self.headers.getheader("Content-Type") or ""):
+            params.update(urlparse.parse_qsl(body, True))
+        self.server.count("requests")
+        time.sleep(self.server.latency)
+        failure = self.server.injectFailure(url.path)
+        if failure in ("throttle", "error"):
+            status, response = self.server.failureResponse(failure)
+        else:
+            status, response = self.server.respond(url.path, params, body)
+            if failure == "drop":
+                status, response = self.server.failureResponse(failure)
+        text = json.dumps(response)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(text)))
+        if status == 429:
+            self.send_header("Retry-After", str(self.server.retry_after))
+        self.end_headers()
+        self.wfile.write(text)
+
+
+class FakeAGOL(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threaded fake sharing/rest server. Start it with start() and point an
+    AGOLSession at base_url."""
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, port=0, publish_delay=0.0, token_lifetime=None, \
+                 failures=None, max_rate=None, retry_after=1, seed=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", port), FakeAGOLHandler)
+        self.latency = latency
+        self.publish_delay = publish_delay
+        self.token_lifetime = token_lifetime
+        self.tokens = {}
+        self.failures = failures or {}
+        self.max_rate = max_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._recent = []
+        self.jobs = {}
+        self.fail_parts = set()
+        self.fail_shares = set()
+        self.share_requests = []
+        self.base_url = "http://127.0.0.1:{0}/sharing/rest".format(self.server_address[1])
+        self.counts = {}
+        self.items = {}
+        self._item_count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Serves requests on a background thread and returns the server."""
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving requests."""
+        self.shutdown()
+        self.server_close()
+
+    def count(self, name, amount=1):
+        """Adds to one of the request counters."""
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def newItem(self, params, source=None):
+        """Stores a new item and returns its id. source is the id of the item
+        a service was published from."""
+        with self._lock:
+            self._item_count += 1
+            itemid = "item{0:06d}".format(self._item_count)
+            self.items[itemid] = {'title': params.get('title'),
+                                  'type': params.get('type'), 'shared': False,
+                                  'tags': [tag for tag in params.get('tags', "").split(",") if tag],
+                                  'created': int(time.time() * 1000), 'source': source}
+        return itemid
+
+    def injectFailure(self, path):
+        """Returns the failure to answer a request with, or None. Tokens are
+        never failed."""
+        if path.endswith("generateToken"):
+            return None
+        with self._lock:
+            if self.max_rate:
+                now = time.time()
+                self._recent = [sent for sent in self._recent if sent > now - 1.0]
+                if len(self._recent) >= self.max_rate:
+                    self.counts["over rate"] = self.counts.get("over rate", 0) + 1
+                    return "throttle"
+                self._recent.append(now)
+            for failure in ("throttle", "error", "drop"):
+                if self._random.random() < self.failures.get(failure, 0.0):
+                    self.counts["injected " + failure] = self.counts.get("injected " + failure, 0) + 1
+                    return failure
+
+    def failureResponse(self, failure):
+        """Returns the HTTP status and JSON response of an injected failure."""
+        if failure == "throttle":
+            return 429, {'error': {'code': 429, 'message': "Too many requests.", 'details': []}}
+        if failure == "error":
+            return 502, {'error': {'code': 502, 'message': "Bad gateway.", 'details': []}}
+        return 500, {'error': {'code': 500, 'message': "Response lost.", 'details': []}}
+
+    def titles(self):
+        """Returns {(title, type): number of items} to check for duplicates."""
+        with self._lock:
+            titles = {}
+            for item in self.items.values():
+                key = (item['title'], item['type'])
+                titles[key] = titles.get(key, 0) + 1
+        return titles
+
+    def newToken(self):
+        """Returns a new token and its expiry time in milliseconds."""
+        if self.token_lifetime is None:
+            return "faketoken", int((time.time() + 7200) * 1000)
+        with self._lock:
+            token = "token{0:06d}".format(len(self.tokens) + 1)
+            self.tokens[token] = time.time() + self.token_lifetime
+        return token, int(self.tokens[token] * 1000)
+
+    def expireTokens(self):
+        """Makes every token issued so far expire now."""
+        with self._lock:
+            for token in self.tokens:
+                self.tokens[token] = 0
+
+    def respond(self, path, params, body):
+        """Returns the HTTP status and JSON response for a request."""
+        parts = path.rstrip("/").split("/")
+        endpoint = parts[-1]
+        self.count(endpoint)
+        if endpoint == "generateToken":
+            token, expires = self.newToken()
+            return 200, {'token': token, 'ssl': False, 'expires': expires}
+        if self.token_lifetime is not None and 'token' in params and \
+           self.tokens.get(params['token'], 0) < time.time():
+            self.count("rejected tokens")
+            return 200, {'error': {'code': 498, 'message': "Invalid token.", 'details': []}}
+        if endpoint == "addItem":
+            itemid = self.newItem(params)
+            if params.get('multipart') == "true":
+                self.items[itemid]['parts'] = {}
+            else:
+                self.items[itemid]['size'] = len(body)
+            return 200, {'success': True, 'id': itemid}
+        if endpoint == "addPart":
+            item = self.items.get(parts[-2])
+            part_num = int(params.get('partNum', 0))
+            with self._lock:
+                failed = part_num in self.fail_parts
+                self.fail_parts.discard(part_num)
+            if failed:
+                return 500, {'error': {'code': 500, 'message': "Part failed", 'details': []}}
+            if item is None or 'parts' not in item:
+                return 200, {'error': {'code': 400, 'message': "Not a multipart item", 'details': []}}
+            item['parts'][part_num] = len(body)
+            return 200, {'success': True, 'id': parts[-2]}
+        if endpoint == "commit":
+            item = self.items.get(parts[-2])
+            numbers = sorted(item.get('parts', {}))
+            if not numbers or numbers != range(1, len(numbers) + 1):
+                return 200, {'error': {'code': 400, 'message': "Missing parts", 'details': []}}
+            item['committed'] = True
+            return 200, {'success': True, 'id': parts[-2]}
+        if endpoint == "publish":
+            name = json.loads(params.get('publishParameters', '{}')).get('name')
+            itemid = self.newItem({'title': name, 'type': "Feature Service"}, params.get('itemID'))
+            service_url = "{0}/services/{1}/FeatureServer".format(self.base_url, name)
+            self.items[itemid]['url'] = service_url
+            jobid = "job" + itemid
+            with self._lock:
+                self.jobs[jobid] = time.time() + self.publish_delay
+            return 200, {'services': [{'serviceurl': service_url,
+                                       'serviceItemId': itemid, 'jobId': jobid}]}
+        if endpoint == "status" and 'jobId' not in params:
+            return 200, {'status': "completed", 'itemId': parts[-2]}
+        if endpoint == "status":
+            finished = self.jobs.get(params.get('jobId'))
+            if finished is None:
+                return 200, {'error': {'code': 400, 'message': "Job not found", 'details': []}}
+            if time.time() < finished:
+                return 200, {'status': "processing", 'itemId': parts[-2]}
+            return 200, {'status': "completed", 'itemId': parts[-2]}
+        if endpoint == "search":
+            query = dict(re.findall(r'(\w+):"([^"]*)"', params.get('q', "")))
+            with self._lock:
+                results = [{'id': itemid, 'title': item['title'], 'type': item['type'],
+                            'url': item.get('url')} for itemid, item in sorted(self.items.items())
+                           if item['title'] == query.get('title') and
+                           item['type'] == query.get('type', item['type'])]
+            return 200, {'total': len(results), 'results': results}
+        if len(parts) > 1 and parts[-2] == "users":
+            # the user's content, a page at a time
+            start = int(params.get('start', 1))
+            num = int(params.get('num', 10))
+            with self._lock:
+                items = [dict(item, id=itemid) for itemid, item in sorted(self.items.items())]
+            page = items[start - 1:start - 1 + num]
+            next_start = start + num if start - 1 + num < len(items) else -1
+            return 200, {'total': len(items), 'start': start, 'num': num,
+                         'nextStart': next_start, 'items': page}
+        if endpoint == "relatedItems":
+            with self._lock:
+                related = [dict(item, id=itemid) for itemid, item in sorted(self.items.items())
+                           if item['source'] == parts[-2]]
+            return 200, {'total': len(related), 'relatedItems': related}
+        if endpoint == "update":
+            with self._lock:
+                item = self.items.get(parts[-2])
+                if item is not None and 'tags' in params:
+                    item['tags'] = [tag for tag in params['tags'].split(",") if tag]
+            if item is None:
+                return 200, {'error': {'code': 400, 'message': "Item does not exist", 'details': []}}
+            return 200, {'success': True, 'id': parts[-2]}
+        if endpoint == "delete":
+            with self._lock:
+                deleted = self.items.pop(parts[-2], None) is not None
+            if not deleted:
+                return 200, {'error': {'code': 400, 'message': "Item does not exist", 'details': []}}
+            return 200, {'success': True, 'itemId': parts[-2]}
+        if endpoint == "share":
+            itemid = parts[-2]
+            self.items.get(itemid, {})['shared'] = True
+            return 200, {'notSharedWith': [], 'itemId': itemid}
+        if endpoint == "shareItems":
+            items = [itemid for itemid in params.get('items', "").split(",") if itemid]
+            with self._lock:
+                self.share_requests.append(items)
+            if self.fail_shares.intersection(items):
+                return 200, {'error': {'code': 500, 'message': "Unable to share items", 'details': []}}
+            results = []
+            for itemid in items:
+                if itemid in self.items:
+                    self.items[itemid]['shared'] = True
+                    results.append({'itemId': itemid, 'success': True})
+                else:
+                    results.append({'itemId': itemid, 'success': False,
+                                    'error': {'code': 400, 'message': "Item does not exist"}})
+            return 200, {'results': results}
+        return 404, {'error': {'code': 404, 'message': "Unknown endpoint", 'details': []}}
@@ -0,0 +1,593 @@
+'''
+Title: Fake arcpy module
+Created: 10/17/2026
+
+Description: A stand-in for the parts of arcpy the solution calls, so the
+whole workflow can run without ArcGIS Desktop. The VRP solve returns a
+synthetic set of routes and orders, the Directions tool writes a synthetic
+directions file, shapefiles and PDFs are written as small placeholder files
+and each call can be given a latency to imitate the time the real tool
+takes. The tools a sharded solve uses select, copy and merge rows in
+memory, and each VRP layer solves only the routes added to it. install() puts the module in sys.modules as arcpy, so it must be
+called before VRPS is imported.
+'''
+import os, re, sys, time, random, shutil, cPickle
+import synthetic
+
+
+# Seconds each kind of call sleeps for. Per row and per page latencies are
+# added for every row read or written and every page exported.
+LATENCIES = {'solve': 0.0, 'add_locations': 0.0, 'directions': 0.0,
+             'save_copy': 0.0, 'export_page': 0.0, 'append_page': 0.0,
+             'cursor_row': 0.0, 'create_featureclass': 0.0, 'insert_row': 0.0,
+             'list_elements': 0.0, 'set_element': 0.0, 'select': 0.0,
+             'copy_features': 0.0, 'open_cursor': 0.0}
+
+_state = {'parameters': [], 'layers': {}, 'tables': {}, 'featureclasses': {},
+          'messages': [], 'verbose': False, 'route_count': 0, 'stop_count': 0,
+          'seed': 0, 'calls': {}, 'solution': {}, 'solves': {}, 'workspaces': set()}
+
+
+def _wait(kind, count=1):
+    """Private function that counts a kind of call and sleeps for its
+    latency."""
+    _state['calls'][kind] = _state['calls'].get(kind, 0) + 1
+    if LATENCIES.get(kind):
+        time.sleep(LATENCIES[kind] * count)
+
+
+def install(route_count, stop_count, parameters, latencies=None, seed=0, verbose=False):
+    """Makes this module the arcpy module with a synthetic solution of
+    route_count routes with stop_count orders each. parameters is the list
+    of tool parameters returned by GetParameterAsText; the orders and depots
+    parameters read the solution's orders and its two depots. Returns the
+    module."""
+    LATENCIES.update(latencies or {})
+    _state['parameters'] = list(parameters)
+    _state['verbose'] = verbose
+    _state['route_count'] = route_count
+    _state['stop_count'] = stop_count
+    _state['seed'] = seed
+    _state['messages'] = []
+    _state['calls'] = {}
+    names = synthetic.routeNames(route_count)
+    rand = random.Random(seed)
+    orders = []
+    routes = []
+    for name in names:
+        x = 2000000.0 + rand.uniform(0, 50000)
+        y = 700000.0 + rand.uniform(0, 50000)
+        points = []
+        for stop in range(1, stop_count + 1):
+            x += rand.uniform(-2000, 2000)
+            y += rand.uniform(-2000, 2000)
+            points.append((x, y))
+            orders.append({'OBJECTID': len(orders) + 1, 'Name': "Order {0}-{1}".format(name, stop),
+                           'RouteName': name, 'Sequence': stop + 1, 'SHAPE': ((x, y),)})
+        routes.append({'OBJECTID': len(routes) + 1, 'Name': name,
+                       'TotalTime': stop_count * 45.0, 'SHAPE': tuple(points)})
+    depots = [{'OBJECTID': 1, 'Name': "Assessors Office", 'SHAPE': ((2025000.0, 725000.0),)},
+              {'OBJECTID': 2, 'Name': "Annex", 'SHAPE': ((2035000.0, 735000.0),)}]
+    _state['layers'] = {
+        'Orders': Layer("Orders", "Point", [Field("Name", "String"), \
+                  Field("RouteName", "String"), Field("Sequence", "Integer")], orders),
+        'Depots': Layer("Depots", "Point", [Field("Name", "String")], depots),
+        'Routes': Layer("Routes", "Polyline", [Field("Name", "String"), \
+                  Field("TotalTime", "Double")], routes)}
+    _state['solution'] = dict(_state['layers'])
+    _state['solves'] = {}
+    _state['workspaces'] = set()
+    _state['tables'] = {}
+    if len(parameters) > 4:
+        _state['tables'][parameters[3]] = _state['layers']['Orders']
+        _state['tables'][parameters[4]] = _state['layers']['Depots']
+    _state['featureclasses'] = {}
+    sys.modules['arcpy'] = sys.modules[__name__]
+    return sys.modules[__name__]
+
+
+def addTable(path, fields, rows):
+    """Registers a table, such as the routes table, that search cursors can
+    read by path. rows are dictionaries of field values."""
+    _state['tables'][path] = Layer(os.path.basename(path), None, \
+                              [Field(name, "String") for name in fields], rows)
+
+
+def calls():
+    """Returns a dictionary of the number of calls of each kind made since
+    install, including the calls with no latency set."""
+    return dict(_state['calls'])
+
+
+def messages():
+    """Returns the geoprocessing messages written so far as (kind, text)."""
+    return list(_state['messages'])
+
+
+class Field:
+    """A field of a layer or feature class."""
+    def __init__(self, name, type):
+        self.name = name
+        self.type = type
+
+
+class Layer:
+    """A layer or table of rows held in memory. Cursors and tools read only
+    the selected rows while the layer has a selection."""
+    def __init__(self, name, shape_type, fields, rows):
+        self.name = name
+        self.selection = None
+        self.shapeType = shape_type
+        self.spatialReference = None
+        self.OIDFieldName = "OBJECTID"
+        self.fields = [Field("OBJECTID", "OID"), Field("Shape", "Geometry")] + fields
+        self.rows = rows
+
+
+class ExecuteError(Exception):
+    pass
+
+
+class Extent:
+    def __init__(self, XMin=None, YMin=None, XMax=None, YMax=None):
+        self.XMin = XMin
+        self.YMin = YMin
+        self.XMax = XMax
+        self.YMax = YMax
+
+
+class _Env:
+    overwriteOutput = False
+    workspace = None
+
+env = _Env()
+
+
+# messages and parameters
+def _message(kind, text):
+    _state['messages'].append((kind, text))
+    if _state['verbose']:
+        print text
+
+def AddMessage(text):
+    _message("AddMessage", text)
+
+def AddWarning(text):
+    _message("AddWarning", text)
+
+def AddError(text):
+    _message("AddError", text)
+
+def GetMessages(severity=0):
+    return ""
+
+def GetParameterAsText(index):
+    if index < len(_state['parameters']):
+        return _state['parameters'][index]
+    return ""
+
+def CheckOutExtension(name):
+    return "CheckedOut"
+
+def CheckInExtension(name):
+    return "CheckedIn"
+
+
+# data access
+def _value(row, field):
+    """Private function that returns the value of a field, including the
+    OID@ and SHAPE@ tokens."""
+    if field == "OID@":
+        return row.get('OBJECTID')
+    if field == "SHAPE@XY":
+        return row['SHAPE'][0]
+    if field == "SHAPE@":
+        return row['SHAPE']
+    return row.get(field)
+
+
+def _dataset(dataset):
+    """Private function that looks up a layer, table or feature class."""
+    if isinstance(dataset, Layer):
+        return dataset
+    if dataset in _state['tables']:
+        return _state['tables'][dataset]
+    if dataset not in _state['featureclasses'] and os.path.isfile(dataset):
+        # written by a tool in another process
+        read = open(dataset, "rb")
+        _state['featureclasses'][dataset] = cPickle.load(read)
+        read.close()
+    return _state['featureclasses'][dataset]
+
+
+def Describe(dataset):
+    return _dataset(dataset)
+
+
+def ListFields(dataset):
+    return list(_dataset(dataset).fields)
+
+
+def Exists(dataset):
+    return dataset in _state['workspaces'] or dataset in _state['tables'] or \
+           dataset in _state['featureclasses'] or (dataset is not None and os.path.exists(dataset))
+
+
+def AddFieldDelimiters(dataset, field):
+    return field
+
+
+def CreateFileGDB_management(folder, name):
+    path = os.path.join(folder, name)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    _state['workspaces'].add(path)
+
+
+def _where(where):
+    """Private function that returns a test of a row for the where clauses
+    Shards.whereIn writes and field = value clauses."""
+    if where == "1 = 0":
+        return lambda row: False
+    match = re.match(r"^(\w+) IN \((.*)\)$", where) or re.match(r"^(\w+) = (.*)$", where)
+    values = set()
+    for text, number in re.findall(r"'((?:[^']|'')*)'|([^,\s]+)", match.group(2)):
+        values.add(text.replace("''", "'") if number == "" else int(number))
+    return lambda row: row.get(match.group(1)) in values
+
+
+def _copy(dataset, out_path, rows):
+    """Private function that stores rows as a new feature class or table with
+    the fields of the dataset. It is written to its path too, so worker
+    processes can read what the others wrote."""
+    source = _dataset(dataset)
+    copy = Layer(os.path.basename(out_path), source.shapeType, [], [dict(row) for row in rows])
+    copy.fields = list(source.fields)
+    _state['featureclasses'][out_path] = copy
+    out = open(out_path, "wb")
+    cPickle.dump(copy, out, 2)
+    out.close()
+
+
+def Select_analysis(in_features, out_features, where=None):
+    rows = _rows(in_features)
+    if where:
+        rows = filter(_where(where), rows)
+    _copy(in_features, out_features, rows)
+
+
+def TableSelect_analysis(in_table, out_table, where=None):
+    Select_analysis(in_table, out_table, where)
+
+
+def CopyFeatures_management(in_features, out_features):
+    """Copies the selected features. A shapefile output is written like
+    CreateFeatureclass and an insert cursor write it, with the field names
+    cut the same way."""
+    _wait('copy_features')
+    source = _dataset(in_features)
+    if not out_features.lower().endswith(".shp"):
+        _copy(in_features, out_features, _rows(in_features))
+        return
+    path = os.path.join(env.workspace or "", out_features)
+    _createShapefile(path, source.shapeType, source)
+    fields = [field.name for field in source.fields if field.type not in ("OID", "Geometry")]
+    _writeShapefileRows(path, [tuple([row.get(field) for field in fields]) + (row['SHAPE'],) \
+                               for row in _rows(in_features)])
+
+
+def Merge_management(inputs, output):
+    """Appends the rows of the inputs, renumbering their object ids."""
+    rows = []
+    for dataset in inputs:
+        for row in _rows(dataset):
+            row = dict(row)
+            row['OBJECTID'] = len(rows) + 1
+            rows.append(row)
+    _copy(inputs[0], output, rows)
+
+
+def SelectLayerByAttribute_management(layer, selection_type, where=None):
+    """Selects the rows of the layer that match the where clause, reading
+    every row like the real tool, or clears the selection."""
+    _wait('select')
+    if selection_type == "CLEAR_SELECTION":
+        layer.selection = None
+    else:
+        layer.selection = filter(_where(where), layer.rows)
+
+
+def _rows(dataset):
+    """Private function that returns the selected rows of a layer, or all
+    rows of a dataset without a selection."""
+    dataset = _dataset(dataset)
+    if dataset.selection is not None:
+        return dataset.selection
+    return dataset.rows
+
+
+def SaveToLayerFile_management(layer, path, path_type=None):
+    out = open(path, "w")
+    out.write("layer {0}\n".format(layer))
+    out.close()
+
+
+def CreateFeatureclass_management(folder, name, shape_type, template=None, \
+                                  has_m=None, has_z=None, spatial_reference=None):
+    """Creates an empty shapefile with the template's fields."""
+    _wait('create_featureclass')
+    _createShapefile(os.path.join(folder, name), shape_type, template)
+
+
+def _shapefileName(name, names):
+    """Private function that cuts a field name to the 10 characters of a
+    shapefile field, numbering names that are already taken like ArcGIS:
+    TimeWindowStart1 and TimeWindowEnd1 become TimeWindow and TimeWind_1."""
+    name = name[:10]
+    number = 0
+    while name.upper() in names:
+        number += 1
+        name = "{0}_{1}".format(name[:10 - len(str(number)) - 1], number)
+    names.add(name.upper())
+    return name
+
+
+def _createShapefile(path, shape_type, template=None):
+    """Private function that writes the placeholder files of an empty
+    shapefile and registers its fields."""
+    base = os.path.splitext(path)[0]
+    fields = [Field("FID", "OID"), Field("Shape", "Geometry")]
+    if template is not None:
+        names = set(["FID", "SHAPE"])
+        fields += [Field(_shapefileName(field.name, names), field.type) \
+                   for field in template.fields if field.type not in ("OID", "Geometry")]
+    _state['featureclasses'][path] = Layer(os.path.basename(base), shape_type, [], [])
+    _state['featureclasses'][path].fields = fields
+    for extension in (".shp", ".shx", ".dbf", ".prj"):
+        out = open(base + extension, "wb")
+        out.write("{0} {1}\n".format(extension, shape_type.upper()))
+        out.close()
+
+
+def _writeShapefileRows(path, rows):
+    """Private function that appends rows of field values followed by the
+    shape to a shapefile's .dbf and .shp files."""
+    base = os.path.splitext(path)[0]
+    shp = open(base + ".shp", "ab")
+    dbf = open(base + ".dbf", "ab")
+    for row in rows:
+        shp.write(repr(row[-1]) + "\n")
+        dbf.write(repr(row[:-1]) + "\n")
+    shp.close()
+    dbf.close()
+
+
+class _SearchCursor:
+    def __init__(self, dataset, fields):
+        _wait('open_cursor')
+        self.rows = _rows(dataset)
+        self.fields = fields
+
+    def __iter__(self):
+        for row in self.rows:
+            _wait('cursor_row')
+            yield tuple([_value(row, field) for field in self.fields])
+
+
+class _InsertCursor:
+    """Buffers the inserted rows and writes them to the shapefile's .shp and
+    .dbf files when deleted, like the real cursor releases its lock."""
+    def __init__(self, path, fields):
+        _wait('open_cursor')
+        self.path = path
+        self.fields = fields
+        self.rows = []
+
+    def insertRow(self, row):
+        _wait('insert_row')
+        self.rows.append(row)
+
+    def __del__(self):
+        _writeShapefileRows(self.path, self.rows)
+
+
+class _DataAccess:
+    SearchCursor = _SearchCursor
+    InsertCursor = _InsertCursor
+
+da = _DataAccess()
+
+
+# mapping
+class _DataFrame:
+    def __init__(self):
+        self.extent = Extent(0, 0, 1, 1)
+        self.scale = 10000
+
+
+class _TextElement(object):
+    def __init__(self, name):
+        self.name = name
+        self._text = ""
+        self.elementWidth = 0
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        _wait('set_element')
+        self._text = value
+
+
+class _MapDocument:
+    def __init__(self, path):
+        self.filePath = path
+        self.df = _DataFrame()
+        self.elements = {'directions': _TextElement('directions'),
+                         'inspection': _TextElement('inspection')}
+
+    def saveACopy(self, path):
+        _wait('save_copy')
+        if os.path.exists(self.filePath):
+            shutil.copyfile(self.filePath, path)
+        else:
+            open(path, "wb").close()
+
+
+class _PDFDocument:
+    def __init__(self, path):
+        self.path = path
+        self.pages = []
+
+    def appendPages(self, path):
+        _wait('append_page')
+        read = open(path, "rb")
+        self.pages.append(read.read())
+        read.close()
+
+    def saveAndClose(self):
+        out = open(self.path, "wb")
+        out.write("%PDF-1.4\n")
+        for page in self.pages:
+            out.write(page)
+        out.write("%%EOF\n")
+        out.close()
+
+
+def _exportToPDF(mxd, path, layout="PAGE_LAYOUT"):
+    """Writes a placeholder page holding the text of the layout elements."""
+    _wait('export_page')
+    out = open(path, "wb")
+    for name in sorted(mxd.elements):
+        out.write("{0}: {1}\n".format(name, mxd.elements[name].text))
+    out.write("extent: {0} {1} {2} {3} scale: {4}\n".format(mxd.df.extent.XMin, \
+              mxd.df.extent.YMin, mxd.df.extent.XMax, mxd.df.extent.YMax, mxd.df.scale))
+    out.close()
+
+
+def _listLayoutElements(mxd, element_type="", wildcard=""):
+    _wait('list_elements')
+    if wildcard == "":
+        return mxd.elements.values()
+    if wildcard not in mxd.elements:
+        mxd.elements[wildcard] = _TextElement(wildcard)
+    return [mxd.elements[wildcard]]
+
+
+def _listLayers(mxd, wildcard="", df=None):
+    """Lists the solution's sublayers. The solved VRP layer in the map
+    document is the group layer, and a group layer lists its sublayers. A
+    VRP layer solved on its own lists the sublayers of its own solve."""
+    if isinstance(mxd, basestring) and mxd in _state['solves']:
+        return [_state['solves'][mxd]['layers'][wildcard]]
+    if wildcard == "vprLayer":
+        return [Layer("vprLayer", None, [], [])]
+    if wildcard in _state['layers']:
+        return [_state['layers'][wildcard]]
+    return _state['layers'].values()
+
+
+class _Mapping:
+    MapDocument = _MapDocument
+    PDFDocumentCreate = _PDFDocument
+    ExportToPDF = staticmethod(_exportToPDF)
+    ListLayoutElements = staticmethod(_listLayoutElements)
+    ListLayers = staticmethod(_listLayers)
+
+    @staticmethod
+    def ListDataFrames(mxd, wildcard=""):
+        return [mxd.df]
+
+    @staticmethod
+    def Layer(path):
+        """Returns a layer of a feature class or table, or the path of a
+        layer file."""
+        if path in _state['featureclasses'] or path in _state['tables']:
+            source = _dataset(path)
+            layer = Layer(source.name, source.shapeType, [], source.rows)
+            layer.fields = source.fields
+            return layer
+        return path
+
+    @staticmethod
+    def AddLayer(df, layer, position="AUTO_ARRANGE"):
+        """Adding a layer of a feature class makes it the sublayer of that
+        name, as the merged layers of a sharded solve are."""
+        if isinstance(layer, Layer):
+            _state['layers'][layer.name] = layer
+
+    @staticmethod
+    def UpdateLayer(df, layer, source, symbology_only=True):
+        pass
+
+    @staticmethod
+    def RemoveLayer(df, layer):
+        pass
+
+mapping = _Mapping()
+
+
+# network analyst
+class _Result:
+    def __init__(self, output):
+        self.output = output
+
+    def getOutput(self, index):
+        return self.output
+
+
+class _NetworkAnalyst:
+    @staticmethod
+    def MakeVehicleRoutingProblemLayer(network, name, impedance, *args, **kwargs):
+        return _Result(name)
+
+    @staticmethod
+    def GetNAClassNames(layer):
+        return {'Orders': "Orders", 'Depots': "Depots", 'Routes': "Routes"}
+
+    @staticmethod
+    def AddLocations(layer, sublayer, locations, *args, **kwargs):
+        _wait('add_locations')
+        _state['solves'].setdefault(layer, {'inputs': {}, 'layers': {}})['inputs'][sublayer] = locations
+
+    @staticmethod
+    def Solve(layer, *args, **kwargs):
+        """Solves the routes added to the layer with their orders in the
+        synthetic solution, or every route if none were added."""
+        _wait('solve')
+        solve = _state['solves'].setdefault(layer, {'inputs': {}, 'layers': {}})
+        solution = _state['solution']
+        if Exists(solve['inputs'].get('Routes')):
+            names = set([row['Name'] for row in _dataset(solve['inputs']['Routes']).rows])
+        else:
+            names = set([row['Name'] for row in solution['Routes'].rows])
+        solve['routes'] = names
+        solve['layers'] = {
+            'Orders': Layer("Orders", "Point", solution['Orders'].fields[2:], \
+                      [row for row in solution['Orders'].rows if row['RouteName'] in names]),
+            'Depots': _dataset(solve['inputs'].get('Depots', solution['Depots'])),
+            'Routes': Layer("Routes", "Polyline", solution['Routes'].fields[2:], \
+                      [row for row in solution['Routes'].rows if row['Name'] in names])}
+
+na = _NetworkAnalyst()
+
+
+def Directions_na(layer, file_format, path, units, report_time=None):
+    """Writes the synthetic directions of the solved routes."""
+    _wait('directions')
+    synthetic.writeDirections(path, _state['route_count'], _state['stop_count'], \
+                              seed=_state['seed'])
+    names = _state['solves'].get(layer, {}).get('routes')
+    if names is None or len(names) == _state['route_count']:
+        return
+    # keep only the blocks of the routes this layer solved
+    read = open(path)
+    blocks = read.read().split("Begin route ")[1:]
+    read.close()
+    out = open(path, "w")
+    for block in blocks:
+        if block.split("\n", 1)[0] in names:
+            out.write("Begin route " + block)
+    out.close()
@@ -0,0 +1,120 @@
+'''
+Title: Synthetic VRP data
+Created: 10/17/2026
+
+Description: Builds synthetic inputs that look like the outputs of the VRP
+solution so the benchmarks can run without a Network Analyst solve, and
+measures the peak memory of code run on synthetic directions files.
+'''
+import os, sys, random, subprocess, tempfile, shutil
+
+BENCHMARK = os.path.dirname(os.path.abspath(__file__))
+
+
+def routeNames(route_count):
+    """Returns a list of route names for the given number of routes."""
+    return ["Inspector{0:04d}".format(i) for i in range(1, route_count + 1)]
+
+
+def writeDirections(path, route_count, stop_count, maneuvers=3, seed=0):
+    """Writes a directions text file formatted like the TEXT output of the
+    Directions tool with REPORT_TIME. Each route has stop_count orders and
+    each leg between orders has the given number of maneuvers. Returns the
+    number of lines written."""
+    rand = random.Random(seed)
+    linecount = 0
+    out = open(path, "w")
+    for name in routeNames(route_count):
+        out.write("Begin route {0}\n".format(name))
+        out.write("    Total time: {0} min   Total distance: {1:.1f} mi\n".format(
+                  stop_count * 45, stop_count * 3.2))
+        out.write("1:  Start at Assessors Office                    8:00 AM\n")
+        linecount += 3
+        step = 2
+        minutes = 8 * 60
+        for stop in range(1, stop_count + 1):
+            for maneuver in range(maneuvers):
+                miles = rand.uniform(0.1, 4.0)
+                drive = rand.randint(1, 9)
+                minutes += drive
+                out.write("{0}:  Turn right on STREET {1}          {2:.1f} mi    {3} min\n".format(
+                          step, rand.randint(1, 999), miles, drive))
+                step += 1
+                linecount += 1
+            out.write("{0}:  Arrive at Order {1}-{2}, on the right       {3}:{4:02d} AM\n".format(
+                      step, name, stop, (minutes // 60) % 12 or 12, minutes % 60))
+            minutes += 30
+            out.write("    Service time: 30 min\n")
+            out.write("    Depart Order {0}-{1}                         {2}:{3:02d} AM\n".format(
+                      name, stop, (minutes // 60) % 12 or 12, minutes % 60))
+            step += 1
+            linecount += 3
+        out.write("{0}:  Finish at Assessors Office\n".format(step))
+        out.write("End of route {0}\n\n".format(name))
+        linecount += 3
+    out.close()
+    return linecount
+
+
+def peakMemory():
+    """Returns the peak resident memory of this process in MB. The resource
+    module is not on Windows, where the peak working set is read with
+    GetProcessMemoryInfo instead."""
+    try:
+        import resource
+    except ImportError:
+        import ctypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [('cb', ctypes.c_uint32), ('PageFaultCount', ctypes.c_uint32)] + \
+                       [(name, ctypes.c_size_t) for name in ("PeakWorkingSetSize", \
+                        "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage", \
+                        "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", \
+                        "PagefileUsage", "PeakPagefileUsage")]
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), \
+                                                 ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / 1048576.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _runPeakMemory(lines, directions, output):
+    """Private function that runs lines of Python in a new process, with the
+    solution and the fake arcpy module importable, and returns the peak
+    memory of that process in MB."""
+    code = "\n".join(["import sys", "sys.path[:0] = {0!r}".format(\
+                      [os.path.dirname(BENCHMARK), BENCHMARK]),
+                      "import fake_arcpy", "fake_arcpy.install(0, 0, [])"] + \
+                      [line.format(directions=directions, output=output) for line in lines] + \
+                      ["import synthetic", "print synthetic.peakMemory()"])
+    return float(subprocess.check_output([sys.executable, "-c", code]).strip())
+
+
+def memoryGrowth(label, lines, compare=None, sizes=(500, 2000, 8000), stop_count=40, \
+                 allowed_growth=5.0):
+    """Prints the peak memory of running lines of Python in a new process on
+    synthetic directions files with the given numbers of routes, and fails
+    if it grows by more than allowed_growth MB over the smallest file. The
+    lines are formatted with the directions file as {directions} and a
+    scratch file next to it as {output}. compare is an optional (label,
+    lines) pair whose peak is printed alongside but not checked."""
+    folder = tempfile.mkdtemp()
+    try:
+        directions = os.path.join(folder, "directions.txt")
+        output = os.path.join(folder, "output")
+        print "Routes  File MB  {0:>14s}".format(label + " MB") + \
+              ("  {0:>14s}".format(compare[0] + " MB") if compare else "")
+        peaks = []
+        for route_count in sizes:
+            writeDirections(directions, route_count, stop_count)
+            peaks.append(_runPeakMemory(lines, directions, output))
+            row = "{0:6d}  {1:7.1f}  {2:14.1f}".format(route_count, \
+                  os.path.getsize(directions) / 1048576.0, peaks[-1])
+            if compare:
+                row += "  {0:14.1f}".format(_runPeakMemory(compare[1], directions, output))
+            print row
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    assert max(peaks) - peaks[0] <= allowed_growth, \
+           "{0} grew by {1:.1f} MB".format(label, max(peaks) - peaks[0])